@@ -0,0 +1,367 @@
+import os
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+'''
+Catalog of the saved time series in a saved data directory.
+
+The catalog is an SQLite database next to the pair files. It is written
+whenever a pair file is saved and holds what process_data needs to rank and
+filter the pairs: the time range and row count, the open times as runs of
+consecutive candlesticks, the NaN count of every column and the mean and
+rolling volume. Pairs can then be selected before any price data is read.
+
+Each entry also holds a quality record of the pair: the candlesticks missing
+from the grid of the interval, duplicate open times, runs of zero volume and
+NaN values, and whether the last candlestick was still open when the file
+was saved. Runs of NaN values are kept as open time ranges, so the NaN count
+of any date range is known without reading the file.
+'''
+
+CATALOG_FILE_NAME = '.catalog.sqlite'
+
+# Rolling mean volumes are saved for these day limits of process_data
+CATALOG_DAY_LIMITS = [1, 3, 7, 14, 30]
+
+CATALOG_COLUMNS = [
+    'pair', 'file_name', 'file_size', 'file_mtime_ns', 'start_ms', 'end_ms',
+    'rows', 'interval_ms', 'time_runs', 'nan_counts', 'volume_mean',
+    'volume_rolling', 'quality'
+]
+
+# Columns saved as JSON
+CATALOG_JSON_COLUMNS = ['time_runs', 'nan_counts', 'volume_rolling', 'quality']
+
+
+def connect_catalog(dir_path):
+    """
+    Open the catalog of a saved data directory, creating it if needed.
+    """
+
+    os.makedirs(dir_path, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(dir_path, CATALOG_FILE_NAME))
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS pairs (
+            pair TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            file_mtime_ns INTEGER NOT NULL,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            interval_ms INTEGER NOT NULL,
+            time_runs TEXT NOT NULL,
+            nan_counts TEXT NOT NULL,
+            volume_mean REAL,
+            volume_rolling TEXT NOT NULL,
+            quality TEXT
+        )''')
+
+    # Catalogs written before quality records were saved get the column, and
+    # their entries are rebuilt by sync_catalog
+    table_columns = [
+        row[1] for row in connection.execute('PRAGMA table_info(pairs)')
+    ]
+
+    if 'quality' not in table_columns:
+        with connection:
+            connection.execute('ALTER TABLE pairs ADD COLUMN quality TEXT')
+
+    return connection
+
+
+def get_time_runs(open_times_ms, interval_ms):
+    """
+    Split sorted open times into runs of consecutive candlesticks, as
+    [first open time, last open time] pairs.
+    """
+
+    open_times_ms = np.asarray(open_times_ms, dtype=np.int64)
+
+    if len(open_times_ms) == 0:
+        return []
+
+    if interval_ms <= 0:
+        return [[int(open_time), int(open_time)]
+                for open_time in open_times_ms]
+
+    breaks = np.flatnonzero(np.diff(open_times_ms) != interval_ms) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks - 1, [len(open_times_ms) - 1]])
+
+    return [[int(open_times_ms[start]),
+             int(open_times_ms[end])] for start, end in zip(starts, ends)]
+
+
+def get_missing_ranges(time_runs, interval_ms):
+    """
+    Get the candlesticks missing between time runs, as [first missing open
+    time, last missing open time] pairs.
+    """
+
+    if interval_ms <= 0:
+        return []
+
+    return [[run_end + interval_ms, next_run_start - interval_ms]
+            for (_, run_end), (next_run_start,
+                               _) in zip(time_runs[:-1], time_runs[1:])
+            if next_run_start - run_end > interval_ms]
+
+
+def count_run_bars(runs, interval_ms, start_ms=None, end_ms=None):
+    """
+    Count the candlesticks of time runs between start_ms and end_ms if given.
+    """
+
+    count = 0
+
+    for run_start, run_end in runs:
+        if interval_ms <= 0:
+            count += (start_ms is None or run_start
+                      >= start_ms) and (end_ms is None or run_start <= end_ms)
+            continue
+
+        first_index = 0
+        last_index = (run_end - run_start) // interval_ms
+
+        if start_ms is not None:
+            first_index = max(first_index,
+                              -(-(start_ms - run_start) // interval_ms))
+        if end_ms is not None:
+            last_index = min(last_index, (end_ms - run_start) // interval_ms)
+
+        count += max(last_index - first_index + 1, 0)
+
+    return int(count)
+
+
+def get_quality_record(df, open_times_ms, interval_ms, time_runs, saved_ms):
+    """
+    Get the quality record of a saved time series, saved at saved_ms.
+    """
+
+    is_duplicate = np.concatenate([[False], np.diff(open_times_ms) == 0])
+    missing_ranges = get_missing_ranges(time_runs, interval_ms)
+    nan_masks = {
+        column: df[column].isna().to_numpy()
+        for column in df.columns if column != 'Open Time'
+    }
+
+    if 'Open' in df.columns and 'Close' in df.columns:
+        nan_masks['OHLC Average'] = nan_masks['Open'] | nan_masks['Close']
+
+    quality = {
+        'missing_ranges':
+        missing_ranges,
+        'missing_bars':
+        count_run_bars(missing_ranges, interval_ms),
+        'duplicate_times':
+        sorted(set(
+            int(open_time) for open_time in open_times_ms[is_duplicate])),
+        'zero_volume_runs': [],
+        'nan_runs': {
+            column: get_time_runs(open_times_ms[nan_mask], interval_ms)
+            for column, nan_mask in nan_masks.items() if nan_mask.any()
+        },
+        'unconfirmed_last':
+        len(open_times_ms) > 0
+        and int(open_times_ms[-1]) + interval_ms > saved_ms,
+    }
+
+    if 'Volume in USDT' in df.columns:
+        quality['zero_volume_runs'] = get_time_runs(
+            open_times_ms[df['Volume in USDT'].to_numpy() == 0], interval_ms)
+
+    return quality
+
+
+def get_catalog_entry(df, metadata, file_path, interval_seconds):
+    """
+    Get the catalog entry of a saved time series.
+    """
+
+    interval_ms = int(interval_seconds * 1000)
+    open_times_ms = df['Open Time'].to_numpy().astype('datetime64[ms]').astype(
+        np.int64)
+    file_stat = os.stat(file_path)
+    time_runs = get_time_runs(open_times_ms, interval_ms)
+
+    nan_counts = {
+        column: int(df[column].isna().sum())
+        for column in df.columns if column != 'Open Time'
+    }
+
+    if 'Open' in df.columns and 'Close' in df.columns:
+        nan_counts['OHLC Average'] = int((df['Open'].isna()
+                                          | df['Close'].isna()).sum())
+
+    volume_rolling = {}
+
+    if interval_seconds > 0:
+        for day_limit in CATALOG_DAY_LIMITS:
+            rolling_window_value = int(day_limit * 86400 / interval_seconds)
+
+            if rolling_window_value > 0:
+                volume_rolling[str(rolling_window_value)] = float(
+                    df['Volume in USDT'].rolling(
+                        window=rolling_window_value).mean().iloc[-1])
+
+    return {
+        'pair':
+        metadata['pair'],
+        'file_name':
+        os.path.basename(file_path),
+        'file_size':
+        file_stat.st_size,
+        'file_mtime_ns':
+        file_stat.st_mtime_ns,
+        'start_ms':
+        int(open_times_ms[0]),
+        'end_ms':
+        int(open_times_ms[-1]),
+        'rows':
+        len(df),
+        'interval_ms':
+        interval_ms,
+        'time_runs':
+        time_runs,
+        'nan_counts':
+        nan_counts,
+        'volume_mean':
+        float(df['Volume in USDT'].mean()),
+        'volume_rolling':
+        volume_rolling,
+        'quality':
+        get_quality_record(df, open_times_ms, interval_ms, time_runs,
+                           file_stat.st_mtime_ns // 10**6),
+    }
+
+
+def write_catalog_entries(dir_path, entries):
+    """
+    Add or replace the catalog entries of pairs.
+    """
+
+    connection = connect_catalog(dir_path)
+
+    try:
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO pairs ({}) VALUES ({})'.format(
+                    ', '.join(CATALOG_COLUMNS),
+                    ', '.join('?' for _ in CATALOG_COLUMNS)), [[
+                        json.dumps(entry[column])
+                        if column in CATALOG_JSON_COLUMNS else entry[column]
+                        for column in CATALOG_COLUMNS
+                    ] for entry in entries])
+    finally:
+        connection.close()
+
+
+def load_catalog(dir_path):
+    """
+    Get the catalog entries of a saved data directory by file name. Entries
+    whose file was changed or removed since they were written are left out.
+    """
+
+    if not os.path.exists(os.path.join(dir_path, CATALOG_FILE_NAME)):
+        return {}
+
+    connection = connect_catalog(dir_path)
+
+    try:
+        rows = connection.execute('SELECT {} FROM pairs'.format(
+            ', '.join(CATALOG_COLUMNS))).fetchall()
+    finally:
+        connection.close()
+
+    catalog = {}
+
+    for row in rows:
+        entry = dict(zip(CATALOG_COLUMNS, row))
+
+        if entry['quality'] is None:
+            continue
+
+        for column in CATALOG_JSON_COLUMNS:
+            entry[column] = json.loads(entry[column])
+
+        try:
+            file_stat = os.stat(os.path.join(dir_path, entry['file_name']))
+        except OSError:
+            continue
+
+        if (file_stat.st_size != entry['file_size']
+                or file_stat.st_mtime_ns != entry['file_mtime_ns']):
+            continue
+
+        catalog[entry['file_name']] = entry
+
+    return catalog
+
+
+def get_union_index_ranges(entries, start_ms=None, end_ms=None):
+    """
+    Merge the time runs of several pairs into sorted, disjoint index ranges
+    per phase, as {(interval ms, phase): [[first index, last index], ...]}
+    where the open time of index i is phase + i * interval ms. Runs are
+    clipped to the open times between start_ms and end_ms if given.
+    """
+
+    phase_ranges = {}
+
+    for entry in entries:
+        interval_ms = max(entry['interval_ms'], 1)
+
+        for run_start, run_end in entry['time_runs']:
+            phase = run_start % interval_ms
+            first_index = run_start // interval_ms
+            last_index = run_end // interval_ms
+
+            if start_ms is not None:
+                first_index = max(first_index,
+                                  -(-(start_ms - phase) // interval_ms))
+            if end_ms is not None:
+                last_index = min(last_index, (end_ms - phase) // interval_ms)
+
+            if first_index <= last_index:
+                phase_ranges.setdefault((interval_ms, phase),
+                                        []).append([first_index, last_index])
+
+    for key, ranges in phase_ranges.items():
+        ranges.sort()
+        merged_ranges = [ranges[0]]
+
+        for first_index, last_index in ranges[1:]:
+            if first_index <= merged_ranges[-1][1] + 1:
+                merged_ranges[-1][1] = max(merged_ranges[-1][1], last_index)
+            else:
+                merged_ranges.append([first_index, last_index])
+
+        phase_ranges[key] = merged_ranges
+
+    return phase_ranges
+
+
+def get_union_open_times(entries, start_ms=None, end_ms=None):
+    """
+    Get the sorted union of the open times of several pairs between start_ms
+    and end_ms if given, as a datetime index named 'Open Time'.
+    """
+
+    open_times_ms = [
+        phase +
+        np.arange(first_index, last_index + 1, dtype=np.int64) * interval_ms
+        for (interval_ms, phase), ranges in get_union_index_ranges(
+            entries, start_ms, end_ms).items()
+        for first_index, last_index in ranges
+    ]
+
+    if open_times_ms:
+        open_times_ms = np.unique(np.concatenate(open_times_ms))
+    else:
+        open_times_ms = np.empty(0, dtype=np.int64)
+
+    return pd.Index(pd.to_datetime(open_times_ms, unit='ms'), name='Open Time')
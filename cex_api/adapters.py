@@ -0,0 +1,241 @@
+from cex_api.query_binance_data import *
+from cex_api.query_okx_data import *
+from cex_api.query_bybit_data import *
+import cex_api.query_binance_data as query_binance_data
+import cex_api.query_okx_data as query_okx_data
+import cex_api.query_bybit_data as query_bybit_data
+'''
+CEX adapters for the download pipeline.
+
+Each adapter exposes the same interface for its CEX: listing the perpetual
+futures pairs, fetching one page of candlestick data, the interval table,
+the rate limit and the page size. Adapters are registered by name, so a new
+CEX only needs an adapter and a register_adapter call to be downloadable.
+'''
+
+# Interval names accepted for every CEX. They are resolved to the CEX's own
+# interval of the same length, e.g. '1h' is '1H' on OKX and '60' on Bybit.
+CANONICAL_INTERVAL_SECONDS = BINANCE_INTERVAL_SECONDS
+
+adapters = {}
+
+
+class ExchangeAdapter:
+    '''
+    Interface of a CEX for the download pipeline.
+
+    Attributes:
+        name: str
+            CEX name, used in the saved data path.
+        intervals: dict
+            Available intervals and their length in seconds.
+        max_request_limit: int
+            Max. no. of candlesticks returned by a single request.
+        page_limit: int
+            No. of candlesticks per page when a range is downloaded in pages.
+        rate_limit: tuple
+            Request weight allowed per period, as (max weight, period in seconds).
+    '''
+
+    name = None
+    intervals = {}
+    max_request_limit = None
+    page_limit = None
+    rate_limit = None
+
+    def get_pairs(self):
+        '''
+        Get all perpetual futures pairs.
+        '''
+
+        raise NotImplementedError
+
+    def get_candlestick_page(self,
+                             symbol,
+                             interval,
+                             end_time,
+                             limit,
+                             paginated=False,
+                             columnar=False):
+        '''
+        Get one page of candlestick data ending at end_time. paginated is set
+        when the page is part of a range downloaded in pages.
+        '''
+
+        raise NotImplementedError
+
+    def get_request_weight(self, limit, paginated=False):
+        '''
+        Get the weight of one candlestick data request.
+        '''
+
+        return 1
+
+    def set_base_url(self, base_url):
+        '''
+        Send all requests of the CEX to another server, e.g. the offline
+        replay server.
+        '''
+
+        raise NotImplementedError
+
+    def get_interval_seconds(self, interval):
+        '''
+        Get the length of an interval in seconds, or 0 if it is invalid.
+        '''
+
+        return self.intervals.get(interval, 0)
+
+    def get_interval_utc_offset(self, interval):
+        '''
+        Get the UTC offset in seconds of the time zone whose midnight the
+        candlesticks of an interval are aligned to.
+        '''
+
+        return 0
+
+    def resolve_interval(self, interval):
+        '''
+        Get the CEX's own name of an interval given either in the CEX's or in
+        the canonical naming. Returns None if the CEX has no such interval.
+        '''
+
+        if interval in self.intervals:
+            return interval
+
+        interval_seconds = CANONICAL_INTERVAL_SECONDS.get(interval)
+
+        for cex_interval, cex_interval_seconds in self.intervals.items():
+            if cex_interval_seconds == interval_seconds:
+                return cex_interval
+
+        return None
+
+
+class BinanceAdapter(ExchangeAdapter):
+    name = 'binance'
+    intervals = BINANCE_INTERVAL_SECONDS
+    max_request_limit = 1500
+    # Pages of 1000 cost weight 5 instead of 10 for 1500, so they download
+    # more candlesticks per unit of request weight.
+    page_limit = 1000
+    rate_limit = (BINANCE_REQUEST_WEIGHT_LIMIT, BINANCE_REQUEST_WEIGHT_PERIOD)
+
+    def get_pairs(self):
+        return get_binance_perpetual_futures_pairs()
+
+    def get_candlestick_page(self,
+                             symbol,
+                             interval,
+                             end_time,
+                             limit,
+                             paginated=False,
+                             columnar=False):
+        return get_binance_perpetual_futures_candlestick_data(
+            symbol, interval, end_time, limit, columnar)
+
+    def get_request_weight(self, limit, paginated=False):
+        return get_binance_candlestick_request_weight(limit)
+
+    def set_base_url(self, base_url):
+        query_binance_data.BINANCE_BASE_URL = base_url.rstrip('/')
+
+
+class OkxAdapter(ExchangeAdapter):
+    name = 'okx'
+    intervals = OKX_INTERVAL_SECONDS
+    max_request_limit = 300
+    # Pages come from the history candlesticks endpoint, which reaches past
+    # the latest 1440 candlesticks but returns at most 100 per request.
+    page_limit = 100
+    rate_limit = (OKX_REQUEST_LIMIT, OKX_REQUEST_PERIOD)
+
+    def get_pairs(self):
+        return get_okx_perpetual_futures_pairs()
+
+    def get_candlestick_page(self,
+                             symbol,
+                             interval,
+                             end_time,
+                             limit,
+                             paginated=False,
+                             columnar=False):
+        if paginated:
+            return get_okx_perpetual_futures_history_candlestick_data(
+                symbol, interval, end_time, limit, columnar)
+
+        return get_okx_perpetual_futures_candlestick_data(
+            symbol, interval, end_time, limit, columnar)
+
+    def get_interval_utc_offset(self, interval):
+        # Candlesticks of 6 hours or longer are aligned to Hong Kong time,
+        # unless the UTC variant of the interval is requested
+        if self.get_interval_seconds(interval) >= 21600:
+            return OKX_CANDLESTICK_UTC_OFFSET
+
+        return 0
+
+    def get_request_weight(self, limit, paginated=False):
+        if paginated:
+            # The history candlesticks endpoint allows half the request rate
+            return OKX_REQUEST_LIMIT // OKX_HISTORY_REQUEST_LIMIT
+
+        return 1
+
+    def set_base_url(self, base_url):
+        query_okx_data.OKX_BASE_URL = base_url.rstrip('/')
+
+
+class BybitAdapter(ExchangeAdapter):
+    name = 'bybit'
+    intervals = BYBIT_INTERVAL_SECONDS
+    max_request_limit = 1000
+    page_limit = 1000
+    rate_limit = (BYBIT_REQUEST_LIMIT, BYBIT_REQUEST_PERIOD)
+
+    def get_pairs(self):
+        return get_bybit_perpetual_futures_pairs()
+
+    def get_candlestick_page(self,
+                             symbol,
+                             interval,
+                             end_time,
+                             limit,
+                             paginated=False,
+                             columnar=False):
+        return get_bybit_perpetual_futures_candlestick_data(
+            symbol, interval, end_time, limit, columnar)
+
+    def set_base_url(self, base_url):
+        query_bybit_data.BYBIT_BASE_URL = base_url.rstrip('/')
+
+
+def register_adapter(adapter):
+    '''
+    Make a CEX adapter available to the download pipeline under its name.
+    '''
+
+    adapters[adapter.name] = adapter
+
+    return adapter
+
+
+def get_adapter(cex):
+    '''
+    Get the registered adapter of a CEX, or None if there is none.
+    '''
+
+    return adapters.get(str(cex).lower())
+
+
+def get_available_cexes():
+    '''
+    Get the names of all registered CEXes.
+    '''
+
+    return list(adapters)
+
+
+register_adapter(BinanceAdapter())
+register_adapter(OkxAdapter())
+register_adapter(BybitAdapter())
@@ -0,0 +1,90 @@
+import numpy as np
+'''
+Columnar candlestick data.
+
+Candlestick responses are decoded straight into one typed array per column
+(int64 open time in ms, float64 prices and quote volume) instead of lists of
+strings, so they can be saved without converting every value through
+Python objects again.
+'''
+
+CANDLESTICK_COLUMNS = [
+    'Open Time', 'Open', 'High', 'Low', 'Close', 'Volume in USDT'
+]
+
+
+def empty_candlestick_columns():
+    '''
+    Get columnar candlestick data without any candlesticks.
+    '''
+
+    columns = {'Open Time': np.empty(0, dtype=np.int64)}
+
+    for column in CANDLESTICK_COLUMNS[1:]:
+        columns[column] = np.empty(0, dtype=np.float64)
+
+    return columns
+
+
+def candlesticks_to_columns(candlesticks,
+                            column_indices,
+                            confirm_index=None,
+                            reverse=False):
+    '''
+    Decode candlesticks from a CEX response into columnar candlestick data.
+
+    Request Parameters:
+        candlesticks: list
+            Candlesticks as returned by the CEX, one list of numbers or numeric strings per candlestick.
+        column_indices: list
+            Index of the open time, open, high, low, close and quote volume in each candlestick.
+        confirm_index: int
+            Index of the candlestick state. Only completed candlesticks ('1') are kept if set.
+        reverse: bool
+            Set to True if the CEX returns the candlesticks in descending order.
+
+    Response Example:
+        {
+            'Open Time': array([1719936000000, 1720022400000]),
+            'Open': array([61958.5, 60187.2]),
+            'High': array([62375. , 60664.8]),
+            'Low': array([59531.3, 56758. ]),
+            'Close': array([60187.1, 58140.1]),
+            'Volume in USDT': array([7.54629129e+09, 1.11464143e+10])
+        }
+    '''
+
+    if not candlesticks:
+        return empty_candlestick_columns()
+
+    rows = np.array(candlesticks, dtype=str)
+
+    if confirm_index is not None:
+        rows = rows[rows[:, confirm_index] == '1']
+
+    if reverse:
+        rows = rows[::-1]
+
+    columns = {
+        'Open Time': rows[:, column_indices[0]].astype(np.int64),
+    }
+
+    for column, column_index in zip(CANDLESTICK_COLUMNS[1:],
+                                    column_indices[1:]):
+        columns[column] = rows[:, column_index].astype(np.float64)
+
+    return columns
+
+
+def get_candlestick_row_count(candlestick_data):
+    '''
+    Get the no. of candlesticks in columnar or row candlestick data.
+    '''
+
+    if candlestick_data is None:
+        return 0
+
+    if isinstance(candlestick_data, dict):
+        return len(candlestick_data['Open Time'])
+
+    return len(candlestick_data)
@@ -0,0 +1,221 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InsecureRequestWarning
+import urllib3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+urllib3.disable_warnings(InsecureRequestWarning)
+'''
+Shared HTTP client for the CEX API queries.
+
+All queries go through one requests session, so TLS connections are kept
+alive and reused across requests and threads. Rate limited (429, 418) and
+server error (5xx) responses as well as connection errors are retried with
+exponential backoff and full jitter, honouring the Retry-After header when
+the CEX sends one. Responses are decoded with orjson when it is installed.
+'''
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) in seconds
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 60
+DEFAULT_POOL_MAXSIZE = 32
+
+RETRY_STATUS_CODES = [418, 429, 500, 502, 503, 504]
+
+# Binance reports the request weight used in the current minute in this
+# header. Requests pause until the next minute once it gets this close to
+# the limit.
+BINANCE_USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-1M'
+USED_WEIGHT_PAUSE_RATIO = 0.95
+
+http_client_config = {
+    'timeout': DEFAULT_TIMEOUT,
+    'max_retries': DEFAULT_MAX_RETRIES,
+    'backoff_base': DEFAULT_BACKOFF_BASE,
+    'backoff_max': DEFAULT_BACKOFF_MAX,
+    'pool_maxsize': DEFAULT_POOL_MAXSIZE,
+}
+
+session = None
+session_lock = threading.Lock()
+
+
+class CexApiError(Exception):
+    """
+    Raised when a CEX API query fails.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def configure_http_client(timeout=None,
+                          max_retries=None,
+                          backoff_base=None,
+                          backoff_max=None,
+                          pool_maxsize=None):
+    """
+    Update the timeout, retry and connection pool settings. A new session is
+    created on the next request if the pool size changes.
+    """
+
+    global session
+
+    if timeout is not None:
+        http_client_config['timeout'] = timeout
+    if max_retries is not None:
+        http_client_config['max_retries'] = max_retries
+    if backoff_base is not None:
+        http_client_config['backoff_base'] = backoff_base
+    if backoff_max is not None:
+        http_client_config['backoff_max'] = backoff_max
+    if pool_maxsize is not None and pool_maxsize != http_client_config[
+            'pool_maxsize']:
+        http_client_config['pool_maxsize'] = pool_maxsize
+
+        with session_lock:
+            if session is not None:
+                session.close()
+            session = None
+
+
+def get_session():
+    """
+    Get the shared session, creating it on first use.
+    """
+
+    global session
+
+    with session_lock:
+        if session is None:
+            pool_maxsize = http_client_config['pool_maxsize']
+            adapter = HTTPAdapter(pool_connections=pool_maxsize,
+                                  pool_maxsize=pool_maxsize)
+
+            session = requests.Session()
+            session.verify = False
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+        return session
+
+
+def get_retry_after_seconds(response):
+    """
+    Parse the Retry-After header, given in seconds or as an HTTP date.
+    """
+
+    retry_after = response.headers.get('Retry-After')
+
+    if not retry_after:
+        return None
+
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_after_datetime = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+    return max(retry_after_datetime.timestamp() - time.time(), 0)
+
+
+def get_backoff_seconds(attempt):
+    """
+    Exponential backoff with full jitter.
+    """
+
+    max_backoff_seconds = min(
+        http_client_config['backoff_max'],
+        http_client_config['backoff_base'] * (2**attempt))
+
+    return random.uniform(0, max_backoff_seconds)
+
+
+def wait_for_used_weight(response, used_weight_limit):
+    """
+    Pause until the next minute when the used request weight reported by
+    Binance is close to the limit.
+    """
+
+    used_weight = response.headers.get(BINANCE_USED_WEIGHT_HEADER)
+
+    if not used_weight or not used_weight_limit:
+        return
+
+    try:
+        used_weight = int(used_weight)
+    except ValueError:
+        return
+
+    if used_weight >= used_weight_limit * USED_WEIGHT_PAUSE_RATIO:
+        wait_seconds = 60 - time.time() % 60
+        print('\nUsed request weight is {}/{}. Pausing for {:.1f}s...'.format(
+            used_weight, used_weight_limit, wait_seconds))
+        time.sleep(wait_seconds)
+
+
+def http_get(url, params=None, used_weight_limit=None):
+    """
+    Send a GET request through the shared session and retry it on rate limit
+    responses, server errors and connection errors.
+
+    Returns the response of the last attempt. Raises CexApiError if the
+    request could not be sent at all.
+    """
+
+    max_retries = http_client_config['max_retries']
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = get_session().get(url,
+                                         params=params,
+                                         timeout=http_client_config['timeout'])
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise CexApiError('Request to {} failed: {}'.format(url, e))
+
+            time.sleep(get_backoff_seconds(attempt))
+            continue
+
+        wait_for_used_weight(response, used_weight_limit)
+
+        if (response.status_code not in RETRY_STATUS_CODES
+                or attempt == max_retries):
+            return response
+
+        wait_seconds = get_backoff_seconds(attempt)
+        retry_after_seconds = get_retry_after_seconds(response)
+
+        if retry_after_seconds is not None:
+            wait_seconds = max(wait_seconds, retry_after_seconds)
+
+        print('\nResponse code is {} for {}. Retrying in {:.1f}s...'.format(
+            response.status_code, url, wait_seconds))
+        time.sleep(wait_seconds)
+
+    return response
+
+
+def decode_json(response):
+    """
+    Decode a JSON response, using the faster orjson decoder if available.
+    """
+
+    if orjson is not None:
+        return orjson.loads(response.content)
+
+    return response.json()
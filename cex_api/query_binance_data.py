@@ -1,15 +1,40 @@
-import requests
-from urllib3.exceptions import InsecureRequestWarning
-import urllib3
-import sys
-
-urllib3.disable_warnings(InsecureRequestWarning)
+import os
+from cex_api.http_client import CexApiError, decode_json, http_get
+from cex_api.columnar import candlesticks_to_columns
 '''
 Binance API Information:
     Frequently Asked Questions on API: https://www.binance.com/en/support/faq/frequently-asked-questions-on-api-360004492232
     USD-M Futures API Documentation: https://developers.binance.com/docs/derivatives/usds-margined-futures/general-info
 '''
 
+# Base URL of the API. Set the BINANCE_BASE_URL environment variable to query
+# another server, e.g. the offline replay server in cex_api/replay_server.py.
+BINANCE_BASE_URL = os.environ.get('BINANCE_BASE_URL',
+                                  'https://fapi.binance.com')
+
+# USD-M Futures IP limit: 2400 request weight per minute
+BINANCE_REQUEST_WEIGHT_LIMIT = 2400
+BINANCE_REQUEST_WEIGHT_PERIOD = 60
+
+# Candlestick intervals and their length in seconds
+BINANCE_INTERVAL_SECONDS = {
+    '1m': 60,
+    '3m': 180,
+    '5m': 300,
+    '15m': 900,
+    '30m': 1800,
+    '1h': 3600,
+    '2h': 7200,
+    '4h': 14400,
+    '6h': 21600,
+    '8h': 28800,
+    '12h': 43200,
+    '1d': 86400,
+    '3d': 259200,
+    '1w': 604800,
+    '1M': 2592000,
+}
+
 
 def get_binance_perpetual_futures_pairs():
     '''
@@ -26,11 +51,11 @@ def get_binance_perpetual_futures_pairs():
         https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/Exchange-Information
     '''
 
-    url = 'https://fapi.binance.com/fapi/v1/exchangeInfo'
-    response = requests.get(url, verify=False)
+    url = BINANCE_BASE_URL + '/fapi/v1/exchangeInfo'
+    response = http_get(url, used_weight_limit=BINANCE_REQUEST_WEIGHT_LIMIT)
 
     if response.status_code == 200:
-        data = response.json()
+        data = decode_json(response)
         perpetual_futures_pairs = [
             symbol['symbol'] for symbol in data['symbols']
             if symbol['contractType'] == 'PERPETUAL'
@@ -38,15 +63,14 @@ def get_binance_perpetual_futures_pairs():
         ]
 
     elif response.status_code == 429:
-        print('\nUnable to query Binance USD-M pairs. Rate limit exceeded.\n')
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M pairs. Rate limit exceeded.',
+            response.status_code)
 
     else:
-        print('\nUnable to query Binance USD-M pairs. Response code is {}.\n'.
-              format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M pairs. Response code is {}.'.format(
+                response.status_code), response.status_code)
 
     # print(sorted(perpetual_futures_pairs))
 
@@ -58,7 +82,8 @@ def get_binance_perpetual_futures_pairs():
 def get_binance_perpetual_futures_candlestick_data(symbol,
                                                    interval='1d',
                                                    endTime='',
-                                                   limit=365):
+                                                   limit=365,
+                                                   columnar=False):
     '''
     Get perpetual futures candlestick data from Binance.
 
@@ -77,6 +102,9 @@ def get_binance_perpetual_futures_candlestick_data(symbol,
         limit: int
             The number of candlesticks to return. 
             Default 500; max 1500.
+        columnar: bool
+            Set to True to return columnar candlestick data: a dict of typed arrays (int64 open time in ms, 
+            float64 open, high, low, close and quote volume) instead of a list of lists.
 
     Response Example:
         [
@@ -103,48 +131,41 @@ def get_binance_perpetual_futures_candlestick_data(symbol,
     '''
 
     if symbol in ['', None]:
-        print('\nThe symbol cannot be empty.\n')
-
-        sys.exit(1)
-
-    if interval not in [
-            '1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h',
-            '12h', '1d', '3d', '1w', '1M'
-    ]:
-        print(
-            '\nThe interval is invalid. Available options: 1m, 3m, 5m, 15m, 30m, 1h, 2h, 4h, 6h, 8h, 12h, 1d, 3d, 1w, 1M.\n'
-        )
+        raise ValueError('The symbol cannot be empty.')
 
-        sys.exit(1)
+    if interval not in BINANCE_INTERVAL_SECONDS:
+        raise ValueError(
+            'The interval is invalid. Available options: {}.'.format(
+                ', '.join(BINANCE_INTERVAL_SECONDS)))
 
-    url = 'https://fapi.binance.com/fapi/v1/klines?symbol={}&interval={}&endTime={}&limit={}'.format(
+    url = BINANCE_BASE_URL + '/fapi/v1/klines?symbol={}&interval={}&endTime={}&limit={}'.format(
         symbol, interval, endTime, limit)
-    response = requests.get(url, verify=False)
+    response = http_get(url, used_weight_limit=BINANCE_REQUEST_WEIGHT_LIMIT)
 
     if response.status_code == 200:
-        data = response.json()
-        data = [[
-            candlestick[0],
-            candlestick[1],
-            candlestick[2],
-            candlestick[3],
-            candlestick[4],
-            candlestick[7],
-        ] for candlestick in data]
+        data = decode_json(response)
+
+        if columnar:
+            data = candlesticks_to_columns(data, [0, 1, 2, 3, 4, 7])
+        else:
+            data = [[
+                candlestick[0],
+                candlestick[1],
+                candlestick[2],
+                candlestick[3],
+                candlestick[4],
+                candlestick[7],
+            ] for candlestick in data]
 
     elif response.status_code == 429:
-        print(
-            '\nUnable to query Binance USD-M pair {} candlestick data. Rate limit exceeded.\n'
-            .format(symbol))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M pair {} candlestick data. Rate limit exceeded.'
+            .format(symbol), response.status_code)
 
     else:
-        print(
-            '\nUnable to query Binance USD-M pair {} candlestick data. Response code is {}.\n'
-            .format(symbol, response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M pair {} candlestick data. Response code is {}.'
+            .format(symbol, response.status_code), response.status_code)
 
     # print(data[0])
     # print(data[-1])
@@ -153,6 +174,27 @@ def get_binance_perpetual_futures_candlestick_data(symbol,
     return data
 
 
+def get_binance_candlestick_request_weight(limit):
+    '''
+    Get the request weight of one candlestick data request from Binance.
+
+    Request Weight:
+        based on parameter LIMIT
+        If LIMIT [1,100), 1; [100,500), 2; [500,1000], 5; > 1000, 10
+    '''
+
+    limit = int(limit)
+
+    if limit < 100:
+        return 1
+    elif limit < 500:
+        return 2
+    elif limit <= 1000:
+        return 5
+    else:
+        return 10
+
+
 def get_binance_perpetual_futures_24hr_price_change_statistics_data():
     '''
     Get perpetual futures 24hr price change statistics data from Binance.
@@ -188,11 +230,11 @@ def get_binance_perpetual_futures_24hr_price_change_statistics_data():
         https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/24hr-Ticker-Price-Change-Statistics
     '''
 
-    url = 'https://fapi.binance.com/fapi/v1/ticker/24hr'
-    response = requests.get(url, verify=False)
+    url = BINANCE_BASE_URL + '/fapi/v1/ticker/24hr'
+    response = http_get(url, used_weight_limit=BINANCE_REQUEST_WEIGHT_LIMIT)
 
     if response.status_code == 200:
-        data = response.json()
+        data = decode_json(response)
         data = [{
             'symbol': pair['symbol'],
             'priceChange': pair['priceChange'],
@@ -206,18 +248,14 @@ def get_binance_perpetual_futures_24hr_price_change_statistics_data():
         } for pair in data]
 
     elif response.status_code == 429:
-        print(
-            '\nUnable to query Binance USD-M tickers 24hr price change statistics data. Rate limit exceeded.\n'
-        )
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M tickers 24hr price change statistics data. Rate limit exceeded.',
+            response.status_code)
 
     else:
-        print(
-            '\nUnable to query Binance USD-M tickers 24hr price change statistics data. Response code is {}.\n'
-            .format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Binance USD-M tickers 24hr price change statistics data. Response code is {}.'
+            .format(response.status_code), response.status_code)
 
     # print(data)
 
@@ -1,14 +1,36 @@
-import requests
-from urllib3.exceptions import InsecureRequestWarning
-import urllib3
-import sys
-
-urllib3.disable_warnings(InsecureRequestWarning)
+import os
+from cex_api.http_client import CexApiError, decode_json, http_get
+from cex_api.columnar import candlesticks_to_columns
 '''
 Bybit API Information:
     API Documentation: https://bybit-exchange.github.io/docs/v5/intro
 '''
 
+# Base URL of the API. Set the BYBIT_BASE_URL environment variable to query
+# another server, e.g. the offline replay server in cex_api/replay_server.py.
+BYBIT_BASE_URL = os.environ.get('BYBIT_BASE_URL', 'https://api.bybit.com')
+
+# IP limit: 600 requests per 5 seconds across all endpoints
+BYBIT_REQUEST_LIMIT = 600
+BYBIT_REQUEST_PERIOD = 5
+
+# Candlestick intervals and their length in seconds
+BYBIT_INTERVAL_SECONDS = {
+    '1': 60,
+    '3': 180,
+    '5': 300,
+    '15': 900,
+    '30': 1800,
+    '60': 3600,
+    '120': 7200,
+    '240': 14400,
+    '360': 21600,
+    '720': 43200,
+    'D': 86400,
+    'M': 2592000,
+    'W': 604800,
+}
+
 
 def get_bybit_perpetual_futures_pairs():
     '''
@@ -28,12 +50,12 @@ def get_bybit_perpetual_futures_pairs():
 
     while True:
 
-        url = 'https://api.bybit.com/v5/market/instruments-info?category=linear&limit=1000&cursor={}'.format(
+        url = BYBIT_BASE_URL + '/v5/market/instruments-info?category=linear&limit=1000&cursor={}'.format(
             next_page_cursor)
-        response = requests.get(url, verify=False)
+        response = http_get(url)
 
         if response.status_code == 200:
-            json_data = response.json()
+            json_data = decode_json(response)
             code = json_data.get('retCode')
 
             if code == 0:
@@ -52,17 +74,13 @@ def get_bybit_perpetual_futures_pairs():
 
             else:
                 msg = json_data.get('retMsg', '')
-                print(
-                    "\nUnable to query Bybit Perpetual Futures pairs. Return code is {} and error message is '{}'.\n"
+                raise CexApiError(
+                    "Unable to query Bybit Perpetual Futures pairs. Return code is {} and error message is '{}'."
                     .format(code, msg))
-
-                sys.exit(1)
         else:
-            print(
-                '\nUnable to query Bybit Perpetual Futures pairs. Response code is {}.\n'
-                .format(response.status_code))
-
-            sys.exit(1)
+            raise CexApiError(
+                'Unable to query Bybit Perpetual Futures pairs. Response code is {}.'
+                .format(response.status_code), response.status_code)
 
     # print(len(all_perpetual_futures_pairs))
 
@@ -74,7 +92,8 @@ def get_bybit_perpetual_futures_pairs():
 def get_bybit_perpetual_futures_candlestick_data(symbol,
                                                  interval='D',
                                                  endTime='',
-                                                 limit=365):
+                                                 limit=365,
+                                                 columnar=False):
     '''
     Get perpetual futures candlestick data from Bybit. Charts are returned in groups based on the requested interval.
 
@@ -89,6 +108,9 @@ def get_bybit_perpetual_futures_candlestick_data(symbol,
         limit: int
             Limit for data size per page. [1, 1000]. 
             Default: 200
+        columnar: bool
+            Set to True to return columnar candlestick data: a dict of typed arrays (int64 open time in ms, 
+            float64 open, high, low, close and quote volume) instead of a list of lists.
 
     Response Parameters:
         startTime: str
@@ -125,54 +147,48 @@ def get_bybit_perpetual_futures_candlestick_data(symbol,
     '''
 
     if symbol in ['', None]:
-        print('\nThe symbol cannot be empty.\n')
+        raise ValueError('The symbol cannot be empty.')
 
-        sys.exit(1)
+    if interval not in BYBIT_INTERVAL_SECONDS:
+        raise ValueError(
+            'The interval is invalid. Availble options: {}.'.format(
+                ', '.join(BYBIT_INTERVAL_SECONDS)))
 
-    if interval not in [
-            '1', '3', '5', '15', '30', '60', '120', '240', '360', '720', 'D',
-            'M', 'W'
-    ]:
-        print(
-            '\nThe interval is invalid. Availble options: 1, 3, 5, 15, 30, 60, 120, 240, 360, 720, D, M, W.\n'
-        )
-
-        sys.exit(1)
-
-    url = 'https://api.bybit.com/v5/market/kline?category=linear&symbol={}&interval={}&end={}&limit={}'.format(
+    url = BYBIT_BASE_URL + '/v5/market/kline?category=linear&symbol={}&interval={}&end={}&limit={}'.format(
         symbol, interval, endTime, limit)
-    response = requests.get(url, verify=False)
+    response = http_get(url)
 
     if response.status_code == 200:
-        json_data = response.json()
+        json_data = decode_json(response)
         code = json_data.get('retCode')
 
         if code == 0:
             result = json_data.get('result', {})
             data = result.get('list', [])
-            data = data[::-1]
-            data = [[
-                candlestick[0],
-                candlestick[1],
-                candlestick[2],
-                candlestick[3],
-                candlestick[4],
-                candlestick[6],
-            ] for candlestick in data]
+
+            if columnar:
+                data = candlesticks_to_columns(data, [0, 1, 2, 3, 4, 6],
+                                               reverse=True)
+            else:
+                data = data[::-1]
+                data = [[
+                    candlestick[0],
+                    candlestick[1],
+                    candlestick[2],
+                    candlestick[3],
+                    candlestick[4],
+                    candlestick[6],
+                ] for candlestick in data]
 
         else:
             msg = json_data.get('retMsg', '')
-            print(
-                "\nUnable to query Bybit Perpetual Futures pair {} candlestick data. Return code is {} and error message is '{}'.\n"
-                .format(code, msg))
-
-            sys.exit(1)
+            raise CexApiError(
+                "Unable to query Bybit Perpetual Futures pair {} candlestick data. Return code is {} and error message is '{}'."
+                .format(symbol, code, msg))
     else:
-        print(
-            '\nUnable to query Bybit Perpetual Futures pair {} candlestick data. Response code is {}.\n'
-            .format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Bybit Perpetual Futures pair {} candlestick data. Response code is {}.'
+            .format(symbol, response.status_code), response.status_code)
 
     # print(data[0])
     # print(data[-1])
@@ -278,11 +294,11 @@ def get_bybit_perpetual_futures_24hr_price_change_statistics_data():
         https://bybit-exchange.github.io/docs/v5/market/tickers
     '''
 
-    url = 'https://api.bybit.com/v5/market/tickers?category=linear'
-    response = requests.get(url, verify=False)
+    url = BYBIT_BASE_URL + '/v5/market/tickers?category=linear'
+    response = http_get(url)
 
     if response.status_code == 200:
-        json_data = response.json()
+        json_data = decode_json(response)
         code = json_data.get('retCode')
 
         if code == 0:
@@ -311,17 +327,13 @@ def get_bybit_perpetual_futures_24hr_price_change_statistics_data():
 
         else:
             msg = json_data.get('retMsg', '')
-            print(
-                "\nUnable to query Bybit Perpetual Futures tickers 24hr price change statistics data. Return code is {} and error message is '{}'.\n"
+            raise CexApiError(
+                "Unable to query Bybit Perpetual Futures tickers 24hr price change statistics data. Return code is {} and error message is '{}'."
                 .format(code, msg))
-
-            sys.exit(1)
     else:
-        print(
-            '\nUnable to query Bybit Perpetual Futures tickers 24hr price change statistics data. Response code is {}.\n'
-            .format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query Bybit Perpetual Futures tickers 24hr price change statistics data. Response code is {}.'
+            .format(response.status_code), response.status_code)
 
     # print(data)
 
@@ -1,14 +1,46 @@
-import requests
-from urllib3.exceptions import InsecureRequestWarning
-import urllib3
-import sys
-
-urllib3.disable_warnings(InsecureRequestWarning)
+import os
+from cex_api.http_client import CexApiError, decode_json, http_get
+from cex_api.columnar import candlesticks_to_columns
 '''
 OKX API FAQ:
     API Documentation: https://www.okx.com/docs-v5/en/?python#overview
 '''
 
+# Base URL of the API. Set the OKX_BASE_URL environment variable to query
+# another server, e.g. the offline replay server in cex_api/replay_server.py.
+OKX_BASE_URL = os.environ.get('OKX_BASE_URL', 'https://www.okx.com')
+
+# Candlesticks endpoint limit: 40 requests per 2 seconds (IP)
+OKX_REQUEST_LIMIT = 40
+OKX_REQUEST_PERIOD = 2
+
+# History candlesticks endpoint limit: 20 requests per 2 seconds (IP)
+OKX_HISTORY_REQUEST_LIMIT = 20
+
+# Candlesticks of 6 hours or longer start at midnight Hong Kong time (UTC+8)
+OKX_CANDLESTICK_UTC_OFFSET = 8 * 3600
+
+# Candlestick intervals and their length in seconds
+OKX_INTERVAL_SECONDS = {
+    '1s': 1,
+    '1m': 60,
+    '3m': 180,
+    '5m': 300,
+    '15m': 900,
+    '30m': 1800,
+    '1H': 3600,
+    '2H': 7200,
+    '4H': 14400,
+    '6H': 21600,
+    '12H': 43200,
+    '1D': 86400,
+    '2D': 172800,
+    '3D': 259200,
+    '1W': 604800,
+    '1M': 2592000,
+    '3M': 7776000,
+}
+
 
 def get_okx_perpetual_futures_pairs():
     '''
@@ -29,15 +61,15 @@ def get_okx_perpetual_futures_pairs():
         https://www.okx.com/docs-v5/en/?python#public-data-rest-api-get-instruments
     '''
 
-    url = 'https://www.okx.com/api/v5/public/instruments'
+    url = OKX_BASE_URL + '/api/v5/public/instruments'
     params = {
         'instType':
         'SWAP',  # Type of instrument, 'SWAP' for perpetual contracts
     }
-    response = requests.get(url, params=params, verify=False)
+    response = http_get(url, params=params)
 
     if response.status_code == 200:
-        json_data = response.json()
+        json_data = decode_json(response)
         code = json_data.get('code')
 
         if code == '0':
@@ -50,18 +82,14 @@ def get_okx_perpetual_futures_pairs():
 
         else:
             msg = json_data.get('msg', '')
-            print(
-                "\nUnable to query OKX Perpetual Futures pairs. Return code is {} and error message is '{}'.\n"
+            raise CexApiError(
+                "Unable to query OKX Perpetual Futures pairs. Return code is {} and error message is '{}'."
                 .format(code, msg))
 
-            sys.exit(1)
-
     else:
-        print(
-            '\nUnable to query OKX Perpetual Futures pairs. Response code is {}.\n'
-            .format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query OKX Perpetual Futures pairs. Response code is {}.'
+            .format(response.status_code), response.status_code)
 
     # print(len(sorted(perpetual_futures_pairs)))
 
@@ -73,7 +101,8 @@ def get_okx_perpetual_futures_pairs():
 def get_okx_perpetual_futures_candlestick_data(symbol,
                                                interval='1D',
                                                endTime='',
-                                               limit='300'):
+                                               limit='300',
+                                               columnar=False):
     '''
     Get perpetual futures candlestick data from OKX. This endpoint can retrieve the latest 1,440 data entries. 
 
@@ -88,6 +117,9 @@ def get_okx_perpetual_futures_candlestick_data(symbol,
         limit: str
             Number of results per request.
             Default 100; max 300.
+        columnar: bool
+            Set to True to return columnar candlestick data: a dict of typed arrays (int64 open time in ms, 
+            float64 open, high, low, close and quote volume) instead of a list of lists.
 
     Response Parameters:
         ts: str
@@ -128,59 +160,54 @@ def get_okx_perpetual_futures_candlestick_data(symbol,
     '''
 
     if symbol in ['', None]:
-        print('\nThe symbol cannot be empty.\n')
+        raise ValueError('The symbol cannot be empty.')
 
-        sys.exit(1)
+    if interval not in OKX_INTERVAL_SECONDS:
+        raise ValueError(
+            'The interval is invalid. Availble options: {}.'.format(
+                ', '.join(OKX_INTERVAL_SECONDS)))
 
-    if interval not in [
-            '1s', '1m', '3m', '5m', '15m', '30m', '1H', '2H', '4H', '6H',
-            '12H', '1D', '2D', '3D', '1W', '1M', '3M'
-    ]:
-        print(
-            '\nThe interval is invalid. Availble options: 1s, 1m, 3m, 5m, 15m, 30m, 1H, 2H, 4H, 6H, 12H, 1D, 2D, 3D, 1W, 1M, 3M.\n'
-        )
-
-        sys.exit(1)
-
-    url = 'https://www.okx.com/api/v5/market/candles'
+    url = OKX_BASE_URL + '/api/v5/market/candles'
     params = {
         'instId': symbol,
         'bar': interval,
         'after': endTime,
         'limit': limit,
     }
-    response = requests.get(url, params=params, verify=False)
+    response = http_get(url, params=params)
 
     if response.status_code == 200:
-        json_data = response.json()
+        json_data = decode_json(response)
         code = json_data.get('code')
 
         if code == '0':
             data = json_data.get('data', [])
-            data = data[::-1]
-            data = [[
-                candlestick[0],
-                candlestick[1],
-                candlestick[2],
-                candlestick[3],
-                candlestick[4],
-                candlestick[7],
-            ] for candlestick in data if candlestick[-1] == '1']
+
+            if columnar:
+                data = candlesticks_to_columns(data, [0, 1, 2, 3, 4, 7],
+                                               confirm_index=8,
+                                               reverse=True)
+            else:
+                data = data[::-1]
+                data = [[
+                    candlestick[0],
+                    candlestick[1],
+                    candlestick[2],
+                    candlestick[3],
+                    candlestick[4],
+                    candlestick[7],
+                ] for candlestick in data if candlestick[-1] == '1']
 
         else:
             msg = json_data.get('msg', '')
-            print(
-                "\nUnable to query OKX Perpetual Futures pair {} candlestick data. Return code is {} and error message is '{}'.\n"
+            raise CexApiError(
+                "Unable to query OKX Perpetual Futures pair {} candlestick data. Return code is {} and error message is '{}'."
                 .format(symbol, code, msg))
 
-            sys.exit(1)
-
     else:
-        print(
-            '\nUnable to query OKX Perpetual Futures pair {} candlestick data. Response code is {}.\n'
-            .format(symbol, response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query OKX Perpetual Futures pair {} candlestick data. Response code is {}.'
+            .format(symbol, response.status_code), response.status_code)
 
     # print(data[0])
     # print(data[-1])
@@ -189,6 +216,98 @@ def get_okx_perpetual_futures_candlestick_data(symbol,
     return data
 
 
+def get_okx_perpetual_futures_history_candlestick_data(symbol,
+                                                       interval='1D',
+                                                       endTime='',
+                                                       limit='100',
+                                                       columnar=False):
+    '''
+    Get perpetual futures history candlestick data from OKX. This endpoint can retrieve data from recent years, 
+    beyond the latest 1,440 data entries available from the candlesticks endpoint.
+
+    Rate Limit: 
+        20 requests per 2 seconds
+
+    Request Parameters:
+        instId: str
+            Instrument ID, e.g. BTC-USDT-SWAP.
+        bar: str
+            Bar size. 
+            Possible values: 1s, 1m, 3m, 5m, 15m, 30m, 1H, 2H, 4H, 6H, 12H, 1D, 2D, 3D, 1W, 1M, 3M.
+        after: str
+            Pagination of data to return records earlier than the requested ts.
+        limit: str
+            Number of results per request.
+            Default 100; max 100.
+        columnar: bool
+            Set to True to return columnar candlestick data: a dict of typed arrays (int64 open time in ms, 
+            float64 open, high, low, close and quote volume) instead of a list of lists.
+
+    Response Example:
+        Same as get_okx_perpetual_futures_candlestick_data.
+
+    More information:
+        https://www.okx.com/docs-v5/en/?shell#order-book-trading-market-data-get-candlesticks-history
+    '''
+
+    if symbol in ['', None]:
+        raise ValueError('The symbol cannot be empty.')
+
+    if interval not in OKX_INTERVAL_SECONDS:
+        raise ValueError(
+            'The interval is invalid. Availble options: {}.'.format(
+                ', '.join(OKX_INTERVAL_SECONDS)))
+
+    url = OKX_BASE_URL + '/api/v5/market/history-candles'
+    params = {
+        'instId': symbol,
+        'bar': interval,
+        'after': endTime,
+        'limit': limit,
+    }
+    response = http_get(url, params=params)
+
+    if response.status_code == 200:
+        json_data = decode_json(response)
+        code = json_data.get('code')
+
+        if code == '0':
+            data = json_data.get('data', [])
+
+            if columnar:
+                data = candlesticks_to_columns(data, [0, 1, 2, 3, 4, 7],
+                                               confirm_index=8,
+                                               reverse=True)
+            else:
+                data = data[::-1]
+                data = [[
+                    candlestick[0],
+                    candlestick[1],
+                    candlestick[2],
+                    candlestick[3],
+                    candlestick[4],
+                    candlestick[7],
+                ] for candlestick in data if candlestick[-1] == '1']
+
+        else:
+            msg = json_data.get('msg', '')
+            raise CexApiError(
+                "Unable to query OKX Perpetual Futures pair {} history candlestick data. Return code is {} and error message is '{}'."
+                .format(symbol, code, msg))
+
+    elif response.status_code == 429:
+        raise CexApiError(
+            'Unable to query OKX Perpetual Futures pair {} history candlestick data. Rate limit exceeded.'
+            .format(symbol), response.status_code)
+
+    else:
+        raise CexApiError(
+            'Unable to query OKX Perpetual Futures pair {} history candlestick data. Response code is {}.'
+            .format(symbol, response.status_code), response.status_code)
+
+    return data
+
+
 def get_okx_perpetual_futures_24hr_price_change_statistics_data():
     '''
     Get perpetual futures 24hr price change statistics data from OKX.
@@ -254,14 +373,14 @@ def get_okx_perpetual_futures_24hr_price_change_statistics_data():
         https://www.okx.com/docs-v5/en/?shell#order-book-trading-market-data-get-tickers
     '''
 
-    url = 'https://www.okx.com/api/v5/market/tickers'
+    url = OKX_BASE_URL + '/api/v5/market/tickers'
     params = {
         'instType': 'SWAP',
     }
-    response = requests.get(url, params=params, verify=False)
+    response = http_get(url, params=params)
 
     if response.status_code == 200:
-        json_data = response.json()
+        json_data = decode_json(response)
         code = json_data.get('code')
 
         if code == '0':
@@ -290,18 +409,14 @@ def get_okx_perpetual_futures_24hr_price_change_statistics_data():
 
         else:
             msg = json_data.get('msg', '')
-            print(
-                "\nUnable to query OKX Perpetual Futures tickers 24hr price change statistics data. Return code is {} and error message is '{}'.\n"
+            raise CexApiError(
+                "Unable to query OKX Perpetual Futures tickers 24hr price change statistics data. Return code is {} and error message is '{}'."
                 .format(code, msg))
 
-            sys.exit(1)
-
     else:
-        print(
-            '\nUnable to query OKX Perpetual Futures tickers 24hr price change statistics data. Response code is {}.\n'
-            .format(response.status_code))
-
-        sys.exit(1)
+        raise CexApiError(
+            'Unable to query OKX Perpetual Futures tickers 24hr price change statistics data. Response code is {}.'
+            .format(response.status_code), response.status_code)
 
     # print(data[0])
 
@@ -314,4 +429,6 @@ def get_okx_perpetual_futures_24hr_price_change_statistics_data():
 #     bar='1D',
 #     #    after='1704065053000',
 #     limit='365')
+# get_okx_perpetual_futures_history_candlestick_data('BTC-USDT-SWAP', '1H',
+#                                                    '1704065053000', '100')
 # get_okx_perpetual_futures_24hr_price_change_statistics_data()
@@ -0,0 +1,1048 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from cex_api.http_client import *
+from cex_api.columnar import *
+from cex_api.adapters import *
+'''
+Offline replay server for the CEX APIs.
+
+Serves the pair list, candlestick and ticker endpoints of Binance, OKX and
+Bybit from a local HTTP server, in the same response format, pagination and
+request limits as the CEXes. Candlesticks are served from recorded fixtures
+when there are any for the pair, otherwise they are generated from a
+deterministic function of the pair and the open time, so every run of a
+download sees the same data. Latency, server errors and the rate limits of
+each CEX can be configured, which makes the concurrency, retries and
+backfill of the downloader benchmarkable without network access.
+
+Start the server and point the downloader to it:
+    python -m cex_api.replay_server --port 8080
+    python data_manager.py -c binance,okx,bybit -i 1d -l 1000 --base-url http://127.0.0.1:8080
+
+Record fixtures from the CEXes, to be replayed with --fixtures-dir:
+    python -m cex_api.replay_server --record binance -i 1d -l 1500 --fixtures-dir ./fixtures
+'''
+
+DEFAULT_REPLAY_HOST = '127.0.0.1'
+DEFAULT_REPLAY_PORT = 8080
+DEFAULT_SYMBOL_COUNT = 200
+
+# Synthetic pairs are listed one week apart from this time on, so backfills
+# of old ranges see pairs without any candlesticks.
+SYNTHETIC_LISTING_START = 1567900800000  # 2019-09-08
+SYNTHETIC_LISTING_STEP = 7 * 86400 * 1000
+
+SYNTHETIC_BASE_ASSETS = [
+    'BTC', 'ETH', 'BCH', 'XRP', 'EOS', 'LTC', 'TRX', 'ETC', 'LINK', 'XLM',
+    'ADA', 'XMR', 'DASH', 'ZEC', 'XTZ', 'BNB', 'ATOM', 'ONT', 'IOTA', 'BAT',
+    'VET', 'NEO', 'QTUM', 'IOST', 'THETA', 'ALGO', 'ZIL', 'KNC', 'ZRX', 'COMP',
+    'OMG', 'DOGE', 'SXP', 'KAVA', 'BAND', 'RLC', 'WAVES', 'MKR', 'SNX', 'DOT',
+    'YFI', 'CRV', 'SOL', 'AVAX', 'UNI', 'AAVE', 'NEAR', 'FIL'
+]
+
+# Max. and default no. of candlesticks per request of each endpoint
+BINANCE_KLINES_LIMITS = (1500, 500)
+OKX_CANDLES_LIMITS = (300, 100)
+OKX_HISTORY_CANDLES_LIMITS = (100, 100)
+BYBIT_KLINE_LIMITS = (1000, 200)
+BYBIT_INSTRUMENTS_LIMITS = (1000, 500)
+
+# The OKX candlesticks endpoint only reaches back this many candlesticks
+OKX_CANDLES_DEPTH = 1440
+
+BINANCE_EXCHANGE_INFO_WEIGHT = 1
+BINANCE_TICKER_WEIGHT = 40
+
+# OKX request limits per endpoint: (no. of requests, period in seconds)
+OKX_ENDPOINT_RATE_LIMITS = {
+    'instruments': (20, 2),
+    'candles': (OKX_REQUEST_LIMIT, OKX_REQUEST_PERIOD),
+    'history-candles': (OKX_HISTORY_REQUEST_LIMIT, OKX_REQUEST_PERIOD),
+    'tickers': (20, 2),
+}
+
+
+class ReplayRateLimit:
+    """
+    Request budget of one CEX or endpoint. Binance counts the weight used in
+    each calendar minute, the other CEXes use a sliding window.
+    """
+
+    def __init__(self, max_weight, period_seconds, fixed_window=False):
+        self.max_weight = max_weight
+        self.period_seconds = period_seconds
+        self.fixed_window = fixed_window
+        self.used_weight = 0
+        self.history = deque()
+        self.window_start = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, weight=1):
+        """
+        Use the request weight if it fits into the current window.
+
+        Returns (allowed, used weight, seconds until the weight fits).
+        """
+
+        with self.lock:
+            now = time.time()
+
+            if self.fixed_window:
+                window_start = now - now % self.period_seconds
+
+                if window_start != self.window_start:
+                    self.window_start = window_start
+                    self.used_weight = 0
+
+                if self.used_weight + weight > self.max_weight:
+                    return False, self.used_weight, window_start + self.period_seconds - now
+
+                self.used_weight += weight
+
+                return True, self.used_weight, 0
+
+            while self.history and self.history[0][
+                    0] <= now - self.period_seconds:
+                _, expired_weight = self.history.popleft()
+                self.used_weight -= expired_weight
+
+            if self.used_weight + weight > self.max_weight:
+                return False, self.used_weight, self.history[0][
+                    0] + self.period_seconds - now
+
+            self.history.append((now, weight))
+            self.used_weight += weight
+
+            return True, self.used_weight, 0
+
+
+def get_noise(x, salt):
+    """
+    Deterministic pseudo-random numbers in [0, 1) for an array of numbers.
+    """
+
+    value = np.sin(np.asarray(x, dtype=np.float64) * 12.9898 +
+                   salt * 78.233) * 43758.5453
+
+    return value - np.floor(value)
+
+
+def get_synthetic_log_price(base_asset, hours):
+    """
+    Log price of a synthetic pair at the given times in hours since the epoch.
+    """
+
+    seed = zlib.crc32(base_asset.encode()) % 10000
+    base_price = 10**(get_noise(seed, 1) * 5 - 1)
+    phase = get_noise(seed, 2) * 2 * np.pi
+
+    return (np.log(base_price) + 0.3 * np.sin(2 * np.pi * hours /
+                                              (24 * 90) + phase) +
+            0.1 * np.sin(2 * np.pi * hours / (24 * 7) + 2 * phase) + 0.02 *
+            (get_noise(hours, seed) - 0.5))
+
+
+def get_synthetic_candlesticks(base_asset, open_times, interval_seconds):
+    """
+    Generate the candlesticks of a synthetic pair. The close of a candlestick
+    is the open of the next one, whatever page it is requested in.
+    """
+
+    seed = zlib.crc32(base_asset.encode()) % 10000
+    open_hours = open_times / 3600000
+    close_hours = open_hours + interval_seconds / 3600
+
+    open_prices = np.exp(get_synthetic_log_price(base_asset, open_hours))
+    close_prices = np.exp(get_synthetic_log_price(base_asset, close_hours))
+    high_prices = np.maximum(open_prices, close_prices) * (
+        1 + 0.01 * get_noise(open_hours, seed + 1))
+    low_prices = np.minimum(open_prices, close_prices) * (
+        1 - 0.01 * get_noise(open_hours, seed + 2))
+
+    daily_volume = 10**(6 + get_noise(seed, 3) * 3)
+    quote_volumes = daily_volume * interval_seconds / 86400 * (
+        0.5 + get_noise(open_hours, seed + 3))
+
+    return {
+        'Open Time': open_times,
+        'Open': open_prices,
+        'High': high_prices,
+        'Low': low_prices,
+        'Close': close_prices,
+        'Volume in USDT': quote_volumes,
+    }
+
+
+def format_number(value):
+    return format(float(value), '.10g')
+
+
+class ReplayMarket:
+    """
+    Pairs and candlesticks served by the replay server, for one CEX.
+    """
+
+    def __init__(self, cex, symbol_count, fixtures_dir=None):
+        self.cex = cex
+        self.adapter = get_adapter(cex)
+        self.fixtures_dir = fixtures_dir
+        self.fixtures = {}
+        self.fixtures_lock = threading.Lock()
+        self.listing_times = {}
+
+        pairs = self.load_fixture(os.path.join(cex, 'pairs.json'))
+
+        if pairs is None:
+            base_assets = SYNTHETIC_BASE_ASSETS[:symbol_count] + [
+                'COIN{:03d}'.format(i)
+                for i in range(symbol_count - len(SYNTHETIC_BASE_ASSETS))
+            ]
+            pairs = [self.get_symbol(base_asset) for base_asset in base_assets]
+
+        self.pairs = pairs
+
+        for i, pair in enumerate(pairs):
+            self.listing_times[
+                pair] = SYNTHETIC_LISTING_START + i * SYNTHETIC_LISTING_STEP
+
+    def get_symbol(self, base_asset):
+        if self.cex == 'okx':
+            return '{}-USDT-SWAP'.format(base_asset)
+
+        return '{}USDT'.format(base_asset)
+
+    def get_base_asset(self, symbol):
+        if self.cex == 'okx':
+            return symbol.split('-')[0]
+
+        return symbol[:-len('USDT')]
+
+    def load_fixture(self, relative_path):
+        if self.fixtures_dir is None:
+            return None
+
+        file_path = os.path.join(self.fixtures_dir, relative_path)
+
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path, 'r') as f:
+            return json.load(f)
+
+    def get_fixture_candlesticks(self, symbol, interval):
+        """
+        Get the recorded candlesticks of a pair as columns, or None if there
+        are none.
+        """
+
+        key = (symbol, interval)
+
+        with self.fixtures_lock:
+            if key not in self.fixtures:
+                rows = self.load_fixture(
+                    os.path.join(self.cex, interval, '{}.json'.format(symbol)))
+
+                if rows is None:
+                    self.fixtures[key] = None
+                else:
+                    self.fixtures[key] = candlesticks_to_columns(
+                        rows, [0, 1, 2, 3, 4, 5])
+
+            return self.fixtures[key]
+
+    def get_candlesticks(self, symbol, interval, end_time, limit, depth=None):
+        """
+        Get up to limit candlesticks with an open time at or before end_time
+        (the current time if None), and not older than depth candlesticks
+        before the current one if set.
+        """
+
+        interval_seconds = self.adapter.get_interval_seconds(interval)
+        interval_ms = interval_seconds * 1000
+        now = int(time.time() * 1000)
+        last_open_time = now // interval_ms * interval_ms
+
+        if end_time is not None:
+            last_open_time = min(last_open_time,
+                                 end_time // interval_ms * interval_ms)
+
+        fixture_candlesticks = self.get_fixture_candlesticks(symbol, interval)
+
+        if fixture_candlesticks is not None:
+            open_times = fixture_candlesticks['Open Time']
+            keep = open_times <= last_open_time
+
+            if depth is not None:
+                keep &= open_times > (now // interval_ms - depth) * interval_ms
+
+            keep_index = np.flatnonzero(keep)[-limit:]
+
+            return {
+                column: values[keep_index]
+                for column, values in fixture_candlesticks.items()
+            }
+
+        first_open_time = last_open_time - (limit - 1) * interval_ms
+        first_open_time = max(
+            first_open_time,
+            math.ceil(self.listing_times[symbol] / interval_ms) * interval_ms)
+
+        if depth is not None:
+            first_open_time = max(first_open_time,
+                                  (now // interval_ms - depth + 1) *
+                                  interval_ms)
+
+        open_times = np.arange(first_open_time,
+                               last_open_time + 1,
+                               interval_ms,
+                               dtype=np.int64)
+
+        return get_synthetic_candlesticks(self.get_base_asset(symbol),
+                                          open_times, interval_seconds)
+
+    def get_tickers(self):
+        """
+        Get the last 24 hours of every pair as (symbol, open, high, low,
+        close, quote volume).
+        """
+
+        tickers = []
+
+        for symbol in self.pairs:
+            candlesticks = self.get_candlesticks(
+                symbol, self.adapter.resolve_interval('1h'), None, 24)
+
+            if len(candlesticks['Open Time']) == 0:
+                continue
+
+            tickers.append(
+                (symbol, candlesticks['Open'][0], candlesticks['High'].max(),
+                 candlesticks['Low'].min(), candlesticks['Close'][-1],
+                 candlesticks['Volume in USDT'].sum()))
+
+        return tickers
+
+
+def get_query_int(query, name, default=None):
+    values = query.get(name)
+
+    if not values:
+        return default
+
+    return int(values[0])
+
+
+def get_query_limit(query, name, limits):
+    max_limit, default_limit = limits
+    limit = get_query_int(query, name, default_limit)
+
+    return min(max(limit, 1), max_limit)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server replaying the CEX APIs.
+
+    Attributes:
+        latency: float
+            Seconds added to every response.
+        latency_jitter: float
+            Max. no. of random seconds added on top of the latency.
+        error_rate: float
+            Fraction of requests answered with a 503 server error.
+        rate_limits: bool
+            Set to False to answer every request regardless of the CEX's rate limit.
+    """
+
+    daemon_threads = True
+
+    def __init__(self,
+                 server_address,
+                 symbol_count=DEFAULT_SYMBOL_COUNT,
+                 fixtures_dir=None,
+                 latency=0,
+                 latency_jitter=0,
+                 error_rate=0,
+                 rate_limits=True,
+                 seed=None,
+                 verbose=False):
+        super().__init__(server_address, ReplayRequestHandler)
+
+        self.markets = {
+            cex: ReplayMarket(cex, symbol_count, fixtures_dir)
+            for cex in ['binance', 'okx', 'bybit']
+        }
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limits = rate_limits
+        self.random = random.Random(seed)
+        self.verbose = verbose
+
+        self.rate_limiters = {
+            'binance':
+            ReplayRateLimit(BINANCE_REQUEST_WEIGHT_LIMIT,
+                            BINANCE_REQUEST_WEIGHT_PERIOD,
+                            fixed_window=True),
+            'bybit':
+            ReplayRateLimit(BYBIT_REQUEST_LIMIT, BYBIT_REQUEST_PERIOD),
+        }
+
+        for endpoint, (max_weight,
+                       period_seconds) in OKX_ENDPOINT_RATE_LIMITS.items():
+            self.rate_limiters['okx/' + endpoint] = ReplayRateLimit(
+                max_weight, period_seconds)
+
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+        self.routes = {
+            '/fapi/v1/exchangeInfo': self.binance_exchange_info,
+            '/fapi/v1/klines': self.binance_klines,
+            '/fapi/v1/ticker/24hr': self.binance_ticker,
+            '/api/v5/public/instruments': self.okx_instruments,
+            '/api/v5/market/candles': self.okx_candles,
+            '/api/v5/market/history-candles': self.okx_history_candles,
+            '/api/v5/market/tickers': self.okx_tickers,
+            '/v5/market/instruments-info': self.bybit_instruments_info,
+            '/v5/market/kline': self.bybit_kline,
+            '/v5/market/tickers': self.bybit_tickers,
+        }
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+
+        return 'http://{}:{}'.format(host, port)
+
+    def count_request(self, path, status_code):
+        with self.stats_lock:
+            path_stats = self.stats.setdefault(path, {})
+            path_stats[status_code] = path_stats.get(status_code, 0) + 1
+
+    def get_stats(self):
+        """
+        Get the no. of responses per endpoint and status code.
+        """
+
+        with self.stats_lock:
+            return {
+                path: dict(path_stats)
+                for path, path_stats in self.stats.items()
+            }
+
+    def acquire(self, key, weight=1):
+        """
+        Use request weight of a rate limit. Returns None if the request is
+        within the limit, otherwise the no. of seconds to wait.
+        """
+
+        if not self.rate_limits:
+            return None
+
+        allowed, _, retry_after = self.rate_limiters[key].try_acquire(weight)
+
+        if allowed:
+            return None
+
+        return retry_after
+
+    def rate_limited(self, body, retry_after, headers=None):
+        headers = dict(headers or {})
+        headers['Retry-After'] = str(max(int(math.ceil(retry_after)), 1))
+
+        return 429, body, headers
+
+    def binance_acquire(self, weight):
+        if not self.rate_limits:
+            return None, {}
+
+        limiter = self.rate_limiters['binance']
+        allowed, used_weight, retry_after = limiter.try_acquire(weight)
+        headers = {BINANCE_USED_WEIGHT_HEADER: str(used_weight)}
+
+        if allowed:
+            return None, headers
+
+        return self.rate_limited(
+            {
+                'code':
+                -1003,
+                'msg':
+                'Too many requests; current limit is {} request weight per 1 MINUTE.'
+                .format(limiter.max_weight)
+            }, retry_after, headers), headers
+
+    def binance_exchange_info(self, query):
+        rate_limited, headers = self.binance_acquire(
+            BINANCE_EXCHANGE_INFO_WEIGHT)
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['binance']
+        fixture = market.load_fixture(
+            os.path.join('binance', 'exchangeInfo.json'))
+
+        if fixture is not None:
+            return 200, fixture, headers
+
+        return 200, {
+            'timezone':
+            'UTC',
+            'serverTime':
+            int(time.time() * 1000),
+            'symbols': [{
+                'symbol': symbol,
+                'pair': symbol,
+                'contractType': 'PERPETUAL',
+                'status': 'TRADING',
+                'baseAsset': market.get_base_asset(symbol),
+                'quoteAsset': 'USDT',
+                'marginAsset': 'USDT',
+                'onboardDate': market.listing_times[symbol],
+            } for symbol in market.pairs]
+        }, headers
+
+    def binance_klines(self, query):
+        limit = get_query_limit(query, 'limit', BINANCE_KLINES_LIMITS)
+        rate_limited, headers = self.binance_acquire(
+            get_binance_candlestick_request_weight(limit))
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['binance']
+        symbol = query.get('symbol', [''])[0]
+        interval = query.get('interval', [''])[0]
+
+        if symbol not in market.listing_times:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, headers
+
+        if interval not in BINANCE_INTERVAL_SECONDS:
+            return 400, {'code': -1120, 'msg': 'Invalid interval.'}, headers
+
+        interval_ms = BINANCE_INTERVAL_SECONDS[interval] * 1000
+        candlesticks = market.get_candlesticks(symbol, interval,
+                                               get_query_int(query, 'endTime'),
+                                               limit)
+
+        return 200, [[
+            int(open_time),
+            format_number(open_price),
+            format_number(high_price),
+            format_number(low_price),
+            format_number(close_price),
+            format_number(quote_volume / close_price),
+            int(open_time) + interval_ms - 1,
+            format_number(quote_volume), 1000,
+            format_number(quote_volume / close_price / 2),
+            format_number(quote_volume / 2), '0'
+        ] for open_time, open_price, high_price, low_price, close_price,
+                     quote_volume in zip(*candlesticks.values())], headers
+
+    def binance_ticker(self, query):
+        rate_limited, headers = self.binance_acquire(BINANCE_TICKER_WEIGHT)
+
+        if rate_limited:
+            return rate_limited
+
+        return 200, [{
+            'symbol':
+            symbol,
+            'priceChange':
+            format_number(close_price - open_price),
+            'priceChangePercent':
+            '{:.3f}'.format((close_price - open_price) / open_price * 100),
+            'lastPrice':
+            format_number(close_price),
+            'openPrice':
+            format_number(open_price),
+            'highPrice':
+            format_number(high_price),
+            'lowPrice':
+            format_number(low_price),
+            'volume':
+            format_number(quote_volume / close_price),
+            'quoteVolume':
+            format_number(quote_volume),
+        } for symbol, open_price, high_price, low_price, close_price,
+                     quote_volume in self.markets['binance'].get_tickers()
+                     ], headers
+
+    def okx_rate_limited(self, endpoint):
+        retry_after = self.acquire('okx/' + endpoint)
+
+        if retry_after is None:
+            return None
+
+        return self.rate_limited(
+            {
+                'code': '50011',
+                'msg': 'Too Many Requests',
+                'data': []
+            }, retry_after)
+
+    def okx_instruments(self, query):
+        rate_limited = self.okx_rate_limited('instruments')
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['okx']
+
+        return 200, {
+            'code':
+            '0',
+            'msg':
+            '',
+            'data': [{
+                'instType': 'SWAP',
+                'instId': symbol,
+                'uly': symbol[:-len('-SWAP')],
+                'settleCcy': 'USDT',
+                'ctType': 'linear',
+                'state': 'live',
+                'listTime': str(market.listing_times[symbol]),
+            } for symbol in market.pairs]
+        }, {}
+
+    def okx_candlesticks(self, query, endpoint, limits, depth=None):
+        rate_limited = self.okx_rate_limited(endpoint)
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['okx']
+        symbol = query.get('instId', [''])[0]
+        interval = query.get('bar', ['1m'])[0]
+
+        if symbol not in market.listing_times:
+            return 200, {
+                'code': '51001',
+                'msg': "Instrument ID doesn't exist.",
+                'data': []
+            }, {}
+
+        if interval not in OKX_INTERVAL_SECONDS:
+            return 200, {
+                'code': '51000',
+                'msg': 'Parameter bar error',
+                'data': []
+            }, {}
+
+        # after returns candlesticks opened strictly before it
+        after = get_query_int(query, 'after')
+        end_time = None if after is None else after - 1
+
+        candlesticks = market.get_candlesticks(
+            symbol, interval, end_time,
+            get_query_limit(query, 'limit', limits), depth)
+        interval_ms = OKX_INTERVAL_SECONDS[interval] * 1000
+        now = time.time() * 1000
+
+        return 200, {
+            'code':
+            '0',
+            'msg':
+            '',
+            'data': [[
+                str(open_time),
+                format_number(open_price),
+                format_number(high_price),
+                format_number(low_price),
+                format_number(close_price),
+                format_number(quote_volume / close_price),
+                format_number(quote_volume / close_price),
+                format_number(quote_volume),
+                '0' if open_time + interval_ms > now else '1'
+            ] for open_time, open_price, high_price, low_price, close_price,
+                     quote_volume in zip(*candlesticks.values())][::-1]
+        }, {}
+
+    def okx_candles(self, query):
+        return self.okx_candlesticks(query, 'candles', OKX_CANDLES_LIMITS,
+                                     OKX_CANDLES_DEPTH)
+
+    def okx_history_candles(self, query):
+        return self.okx_candlesticks(query, 'history-candles',
+                                     OKX_HISTORY_CANDLES_LIMITS)
+
+    def okx_tickers(self, query):
+        rate_limited = self.okx_rate_limited('tickers')
+
+        if rate_limited:
+            return rate_limited
+
+        return 200, {
+            'code':
+            '0',
+            'msg':
+            '',
+            'data': [{
+                'instType': 'SWAP',
+                'instId': symbol,
+                'last': format_number(close_price),
+                'open24h': format_number(open_price),
+                'high24h': format_number(high_price),
+                'low24h': format_number(low_price),
+                'vol24h': format_number(quote_volume / close_price),
+                'volCcy24h': format_number(quote_volume),
+            } for symbol, open_price, high_price, low_price, close_price,
+                     quote_volume in self.markets['okx'].get_tickers()]
+        }, {}
+
+    def bybit_rate_limited(self):
+        retry_after = self.acquire('bybit')
+
+        if retry_after is None:
+            return None
+
+        return self.rate_limited(
+            {
+                'retCode': 10006,
+                'retMsg': 'Too many visits!',
+                'result': {}
+            }, retry_after)
+
+    def bybit_instruments_info(self, query):
+        rate_limited = self.bybit_rate_limited()
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['bybit']
+        limit = get_query_limit(query, 'limit', BYBIT_INSTRUMENTS_LIMITS)
+        cursor = query.get('cursor', ['0'])[0]
+        offset = int(cursor) if cursor.isdigit() else 0
+        symbols = market.pairs[offset:offset + limit]
+        next_offset = offset + len(symbols)
+
+        return 200, {
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {
+                'category':
+                'linear',
+                'list': [{
+                    'symbol': symbol,
+                    'contractType': 'LinearPerpetual',
+                    'status': 'Trading',
+                    'baseCoin': market.get_base_asset(symbol),
+                    'quoteCoin': 'USDT',
+                    'launchTime': str(market.listing_times[symbol]),
+                } for symbol in symbols],
+                'nextPageCursor':
+                str(next_offset) if next_offset < len(market.pairs) else '',
+            }
+        }, {}
+
+    def bybit_kline(self, query):
+        rate_limited = self.bybit_rate_limited()
+
+        if rate_limited:
+            return rate_limited
+
+        market = self.markets['bybit']
+        symbol = query.get('symbol', [''])[0]
+        interval = query.get('interval', [''])[0]
+
+        if symbol not in market.listing_times:
+            return 200, {
+                'retCode': 10001,
+                'retMsg': 'Not supported symbols',
+                'result': {}
+            }, {}
+
+        if interval not in BYBIT_INTERVAL_SECONDS:
+            return 200, {
+                'retCode': 10001,
+                'retMsg': 'Invalid period!',
+                'result': {}
+            }, {}
+
+        candlesticks = market.get_candlesticks(
+            symbol, interval, get_query_int(query, 'end'),
+            get_query_limit(query, 'limit', BYBIT_KLINE_LIMITS))
+
+        return 200, {
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {
+                'symbol':
+                symbol,
+                'category':
+                'linear',
+                'list':
+                [[
+                    str(open_time),
+                    format_number(open_price),
+                    format_number(high_price),
+                    format_number(low_price),
+                    format_number(close_price),
+                    format_number(quote_volume / close_price),
+                    format_number(quote_volume)
+                ]
+                 for open_time, open_price, high_price, low_price, close_price,
+                 quote_volume in zip(*candlesticks.values())][::-1]
+            }
+        }, {}
+
+    def bybit_tickers(self, query):
+        rate_limited = self.bybit_rate_limited()
+
+        if rate_limited:
+            return rate_limited
+
+        return 200, {
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {
+                'category':
+                'linear',
+                'list': [{
+                    'symbol':
+                    symbol,
+                    'lastPrice':
+                    format_number(close_price),
+                    'prevPrice24h':
+                    format_number(open_price),
+                    'price24hPcnt':
+                    '{:.4f}'.format((close_price - open_price) / open_price),
+                    'highPrice24h':
+                    format_number(high_price),
+                    'lowPrice24h':
+                    format_number(low_price),
+                    'volume24h':
+                    format_number(quote_volume / close_price),
+                    'turnover24h':
+                    format_number(quote_volume),
+                } for symbol, open_price, high_price, low_price, close_price,
+                         quote_volume in self.markets['bybit'].get_tickers()]
+            }
+        }, {}
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """
+    Dispatches GET requests to the endpoint handlers of the ReplayServer.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        route = server.routes.get(url.path)
+
+        latency = server.latency + server.random.uniform(
+            0, server.latency_jitter)
+
+        if latency > 0:
+            time.sleep(latency)
+
+        if route is None:
+            status_code, body, headers = 404, {'msg': 'Not Found'}, {}
+        elif server.random.random() < server.error_rate:
+            status_code, body, headers = 503, {
+                'msg': 'Service Unavailable'
+            }, {}
+        else:
+            try:
+                status_code, body, headers = route(parse_qs(url.query))
+            except ValueError as e:
+                status_code, body, headers = 400, {'msg': str(e)}, {}
+
+        server.count_request(url.path, status_code)
+        self.send_json(status_code, body, headers)
+
+    def send_json(self, status_code, body, headers):
+        content = json.dumps(body).encode()
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_replay_server(host=DEFAULT_REPLAY_HOST, port=0, **config):
+    """
+    Start a replay server in a background thread. port 0 picks a free port,
+    which can be read from server.base_url. Stop it with server.shutdown().
+    """
+
+    server = ReplayServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def use_replay_server(base_url, cexes=None):
+    """
+    Send the requests of the given CEXes (all registered CEXes by default)
+    to a replay server.
+    """
+
+    for cex in cexes or get_available_cexes():
+        get_adapter(cex).set_base_url(base_url)
+
+
+def record_fixtures(fixtures_dir, cex, interval, limit, pairs=None):
+    """
+    Record the pair list and the latest candlesticks of a CEX as fixtures
+    for the replay server.
+    """
+
+    adapter = get_adapter(cex)
+
+    if adapter is None:
+        print('\nInvalid CEX.\n')
+        return
+
+    cex_interval = adapter.resolve_interval(interval)
+
+    if cex_interval is None:
+        print('\nInvalid interval.\n')
+        return
+
+    all_pairs = adapter.get_pairs()
+
+    if pairs is None:
+        pairs = all_pairs
+
+    interval_dir = os.path.join(fixtures_dir, adapter.name, cex_interval)
+    os.makedirs(interval_dir, exist_ok=True)
+
+    with open(os.path.join(fixtures_dir, adapter.name, 'pairs.json'),
+              'w') as f:
+        json.dump(all_pairs, f)
+
+    for pair in pairs:
+        try:
+            candlestick_data = adapter.get_candlestick_page(
+                pair, cex_interval, '',
+                min(int(limit), adapter.max_request_limit))
+        except (CexApiError, ValueError) as e:
+            print('\n{}'.format(e))
+            continue
+
+        with open(os.path.join(interval_dir, '{}.json'.format(pair)),
+                  'w') as f:
+            json.dump(candlestick_data, f)
+
+        print('\nRecorded {} candlesticks of pair {} from {}.'.format(
+            len(candlestick_data), pair, cex.capitalize()))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Replay the CEX APIs from a local server')
+
+    parser.add_argument('--host',
+                        type=str,
+                        default=DEFAULT_REPLAY_HOST,
+                        help='Host to listen on')
+    parser.add_argument('--port',
+                        type=int,
+                        default=DEFAULT_REPLAY_PORT,
+                        help='Port to listen on')
+    parser.add_argument('--symbols',
+                        type=int,
+                        default=DEFAULT_SYMBOL_COUNT,
+                        help='No. of synthetic pairs per CEX')
+    parser.add_argument('--fixtures-dir',
+                        type=str,
+                        default=None,
+                        help='Directory of recorded fixtures')
+    parser.add_argument('--latency',
+                        type=float,
+                        default=0,
+                        help='Seconds added to every response')
+    parser.add_argument('--latency-jitter',
+                        type=float,
+                        default=0,
+                        help='Max. random seconds added to the latency')
+    parser.add_argument('--error-rate',
+                        type=float,
+                        default=0,
+                        help='Fraction of requests answered with a 503 error')
+    parser.add_argument('--no-rate-limits',
+                        action='store_true',
+                        help='Do not enforce the rate limits of the CEXes')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=None,
+                        help='Seed of the latency and error injection')
+    parser.add_argument('--verbose',
+                        action='store_true',
+                        help='Log every request')
+    parser.add_argument(
+        '--record',
+        type=str,
+        default=None,
+        help='Record fixtures from a CEX into --fixtures-dir instead of serving'
+    )
+    parser.add_argument('-i',
+                        '--interval',
+                        type=str,
+                        default='1d',
+                        help='Candlestick interval to record')
+    parser.add_argument('-l',
+                        '--limit',
+                        type=int,
+                        default=1500,
+                        help='No. of candlesticks to record per pair')
+
+    args = parser.parse_args()
+
+    if args.record:
+        if args.fixtures_dir is None:
+            print('\n--fixtures-dir is required to record fixtures.\n')
+        else:
+            record_fixtures(args.fixtures_dir, args.record, args.interval,
+                            args.limit)
+    else:
+        server = ReplayServer((args.host, args.port),
+                              symbol_count=args.symbols,
+                              fixtures_dir=args.fixtures_dir,
+                              latency=args.latency,
+                              latency_jitter=args.latency_jitter,
+                              error_rate=args.error_rate,
+                              rate_limits=not args.no_rate_limits,
+                              seed=args.seed,
+                              verbose=args.verbose)
+
+        print('\nReplaying CEX APIs on {}. Press Ctrl+C to stop.'.format(
+            server.base_url))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        print('\nResponses per endpoint and status code:')
+
+        for path, path_stats in sorted(server.get_stats().items()):
+            print('{}: {}'.format(path, path_stats))
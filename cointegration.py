@@ -0,0 +1,983 @@
+import os
+import hashlib
+import time
+import sqlite3
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from statsmodels.tsa.stattools import coint
+from statsmodels.tsa.adfvalues import mackinnonp
+from result_cache import result_cache_config
+'''
+Cointegration scan of all pairs of a set of time series.
+
+Every pair of series is tested with the Engle-Granger test. The batched
+method runs the test of coint for thousands of pairs at once with NumPy: the
+cointegrating regressions of all pairs are fitted from the centered series,
+the ADF lag of each residual series is chosen by AIC from one Cholesky
+factorization of its stacked Gram matrix, and the ADF statistics are mapped
+to p-values with the MacKinnon approximation of statsmodels. The statsmodels
+method calls coint for each pair.
+
+The tests are spread over a pool of worker processes in chunks of pairs. The
+close prices are put into shared memory once and every worker maps the same
+matrix, so it is not copied for each chunk or worker.
+
+Pairs can be screened by the correlation of their log returns first, so
+only candidate pairs are tested. The p-values of tested pairs are kept in an
+SQLite database in the result cache directory, keyed by the symbols, the
+date range and a fingerprint of the data of each symbol. A scan with another
+threshold or a few more symbols only tests the pairs it has not seen.
+
+The rolling mode tests pairs in windows sliding over the series with an ADF
+regression of a fixed lag. All regressions of a window are linear
+combinations of the sums of the products of a few series of a pair, e.g. the
+lagged prices and their lagged differences, so these sums are kept as
+running totals and every window is solved from its own sums without
+refitting the series.
+'''
+
+COINTEGRATION_METHODS = ['batch', 'statsmodels']
+
+# Pairs tested per task of a worker process
+COINTEGRATION_CHUNK_SIZES = {'batch': 8192, 'statsmodels': 256}
+
+# Values of the residual series of a batch of pairs
+ENGLE_GRANGER_BATCH_VALUES = 2**20
+
+# Largest absolute difference from the p-values of coint accepted by the
+# tolerance check
+COINTEGRATION_PVALUE_TOLERANCE = 1e-6
+
+PVALUE_CACHE_FILE_NAME = '.cointegration.sqlite'
+
+# The least recently used p-values beyond this number are deleted from the
+# cache, about 8 scans of all pairs of 500 symbols
+PVALUE_CACHE_MAX_ROWS = 1000000
+
+# Values of the running sums of a batch of pairs in rolling windows
+ROLLING_BATCH_VALUES = 2**23
+
+# Engle-Granger statistics the MacKinnon tables are checked with
+MACKINNON_CHECK_STATS = [-20.0, -6.0, -3.5, -2.62, -2.0, -1.0, 0.5, 1.0]
+
+# R-squared limit of coint for (almost) collinear series
+COLLINEAR_RSQUARED = 1 - 100 * np.sqrt(np.finfo(np.float64).eps)
+
+# Close price matrix mapped by a worker process
+worker_state = {}
+
+
+def get_close_matrix(pairs_ts_map, tickers):
+    """
+    Get the close prices of the tickers as a matrix with a column per ticker.
+    """
+
+    if hasattr(pairs_ts_map, 'get_values'):
+        return np.ascontiguousarray(pairs_ts_map.get_values('Close', tickers),
+                                    dtype=np.float64)
+
+    return np.column_stack([
+        pairs_ts_map[ticker]['Close'].values for ticker in tickers
+    ]).astype(np.float64, copy=False)
+
+
+def get_adf_max_lag(nobs):
+    """
+    Get the largest lag of the ADF lag search of adfuller for a series of
+    nobs values.
+    """
+
+    return min(nobs // 2 - 1,
+               int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0))))
+
+
+def get_table_pvalues(stats, tables):
+    """
+    Get the p-values of Engle-Granger statistics from MacKinnon tables, as
+    mackinnonp would.
+    """
+
+    stats = np.asarray(stats, dtype=np.float64)
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        small_pvalues = norm.cdf(np.polyval(tables['small_ps'][::-1], stats))
+        large_pvalues = norm.cdf(np.polyval(tables['large_ps'][::-1], stats))
+
+    pvalues = np.where(stats <= tables['star'], small_pvalues, large_pvalues)
+    pvalues = np.where(stats > tables['max'], 1.0, pvalues)
+
+    return np.where(stats < tables['min'], 0.0, pvalues)
+
+
+def get_mackinnon_tables():
+    """
+    Get the MacKinnon approximation tables of mackinnonp for two series with
+    a constant, or None if statsmodels does not have them as expected. The
+    tables are not public in statsmodels, so they are only used if they give
+    the p-values of mackinnonp.
+    """
+
+    try:
+        from statsmodels.tsa import adfvalues
+
+        tables = {
+            'max': adfvalues._tau_maxs['c'][1],
+            'min': adfvalues._tau_mins['c'][1],
+            'star': adfvalues._tau_stars['c'][1],
+            'small_ps': np.asarray(adfvalues._tau_smallps['c'][1]),
+            'large_ps': np.asarray(adfvalues._tau_largeps['c'][1]),
+        }
+
+        expected_pvalues = [
+            mackinnonp(stat, regression='c', N=2)
+            for stat in MACKINNON_CHECK_STATS
+        ]
+
+        if np.allclose(get_table_pvalues(MACKINNON_CHECK_STATS, tables),
+                       expected_pvalues,
+                       rtol=1e-12,
+                       atol=0):
+            return tables
+    except (ImportError, AttributeError, LookupError, TypeError, ValueError):
+        pass
+
+    return None
+
+
+def get_mackinnon_pvalues(stats):
+    """
+    Get the p-values of Engle-Granger statistics of two series with a
+    constant, as mackinnonp of statsmodels would. mackinnonp is called for
+    each statistic if its tables cannot be used.
+    """
+
+    if mackinnon_tables is None:
+        get_pvalues = np.vectorize(
+            lambda stat: mackinnonp(stat, regression='c', N=2),
+            otypes=[np.float64])
+
+        return get_pvalues(np.asarray(stats, dtype=np.float64))
+
+    return get_table_pvalues(stats, mackinnon_tables)
+
+
+mackinnon_tables = get_mackinnon_tables()
+
+
+def get_adf_normal_equations(residuals, lag):
+    """
+    Get the Gram matrices and moments of the ADF regressions of series in
+    rows on the lagged level and lag lagged differences, the sums of squared
+    differences they explain and the number of observations, on the sample
+    adfuller uses for that lag.
+    """
+
+    differences = np.diff(residuals, axis=1)
+    length = differences.shape[1]
+    levels = residuals[:, lag:length]
+
+    # Sums of products of the level and the differences at t - a over the
+    # sample, with a = 0 for the explained differences at index 1 and a > 0
+    # for the lagged differences after it
+    sums = np.empty((len(residuals), lag + 2, lag + 2))
+    sums[:, 0, 0] = np.einsum('ij,ij->i', levels, levels)
+
+    for k in range(lag + 1):
+        sums[:, 0, k + 1] = np.einsum('ij,ij->i', levels,
+                                      differences[:, lag - k:length - k])
+
+        # The sums of the products of differences k apart are the same dot
+        # product for every a, less the few products outside each window
+        span = lag - k
+        total = np.einsum('ij,ij->i', differences[:, k:],
+                          differences[:, :length - k])
+        head_products = differences[:, k:lag] * differences[:, :span]
+        tail_start = length - span
+        tail_products = np.multiply(differences[:, tail_start:],
+                                    differences[:, tail_start - k:length - k])
+        head_sums = np.cumsum(np.pad(head_products, ((0, 0), (1, 0))), axis=1)
+        tail_sums = np.cumsum(np.pad(tail_products[:, ::-1], ((0, 0), (1, 0))),
+                              axis=1)
+        a = np.arange(span + 1)
+        sums[:, a + 1,
+             a + k + 1] = total[:, None] - head_sums[:, ::-1] - tail_sums
+
+    upper = np.triu_indices(lag + 2, 1)
+    sums[:, upper[1], upper[0]] = sums[:, upper[0], upper[1]]
+
+    regressors = [0] + list(range(2, lag + 2))
+    gram = sums[:, regressors][:, :, regressors]
+
+    return gram, sums[:, regressors, 1], sums[:, 1, 1], length - lag
+
+
+def get_scaled_normal_equations(gram, moments):
+    """
+    Get the Gram matrices and moments of stacked regressions with the
+    regressors scaled to unit length, and the scales.
+    """
+
+    scales = np.sqrt(np.diagonal(gram, axis1=1, axis2=2))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gram = gram / scales[:, :, None] / scales[:, None, :]
+        moments = moments / scales
+
+    return gram, moments, scales
+
+
+def get_adf_lags(residuals, max_lag):
+    """
+    Get the ADF lag of each series in rows with the smallest AIC, searched
+    from 0 to max_lag on a common sample as adfuller does.
+    """
+
+    gram, moments, target_squares, nobs = get_adf_normal_equations(
+        residuals, max_lag)
+    gram, moments, _ = get_scaled_normal_equations(gram, moments)
+
+    # The sums of squared residuals of the regressions on the first k
+    # regressors all follow from one Cholesky factorization
+    projections = np.linalg.solve(np.linalg.cholesky(gram),
+                                  moments[:, :, None])[:, :, 0]
+    ssrs = target_squares[:, None] - np.cumsum(projections**2, axis=1)
+    aics = nobs * np.log(np.maximum(
+        ssrs,
+        np.finfo(np.float64).tiny)) + 2 * np.arange(1, max_lag + 2)
+
+    # The first minimum is the smallest lag, as in adfuller
+    return np.argmin(aics, axis=1)
+
+
+def get_adf_tvalues(gram, moments, target_squares, nobs, invert=np.linalg.inv):
+    """
+    Get the t-value of the lagged level of stacked ADF regressions from
+    their Gram matrices, moments and sums of squared explained differences.
+    """
+
+    gram, moments, _ = get_scaled_normal_equations(gram, moments)
+    inverse = invert(gram)
+    coefs = np.matmul(inverse, moments[:, :, None])[:, :, 0]
+    variances = (target_squares - np.einsum('ij,ij->i', coefs, moments)) / (
+        nobs - gram.shape[1])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return coefs[:, 0] / np.sqrt(variances * inverse[:, 0, 0])
+
+
+def get_batch_adf_stats(residuals):
+    """
+    Get the ADF statistic without constant of each series in rows, with the
+    lag chosen by AIC.
+    """
+
+    lags = get_adf_lags(residuals, get_adf_max_lag(residuals.shape[1]))
+    stats = np.empty(len(residuals))
+
+    for lag in np.unique(lags):
+        selected = lags == lag
+        gram, moments, target_squares, nobs = get_adf_normal_equations(
+            residuals[selected], lag)
+        stats[selected] = get_adf_tvalues(gram, moments, target_squares, nobs)
+
+    return stats
+
+
+def get_adf_stats(residuals):
+    """
+    Get the ADF statistic of each series in rows, or NaN for the series
+    whose regressions are singular.
+    """
+
+    try:
+        return get_batch_adf_stats(residuals)
+    except np.linalg.LinAlgError:
+        if len(residuals) == 1:
+            return np.array([np.nan])
+
+    return np.concatenate(
+        [get_adf_stats(residuals[i:i + 1]) for i in range(len(residuals))])
+
+
+def get_engle_granger_stats(centered_data, rows, columns):
+    """
+    Get the Engle-Granger statistic of each pair of columns rows[k] and
+    columns[k] of a matrix with centered columns, as coint would: -inf for
+    collinear columns, inf for a constant rows[k] column and NaN where the
+    regressions are singular.
+    """
+
+    y = centered_data[:, rows].T
+    x = centered_data[:, columns].T
+    x_squares = np.einsum('ij,ij->i', x, x)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        betas = np.where(x_squares > 0,
+                         np.einsum('ij,ij->i', x, y) / x_squares, 0.0)
+        residuals = y - betas[:, None] * x
+        rsquared = 1 - np.einsum('ij,ij->i', residuals, residuals) / np.einsum(
+            'ij,ij->i', y, y)
+
+    # A constant series is not cointegrated with any series
+    stats = np.where(np.isnan(rsquared), np.inf, -np.inf)
+    testable = rsquared < COLLINEAR_RSQUARED
+
+    if testable.any():
+        stats[testable] = get_adf_stats(residuals[testable])
+
+    return stats
+
+
+def get_batch_pvalues(close_data, pair_chunk):
+    """
+    Get the cointegration p-value of each (i, j) column pair of a chunk with
+    the batched Engle-Granger test. The pairs it cannot test are tested by
+    coint.
+    """
+
+    rows, columns = (np.asarray(indices) for indices in zip(*pair_chunk))
+    batch_size = max(1, ENGLE_GRANGER_BATCH_VALUES // close_data.shape[0])
+    centered_data = close_data - close_data.mean(axis=0)
+
+    stats = np.concatenate([
+        get_engle_granger_stats(centered_data, rows[i:i + batch_size],
+                                columns[i:i + batch_size])
+        for i in range(0, len(rows), batch_size)
+    ])
+    pvalues = get_mackinnon_pvalues(stats)
+
+    for k in np.flatnonzero(np.isnan(stats)):
+        pvalues[k] = coint(close_data[:, rows[k]], close_data[:,
+                                                              columns[k]])[1]
+
+    return pvalues.tolist()
+
+
+def test_pair_chunk(close_data, pair_chunk, method='batch'):
+    """
+    Get the cointegration p-value of each (i, j) column pair of a chunk.
+    """
+
+    if method == 'batch':
+        return get_batch_pvalues(close_data, pair_chunk)
+
+    return [
+        coint(close_data[:, i], close_data[:, j])[1] for i, j in pair_chunk
+    ]
+
+
+def check_batch_pvalues(close_data,
+                        sample_size=100,
+                        tolerance=COINTEGRATION_PVALUE_TOLERANCE,
+                        seed=0):
+    """
+    Compare the batched p-values of a random sample of column pairs with the
+    p-values of coint. Prints the pairs that differ by more than tolerance
+    and returns the largest absolute difference.
+    """
+
+    n = close_data.shape[1]
+    pair_count = n * (n - 1) // 2
+    rng = np.random.default_rng(seed)
+    sample = set(
+        rng.choice(pair_count, min(sample_size, pair_count),
+                   replace=False).tolist())
+    # coint cannot test a constant first series
+    constant = np.ptp(close_data, axis=0) == 0
+    pair_sample = [(i, j) for k, (i, j) in enumerate(combinations(range(n), 2))
+                   if k in sample and not constant[i]]
+
+    if not pair_sample:
+        return 0.0
+
+    differences = np.abs(
+        np.subtract(test_pair_chunk(close_data, pair_sample, 'batch'),
+                    test_pair_chunk(close_data, pair_sample, 'statsmodels')))
+
+    for (i, j), difference in zip(pair_sample, differences):
+        if difference > tolerance:
+            print('\nThe batched p-value of columns {} and {} differs from '
+                  'coint by {}.'.format(i, j, difference))
+
+    return float(differences.max())
+
+
+def init_worker(shared_memory_name, shape, dtype):
+    shared_close = shared_memory.SharedMemory(name=shared_memory_name)
+
+    worker_state['shared_memory'] = shared_close
+    worker_state['close_data'] = np.ndarray(shape,
+                                            dtype=dtype,
+                                            buffer=shared_close.buf)
+
+
+def test_shared_pair_chunk(pair_chunk, method):
+    return test_pair_chunk(worker_state['close_data'], pair_chunk, method)
+
+
+def get_cointegration_method(method):
+    """
+    Get a valid cointegration method, batch if method is invalid.
+    """
+
+    if method not in COINTEGRATION_METHODS:
+        print('\nInvalid cointegration method: {}. Choose from {}. Using '
+              'batch.'.format(method, COINTEGRATION_METHODS))
+        return 'batch'
+
+    return method
+
+
+def get_pvalue_matrix(close_data,
+                      workers=None,
+                      chunk_size=None,
+                      verbose=True,
+                      method='batch',
+                      pair_list=None):
+    """
+    Get the cointegration p-values of all column pairs of a matrix, or the
+    (i, j) pairs of pair_list, as an n x n matrix with the p-value of columns
+    i < j at [i, j] and ones elsewhere. Pairs are tested by workers
+    processes, all CPUs by default.
+    """
+
+    method = get_cointegration_method(method)
+
+    if chunk_size is None:
+        chunk_size = COINTEGRATION_CHUNK_SIZES[method]
+
+    n = close_data.shape[1]
+    pvalue_matrix = np.ones((n, n))
+
+    if pair_list is None:
+        pair_list = list(combinations(range(n), 2))
+
+    pair_chunks = [
+        pair_list[i:i + chunk_size]
+        for i in range(0, len(pair_list), chunk_size)
+    ]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    tested_count = 0
+
+    if workers <= 1 or len(pair_chunks) <= 1:
+        for pair_chunk in pair_chunks:
+            rows, columns = zip(*pair_chunk)
+            pvalue_matrix[rows,
+                          columns] = test_pair_chunk(close_data, pair_chunk,
+                                                     method)
+            tested_count += len(pair_chunk)
+
+            if verbose:
+                print('Tested {}/{} pairs for cointegration.'.format(
+                    tested_count, len(pair_list)))
+
+        return pvalue_matrix
+
+    shared_close = shared_memory.SharedMemory(create=True,
+                                              size=max(close_data.nbytes, 1))
+
+    try:
+        np.ndarray(close_data.shape,
+                   dtype=close_data.dtype,
+                   buffer=shared_close.buf)[:] = close_data
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(pair_chunks)),
+                                 initializer=init_worker,
+                                 initargs=(shared_close.name, close_data.shape,
+                                           close_data.dtype)) as executor:
+            futures = {
+                executor.submit(test_shared_pair_chunk, pair_chunk, method):
+                pair_chunk
+                for pair_chunk in pair_chunks
+            }
+
+            for future in as_completed(futures):
+                pair_chunk = futures[future]
+                rows, columns = zip(*pair_chunk)
+                pvalue_matrix[rows, columns] = future.result()
+                tested_count += len(pair_chunk)
+
+                if verbose:
+                    print('Tested {}/{} pairs for cointegration.'.format(
+                        tested_count, len(pair_list)))
+
+    finally:
+        shared_close.close()
+        shared_close.unlink()
+
+    return pvalue_matrix
+
+
+def get_return_correlations(close_data):
+    """
+    Get the correlation matrix of the log returns of the columns of a price
+    matrix, with NaN for constant columns.
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.diff(np.log(close_data), axis=0)
+        returns = returns - returns.mean(axis=0)
+        norms = np.sqrt(np.einsum('ij,ij->j', returns, returns))
+        normalized = returns / norms
+
+    return normalized.T @ normalized
+
+
+def get_candidate_pairs(close_data, min_correlation=None):
+    """
+    Get the (i, j) column pairs with i < j whose log returns have a
+    correlation of at least min_correlation, or all pairs if it is None.
+    """
+
+    n = close_data.shape[1]
+
+    if min_correlation is None:
+        return list(combinations(range(n), 2))
+
+    rows, columns = np.nonzero(
+        np.triu(get_return_correlations(close_data) >= min_correlation, 1))
+
+    return list(zip(rows.tolist(), columns.tolist()))
+
+
+def get_series_fingerprints(index, close_data):
+    """
+    Get a hash of the index and the values of each column of a price matrix.
+    """
+
+    index_digest = hashlib.blake2b(digest_size=16)
+    index_digest.update(np.ascontiguousarray(np.asarray(index)).tobytes())
+    fingerprints = []
+
+    for i in range(close_data.shape[1]):
+        digest = index_digest.copy()
+        digest.update(np.ascontiguousarray(close_data[:, i]).tobytes())
+        fingerprints.append(digest.hexdigest())
+
+    return fingerprints
+
+
+def connect_pvalue_cache():
+    """
+    Open the cointegration p-value cache, creating it if needed.
+    """
+
+    os.makedirs(result_cache_config['dir_path'], exist_ok=True)
+
+    connection = sqlite3.connect(
+        os.path.join(result_cache_config['dir_path'], PVALUE_CACHE_FILE_NAME))
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS pvalues (
+            symbol_y TEXT NOT NULL,
+            symbol_x TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            fingerprint_y TEXT NOT NULL,
+            fingerprint_x TEXT NOT NULL,
+            method TEXT NOT NULL,
+            p_value REAL NOT NULL,
+            used_ms INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (symbol_y, symbol_x, start_time, end_time,
+                         fingerprint_y, fingerprint_x, method)
+        )''')
+
+    # Caches written before the p-values recorded their last use get the
+    # column, and their p-values are the first to be deleted
+    table_columns = [
+        row[1] for row in connection.execute('PRAGMA table_info(pvalues)')
+    ]
+
+    if 'used_ms' not in table_columns:
+        with connection:
+            connection.execute('ALTER TABLE pvalues ADD COLUMN used_ms '
+                               'INTEGER NOT NULL DEFAULT 0')
+
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS pvalues_range
+        ON pvalues (start_time, end_time, method)''')
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS pvalues_used ON pvalues (used_ms)''')
+
+    return connection
+
+
+def load_cached_pvalues(date_range, method):
+    """
+    Get the cached p-values of a date range and method by (symbol_y,
+    symbol_x, fingerprint_y, fingerprint_x), and record that they were used.
+    """
+
+    if not result_cache_config['enabled'] or not os.path.exists(
+            os.path.join(result_cache_config['dir_path'],
+                         PVALUE_CACHE_FILE_NAME)):
+        return {}
+
+    try:
+        connection = connect_pvalue_cache()
+
+        try:
+            rows = connection.execute(
+                '''SELECT symbol_y, symbol_x, fingerprint_y, fingerprint_x,
+                   p_value FROM pvalues
+                   WHERE start_time = ? AND end_time = ? AND method = ?''',
+                (*date_range, method)).fetchall()
+
+            with connection:
+                connection.execute(
+                    '''UPDATE pvalues SET used_ms = ?
+                       WHERE start_time = ? AND end_time = ? AND method = ?''',
+                    (time.time_ns() // 1000000, *date_range, method))
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print('\nUnable to load the cached p-values: {}'.format(e))
+        return {}
+
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def save_cached_pvalues(date_range, method, records):
+    """
+    Cache the p-values of (symbol_y, symbol_x, fingerprint_y, fingerprint_x,
+    p_value) records of a date range and method, then delete the least
+    recently used p-values beyond PVALUE_CACHE_MAX_ROWS.
+    """
+
+    if not result_cache_config['enabled'] or not records:
+        return
+
+    try:
+        connection = connect_pvalue_cache()
+
+        try:
+            with connection:
+                used_ms = time.time_ns() // 1000000
+                connection.executemany(
+                    '''INSERT OR REPLACE INTO pvalues (symbol_y, symbol_x,
+                       start_time, end_time, fingerprint_y, fingerprint_x,
+                       method, p_value, used_ms)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    [(symbol_y, symbol_x, *date_range, fingerprint_y,
+                      fingerprint_x, method, p_value, used_ms)
+                     for symbol_y, symbol_x, fingerprint_y, fingerprint_x,
+                     p_value in records])
+
+                row_count = connection.execute(
+                    'SELECT COUNT(*) FROM pvalues').fetchone()[0]
+
+                if row_count > PVALUE_CACHE_MAX_ROWS:
+                    connection.execute(
+                        '''DELETE FROM pvalues WHERE rowid IN (
+                           SELECT rowid FROM pvalues ORDER BY used_ms
+                           LIMIT ?)''', (row_count - PVALUE_CACHE_MAX_ROWS, ))
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print('\nUnable to cache the p-values: {}'.format(e))
+
+
+def clear_pvalue_cache():
+    """
+    Delete all cached cointegration p-values.
+    """
+
+    file_path = os.path.join(result_cache_config['dir_path'],
+                             PVALUE_CACHE_FILE_NAME)
+
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def get_panel_index(pairs_ts_map, tickers):
+    if hasattr(pairs_ts_map, 'index'):
+        return pairs_ts_map.index
+
+    return pairs_ts_map[tickers[0]].index
+
+
+def find_cointegrated_pairs(pairs_ts_map,
+                            p_value_threshold=0.2,
+                            workers=None,
+                            chunk_size=None,
+                            verbose=True,
+                            method='batch',
+                            check_tolerance=False,
+                            min_correlation=None,
+                            use_cache=True):
+    """
+    Find cointegrated pairs of cryptocurrencies based on the Engle-Granger
+    test, in parallel.
+    Parameters:
+    - pairs_ts_map (dict): A dictionary where keys are cryptocurrency tickers and values are time series data, e.g. the SanitizedPanel of sanitize_data.
+    - p_value_threshold (float): The significance level for cointegration testing.
+    - workers (int): The number of worker processes. All CPUs are used by default, and the pairs are tested in this process if it is 1.
+    - chunk_size (int): The number of pairs tested per task of a worker process, by default 8192 for the batch method and 256 for the statsmodels method.
+    - verbose (bool): Set to True to print the progress.
+    - method (str): 'batch' to test the pairs in batches with NumPy, or 'statsmodels' to test each pair with coint of statsmodels.
+    - check_tolerance (bool): Set to True to compare the batched p-values of a sample of pairs with coint first.
+    - min_correlation (float): Only test the pairs whose log returns have a correlation of at least min_correlation. The other pairs get a p-value of 1. All pairs are tested if it is None.
+    - use_cache (bool): Set to False to test all pairs again instead of loading the p-values of pairs tested before on the same data.
+    Returns:
+    - pvalue_matrix (numpy.ndarray): A matrix of cointegration p-values between cryptocurrency pairs.
+    - pairs (list): A list of tuples representing cointegrated cryptocurrency pairs and their p-values.
+    """
+
+    method = get_cointegration_method(method)
+    tickers = list(pairs_ts_map.keys())
+    close_data = get_close_matrix(pairs_ts_map, tickers)
+
+    if check_tolerance and method == 'batch':
+        max_difference = check_batch_pvalues(close_data)
+
+        if verbose:
+            print('Largest difference of the batched p-values from coint: {}'.
+                  format(max_difference))
+
+    pair_list = get_candidate_pairs(close_data, min_correlation)
+    pair_count = len(tickers) * (len(tickers) - 1) // 2
+
+    if verbose and min_correlation is not None:
+        print('{}/{} pairs have a return correlation of at least {}.'.format(
+            len(pair_list), pair_count, min_correlation))
+
+    use_cache = use_cache and close_data.size > 0
+    pair_keys = {}
+    cached_pvalues = {}
+
+    if use_cache:
+        index = get_panel_index(pairs_ts_map, tickers)
+        date_range = (str(index[0]), str(index[-1]))
+        fingerprints = get_series_fingerprints(index, close_data)
+        pair_keys = {
+            (i, j): (tickers[i], tickers[j], fingerprints[i], fingerprints[j])
+            for i, j in pair_list
+        }
+        cached_pvalues = load_cached_pvalues(date_range, method)
+
+    untested_pairs = [
+        pair for pair in pair_list if pair_keys.get(pair) not in cached_pvalues
+    ]
+
+    if verbose and len(untested_pairs) < len(pair_list):
+        print('Loaded the cached p-values of {} pairs.'.format(
+            len(pair_list) - len(untested_pairs)))
+
+    pvalue_matrix = get_pvalue_matrix(close_data, workers, chunk_size, verbose,
+                                      method, untested_pairs)
+
+    if use_cache:
+        save_cached_pvalues(
+            date_range, method,
+            [(*pair_keys[i, j], pvalue_matrix[i, j])
+             for i, j in untested_pairs if not np.isnan(pvalue_matrix[i, j])])
+
+        for pair in pair_list:
+            if pair_keys[pair] in cached_pvalues:
+                pvalue_matrix[pair] = cached_pvalues[pair_keys[pair]]
+
+    pairs = [(tickers[i], tickers[j], pvalue_matrix[i, j])
+             for i, j in zip(*np.where(pvalue_matrix < p_value_threshold))]
+
+    return pvalue_matrix, pairs
+
+
+def invert_matrices(matrices):
+    """
+    Invert stacked matrices, with NaN for the singular ones.
+    """
+
+    try:
+        return np.linalg.inv(matrices)
+    except np.linalg.LinAlgError:
+        inverses = np.full(matrices.shape, np.nan)
+
+        for i, matrix in enumerate(matrices):
+            try:
+                inverses[i] = np.linalg.inv(matrix)
+            except np.linalg.LinAlgError:
+                pass
+
+        return inverses
+
+
+def get_window_sums(values, window, starts):
+    """
+    Get the sums of the values of windows of rows starting at starts, from
+    the running totals of the values.
+    """
+
+    totals = np.zeros((len(values) + 1, ) + values.shape[1:])
+    np.cumsum(values, axis=0, out=totals[1:])
+
+    return totals[starts + window] - totals[starts]
+
+
+def get_rolling_pair_stats(centered_data, rows, columns, window, starts,
+                           adf_lag):
+    """
+    Get the Engle-Granger statistic and the hedge ratio of each pair of
+    columns rows[k] and columns[k] in each window of rows starting at starts,
+    as arrays with a row per window and a column per pair.
+    """
+
+    y = centered_data[:, rows]
+    x = centered_data[:, columns]
+
+    # Sums of the cointegrating regressions of y on x and a constant
+    sums = get_window_sums(np.stack((y, x, y * y, x * y, x * x), axis=2),
+                           window, starts)
+    y_means = sums[:, :, 0] / window
+    x_means = sums[:, :, 1] / window
+    y_squares = sums[:, :, 2] - sums[:, :, 0] * y_means
+    xy_products = sums[:, :, 3] - sums[:, :, 1] * y_means
+    x_squares = sums[:, :, 4] - sums[:, :, 1] * x_means
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hedge_ratios = np.where(x_squares > 0, xy_products / x_squares, 0.0)
+        rsquared = 1 - (y_squares - hedge_ratios * xy_products) / y_squares
+
+    # The ADF sample of a window has an explained difference at each of its
+    # rows after the first adf_lag + 1. Its regressions are combinations of
+    # 1, y and x at t - 1 and the differences of y and x at t - k
+    y_differences = np.diff(y, axis=0)
+    x_differences = np.diff(x, axis=0)
+    length = y_differences.shape[0]
+    base_series = [
+        np.ones_like(y[adf_lag:length]), y[adf_lag:length], x[adf_lag:length]
+    ]
+
+    for k in range(adf_lag + 1):
+        base_series += [
+            y_differences[adf_lag - k:length - k],
+            x_differences[adf_lag - k:length - k]
+        ]
+
+    base_series = np.stack(base_series, axis=2)
+    nobs = window - adf_lag - 1
+    upper = np.triu_indices(base_series.shape[2])
+    products = np.empty(
+        (len(starts), len(rows), base_series.shape[2], base_series.shape[2]))
+    products[:, :, upper[0], upper[1]] = get_window_sums(
+        base_series[:, :, upper[0]] * base_series[:, :, upper[1]], nobs,
+        starts)
+    products[:, :, upper[1], upper[0]] = products[:, :, upper[0], upper[1]]
+
+    # Weights of the base series of the lagged residual level, the explained
+    # difference and the lagged differences of the residuals
+    weights = np.zeros(hedge_ratios.shape + (adf_lag + 2, 3 + 2 *
+                                             (adf_lag + 1)))
+    weights[:, :, 0, 0] = hedge_ratios * x_means - y_means
+    weights[:, :, 0, 1] = 1
+    weights[:, :, 0, 2] = -hedge_ratios
+
+    for k in range(adf_lag + 1):
+        weights[:, :, k + 1, 3 + 2 * k] = 1
+        weights[:, :, k + 1, 4 + 2 * k] = -hedge_ratios
+
+    adf_sums = np.matmul(np.matmul(weights, products),
+                         weights.swapaxes(2, 3)).reshape(
+                             (-1, adf_lag + 2, adf_lag + 2))
+    regressors = [0] + list(range(2, adf_lag + 2))
+
+    # A constant series is not cointegrated with any series
+    stats = np.where(np.isnan(rsquared), np.inf, -np.inf)
+    testable = (rsquared < COLLINEAR_RSQUARED).reshape(-1)
+
+    if testable.any():
+        adf_sums = adf_sums[testable]
+        stats.reshape(-1)[testable] = get_adf_tvalues(
+            adf_sums[:, regressors][:, :, regressors],
+            adf_sums[:, regressors, 1], adf_sums[:, 1,
+                                                 1], nobs, invert_matrices)
+
+    return stats, hedge_ratios
+
+
+def get_rolling_cointegration(pairs_ts_map,
+                              window,
+                              step=1,
+                              pairs=None,
+                              adf_lag=1,
+                              verbose=True):
+    """
+    Test pairs of cryptocurrencies for cointegration in windows sliding over
+    their time series, with the Engle-Granger test of coint with a fixed ADF
+    lag.
+    Parameters:
+    - pairs_ts_map (dict): A dictionary where keys are cryptocurrency tickers and values are time series data, e.g. the SanitizedPanel of sanitize_data.
+    - window (int): The number of rows of a window.
+    - step (int): The number of rows between the starts of two windows.
+    - pairs (list): The (y ticker, x ticker) pairs to test. All pairs of tickers are tested if it is None.
+    - adf_lag (int): The number of lagged differences of the ADF regression, as maxlag of coint with autolag=None.
+    - verbose (bool): Set to True to print the progress.
+    Returns:
+    - pvalues (pandas.DataFrame): The cointegration p-value of each pair, in a column per pair, at the last time of each window.
+    - hedge_ratios (pandas.DataFrame): The coefficient of x in the regression of y on x and a constant of each pair and window.
+    """
+
+    tickers = list(pairs_ts_map.keys())
+
+    if pairs is None:
+        pairs = [(tickers[i], tickers[j])
+                 for i, j in combinations(range(len(tickers)), 2)]
+
+    pairs = list(pairs)
+    unknown_tickers = sorted(
+        set(ticker for pair in pairs for ticker in pair) - set(tickers))
+
+    if unknown_tickers:
+        print('\nUnknown tickers: {}'.format(unknown_tickers))
+        return None
+
+    if not tickers:
+        print('\nNo time series to test.')
+        return None
+
+    close_data = get_close_matrix(pairs_ts_map, tickers)
+    row_count = close_data.shape[0]
+
+    if adf_lag < 0 or window - 2 * adf_lag - 2 < 1 or window > row_count:
+        print('\nInvalid window of {} rows for {} rows and an ADF lag of {}. '
+              'The window must have at least {} rows.'.format(
+                  window, row_count, adf_lag, 2 * adf_lag + 3))
+        return None
+
+    starts = np.arange(0, row_count - window + 1, step)
+    ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+    rows = np.array([ticker_index[y] for y, _ in pairs], dtype=np.int64)
+    columns = np.array([ticker_index[x] for _, x in pairs], dtype=np.int64)
+
+    # Centering keeps the running totals of the squared prices small
+    centered_data = close_data - close_data.mean(axis=0)
+    batch_size = max(
+        1, ROLLING_BATCH_VALUES // (row_count * (2 * adf_lag + 5)**2))
+    stats = np.empty((len(starts), len(pairs)))
+    hedge_ratios = np.empty((len(starts), len(pairs)))
+
+    for i in range(0, len(pairs), batch_size):
+        batch = slice(i, i + batch_size)
+        stats[:, batch], hedge_ratios[:, batch] = get_rolling_pair_stats(
+            centered_data, rows[batch], columns[batch], window, starts,
+            adf_lag)
+
+        if verbose:
+            print('Tested {}/{} pairs in {} windows for cointegration.'.format(
+                min(i + batch_size, len(pairs)), len(pairs), len(starts)))
+
+    index = get_panel_index(pairs_ts_map, tickers)[starts + window - 1]
+    pair_columns = pd.MultiIndex.from_tuples(pairs, names=['Y', 'X'])
+    pvalues = pd.DataFrame(get_mackinnon_pvalues(stats),
+                           index=index,
+                           columns=pair_columns)
+    hedge_ratios = pd.DataFrame(hedge_ratios,
+                                index=index,
+                                columns=pair_columns)
+
+    return pvalues, hedge_ratios
@@ -1,21 +1,82 @@
 import os
+import sys
 import argparse
-import shutil
 import pickle
+import shutil
+import json
+import zlib
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 from utils import *
+from downloader import *
+from download_manifest import *
+from catalog import *
+from price_panel import *
+from segment_store import *
+from saved_data_store import *
+from sanitized_panel import *
+from result_cache import *
+from resampler import *
 from cex_api.query_binance_data import *
 from cex_api.query_okx_data import *
 from cex_api.query_bybit_data import *
 
+# Time series files are saved as raw column arrays after a small JSON header
+# with the metadata and the position of every column, so that a subset of
+# the columns can be read without reading the others. Files saved as .pkl are
+# still readable.
+TS_FILE_FORMATS = ['cols', 'pkl']
+TS_COLUMNS_MAGIC = b'TSCOLS1\n'
 
-def save_ts_df(candlestick_data, dir_path, pair):
+# The columns of .cols files are split into partitions of one calendar month
+# (a numpy datetime64 unit), so a date range is read from the partitions it
+# overlaps only
+TS_PARTITION_UNIT = 'M'
+
+ts_file_config = {
+    'file_format': 'cols',
+    'float32': False,
+    'compress': False,
+}
+
+
+def configure_ts_files(file_format=None, float32=None, compress=None):
     """
-    Save time series financial data and associated metadata.
+    Update the format of time series files saved from now on. float32 stores
+    prices and volumes in single precision and compress zlib compresses the
+    columns of .cols files.
+    """
+
+    if file_format is not None:
+        if file_format not in TS_FILE_FORMATS:
+            raise ValueError(
+                'The file format is invalid. Available options: {}.'.format(
+                    ', '.join(TS_FILE_FORMATS)))
+
+        ts_file_config['file_format'] = file_format
+    if float32 is not None:
+        ts_file_config['float32'] = float32
+    if compress is not None:
+        ts_file_config['compress'] = compress
+
+
+def candlestick_data_to_df(candlestick_data):
+    """
+    Convert candlestick data into a time series dataframe.
     """
 
     columns = ["Open Time", "Open", "High", "Low", "Close", "Volume in USDT"]
+
+    if isinstance(candlestick_data, dict):
+        # Columnar candlestick data is already typed
+        df = pd.DataFrame(candlestick_data, columns=columns)
+        df["Open Time"] = pd.to_datetime(df["Open Time"], unit='ms')
+        df = df.sort_values(by='Open Time',
+                            ascending=True).reset_index(drop=True)
+
+        return df
+
     df = pd.DataFrame(candlestick_data, columns=columns)
 
     df["Open"] = pd.to_numeric(df["Open"])
@@ -26,6 +87,17 @@ def save_ts_df(candlestick_data, dir_path, pair):
     df["Open Time"] = pd.to_numeric(df["Open Time"])
     df["Open Time"] = pd.to_datetime(df["Open Time"], unit='ms')
     df = df.sort_values(by='Open Time', ascending=True).reset_index(drop=True)
+
+    return df
+
+
+def write_ts_df(df, dir_path, pair):
+    """
+    Write a time series dataframe and its metadata to a new file. The file is
+    written under a temporary name first and renamed into place, so readers
+    never see a partially written file.
+    """
+
     start_datetime = df.iloc[0]['Open Time']
     end_datetime = df.iloc[-1]['Open Time']
 
@@ -35,14 +107,443 @@ def save_ts_df(candlestick_data, dir_path, pair):
         'end_datetime': end_datetime,
     }
 
-    data_to_save = {'dataframe': df, 'metadata': metadata}
+    file_format = ts_file_config['file_format']
+
+    cached_file_name = '{}_{}_{}.{}'.format(pair, start_datetime, end_datetime,
+                                            file_format)
+    cached_file_path = '{}/{}'.format(dir_path, cached_file_name)
+    temp_file_path = '{}/.{}.tmp'.format(dir_path, cached_file_name)
 
-    cached_file_path = '{}/{}_{}_{}.pkl'.format(dir_path, pair, start_datetime,
-                                                end_datetime)
+    if ts_file_config['float32']:
+        float_columns = df.columns.drop('Open Time')
+        df = df.astype(dict.fromkeys(float_columns, np.float32))
 
     os.makedirs(dir_path, exist_ok=True)
-    with open(cached_file_path, 'wb') as file:
-        pickle.dump(data_to_save, file)
+    with open(temp_file_path, 'wb') as file:
+        if file_format == 'cols':
+            write_ts_columns(file, df, metadata)
+        else:
+            pickle.dump({'dataframe': df, 'metadata': metadata}, file)
+    os.replace(temp_file_path, cached_file_path)
+
+    write_catalog_entries(dir_path, [
+        get_catalog_entry(df, metadata, cached_file_path,
+                          get_dir_interval_seconds(dir_path))
+    ])
+
+    return cached_file_path
+
+
+def write_ts_columns(file, df, metadata):
+    """
+    Write a time series dataframe as one raw array per column and partition,
+    with the open time in ms, after a JSON header with its metadata and the
+    time range and column positions of every partition.
+    """
+
+    open_times = df['Open Time'].to_numpy().astype('datetime64[ms]')
+    columns = {'Open Time': open_times.astype(np.int64)}
+
+    for column in df.columns:
+        if column != 'Open Time':
+            columns[column] = df[column].to_numpy()
+
+    partition_keys = open_times.astype(
+        'datetime64[{}]'.format(TS_PARTITION_UNIT))
+    partition_starts = np.flatnonzero(
+        np.concatenate([[True], partition_keys[1:] != partition_keys[:-1]]))
+    partition_ends = np.append(partition_starts[1:], len(df))
+
+    partition_headers = []
+    column_bytes = []
+    offset = 0
+
+    for partition_start, partition_end in zip(partition_starts,
+                                              partition_ends):
+        column_headers = []
+
+        for column, values in columns.items():
+            values_bytes = np.ascontiguousarray(
+                values[partition_start:partition_end]).tobytes()
+
+            if ts_file_config['compress']:
+                values_bytes = zlib.compress(values_bytes)
+
+            column_headers.append({
+                'name': column,
+                'dtype': values.dtype.str,
+                'offset': offset,
+                'nbytes': len(values_bytes),
+                'compressed': ts_file_config['compress'],
+            })
+            column_bytes.append(values_bytes)
+            offset += len(values_bytes)
+
+        partition_headers.append({
+            'start_ms':
+            int(columns['Open Time'][partition_start]),
+            'end_ms':
+            int(columns['Open Time'][partition_end - 1]),
+            'rows':
+            int(partition_end - partition_start),
+            'columns':
+            column_headers,
+        })
+
+    metadata = dict(metadata,
+                    start_datetime=int(metadata['start_datetime'].value //
+                                       10**6),
+                    end_datetime=int(metadata['end_datetime'].value // 10**6),
+                    volume_mean=float(df['Volume in USDT'].mean()),
+                    rows=len(df))
+
+    header = json.dumps({
+        'metadata': metadata,
+        'partitions': partition_headers
+    }).encode()
+
+    file.write(TS_COLUMNS_MAGIC)
+    file.write(len(header).to_bytes(4, 'little'))
+    file.write(header)
+
+    for values_bytes in column_bytes:
+        file.write(values_bytes)
+
+
+def read_ts_columns_header(file):
+    """
+    Read the header of a .cols file. Returns the header and the position of
+    the first column.
+    """
+
+    if file.read(len(TS_COLUMNS_MAGIC)) != TS_COLUMNS_MAGIC:
+        raise ValueError('Not a time series columns file.')
+
+    header_length = int.from_bytes(file.read(4), 'little')
+    header = json.loads(file.read(header_length))
+
+    metadata = header['metadata']
+    metadata['start_datetime'] = pd.Timestamp(metadata['start_datetime'],
+                                              unit='ms')
+    metadata['end_datetime'] = pd.Timestamp(metadata['end_datetime'],
+                                            unit='ms')
+
+    return header, len(TS_COLUMNS_MAGIC) + 4 + header_length
+
+
+def get_ts_partitions(header, start_ms=None, end_ms=None):
+    """
+    Get the partition headers of a .cols file that overlap a time range in
+    ms. Files saved before partitioning are one partition.
+    """
+
+    if 'partitions' not in header:
+        return [{'columns': header['columns']}]
+
+    return [
+        partition for partition in header['partitions']
+        if (start_ms is None or partition['end_ms'] >= start_ms) and (
+            end_ms is None or partition['start_ms'] <= end_ms)
+    ]
+
+
+def read_ts_column(file, data_start, column_header):
+    file.seek(data_start + column_header['offset'])
+
+    values_bytes = bytearray(column_header['nbytes'])
+    file.readinto(values_bytes)
+
+    if column_header['compressed']:
+        values_bytes = bytearray(zlib.decompress(values_bytes))
+
+    return np.frombuffer(values_bytes, dtype=column_header['dtype'])
+
+
+def save_ts_df(candlestick_data, dir_path, pair):
+    """
+    Save time series financial data and associated metadata.
+    """
+
+    return write_ts_df(candlestick_data_to_df(candlestick_data), dir_path,
+                       pair)
+
+
+def update_ts_df(candlestick_data, file_path, dir_path, pair):
+    """
+    Append new candlestick data to a saved time series. Candlesticks already
+    saved are replaced by the newly downloaded ones, as the last saved
+    candlestick may not have been closed yet. The old file is removed only
+    after the updated file is in place.
+    """
+
+    df, _ = load_ts_df(file_path)
+    new_df = candlestick_data_to_df(candlestick_data)
+
+    df = pd.concat([df, new_df], axis=0, ignore_index=True)
+    df = df.drop_duplicates(subset='Open Time', keep='last')
+    df = df.sort_values(by='Open Time', ascending=True).reset_index(drop=True)
+
+    updated_file_path = write_ts_df(df, dir_path, pair)
+
+    if os.path.abspath(updated_file_path) != os.path.abspath(file_path):
+        os.remove(file_path)
+
+    return updated_file_path
+
+
+def get_dir_interval_seconds(dir_path):
+    """
+    Get the interval length of a ./saved_data/<cex>/<interval> directory,
+    one of its generations or one of their resampled intervals, or 0 if the
+    directory is not named after a CEX and interval.
+    """
+
+    dir_path = os.path.normpath(dir_path)
+    interval = None
+
+    # Resampled intervals are built in a temporary directory named
+    # .resampled.<process id>.tmp
+    if os.path.basename(
+            os.path.dirname(dir_path)).startswith(RESAMPLED_DIR_NAME):
+        interval = os.path.basename(dir_path)
+        dir_path = os.path.dirname(os.path.dirname(dir_path))
+
+    if os.path.basename(dir_path).startswith(GENERATION_DIR_PREFIX):
+        dir_path = os.path.dirname(dir_path)
+    adapter = get_adapter(os.path.basename(os.path.dirname(dir_path)))
+
+    if adapter is None:
+        return 0
+
+    if interval is None:
+        interval = os.path.basename(dir_path)
+
+    return adapter.get_interval_seconds(interval)
+
+
+def sync_catalog(dir_path):
+    """
+    Get the catalog entries of all pair files in a directory by file name.
+    Files saved without a catalog entry, e.g. by an older version, are read
+    once and added to the catalog.
+    """
+
+    catalog = load_catalog(dir_path)
+    interval_seconds = get_dir_interval_seconds(dir_path)
+    new_entries = []
+
+    for file in os.listdir(dir_path):
+        if file.startswith('.') or file in catalog:
+            continue
+
+        file_path = dir_path + '/' + file
+        try:
+            df, metadata = load_ts_df(file_path)
+            entry = get_catalog_entry(df, metadata, file_path,
+                                      interval_seconds)
+        except:
+            print('\nUnable to load the file at {}. Skipping...'.format(
+                file_path))
+            continue
+
+        catalog[file] = entry
+        new_entries.append(entry)
+
+    if new_entries:
+        write_catalog_entries(dir_path, new_entries)
+
+    return catalog
+
+
+def update_price_panel(dir_path):
+    """
+    Rebuild the price panel of a directory from its saved pair files.
+    """
+
+    catalog = sync_catalog(dir_path)
+
+    if not catalog:
+        return False
+
+    try:
+        is_built = write_price_panel(
+            dir_path, catalog.values(), lambda entry: load_ts_df(
+                dir_path + '/' + entry['file_name'], PANEL_FIELDS)[0],
+            np.float32 if ts_file_config['float32'] else np.float64)
+    except (OSError, ValueError, KeyError) as e:
+        print('\nUnable to build the price panel in directory {}: {}'.format(
+            dir_path, e))
+        return False
+
+    if is_built:
+        print('\nUpdated the price panel of {} pairs in directory: {}'.format(
+            len(catalog), dir_path))
+    else:
+        print('\nThe pairs in directory {} have no common time axis. '
+              'Skipping the price panel...'.format(dir_path))
+
+    return is_built
+
+
+def update_resampled_dir(dir_path, cex, base_interval, interval):
+    """
+    Get the directory of the candlesticks of a saved data directory of the
+    base interval resampled into a longer interval. The directory is rebuilt
+    when the saved pair files have changed since it was built. Returns None
+    if the intervals cannot be resampled.
+    """
+
+    adapter = get_adapter(cex)
+    base_interval_seconds = get_interval_seconds(cex, base_interval)
+    interval_seconds = get_interval_seconds(cex, interval)
+
+    if base_interval_seconds == 0 or interval_seconds == 0:
+        return None
+
+    if not can_resample(base_interval_seconds, interval_seconds):
+        print(
+            "\nUnable to resample {} candlesticks into {} candlesticks. Please choose a shorter base interval that fits into the interval."
+            .format(base_interval, interval))
+        return None
+
+    utc_offset = adapter.get_interval_utc_offset(interval)
+    resampled_dir_path = os.path.join(dir_path, RESAMPLED_DIR_NAME, interval)
+    catalog = sync_catalog(dir_path)
+    meta = {
+        'base_interval': base_interval,
+        'utc_offset': utc_offset,
+        'files': get_catalog_stamps(catalog.values()),
+    }
+
+    try:
+        with open(os.path.join(resampled_dir_path, RESAMPLED_META_FILE_NAME),
+                  'r') as f:
+            if json.load(f) == meta:
+                return resampled_dir_path
+    except (OSError, ValueError):
+        pass
+
+    # The resampled files are written into a temporary directory of this
+    # process and moved into place once all of them are written
+    temp_dir_path = os.path.join(
+        dir_path, '{}.{}.tmp'.format(RESAMPLED_DIR_NAME, os.getpid()),
+        interval)
+
+    if os.path.exists(temp_dir_path):
+        shutil.rmtree(temp_dir_path)
+
+    os.makedirs(temp_dir_path)
+
+    for entry in catalog.values():
+        file_path = dir_path + '/' + entry['file_name']
+        try:
+            df, _ = load_ts_df(file_path)
+        except:
+            print('\nUnable to load the file at {}. Skipping...'.format(
+                file_path))
+            continue
+
+        resampled_df = resample_candlesticks(df, interval_seconds,
+                                             base_interval_seconds, utc_offset)
+
+        if not resampled_df.empty:
+            write_ts_df(resampled_df, temp_dir_path, entry['pair'])
+
+    with open(os.path.join(temp_dir_path, RESAMPLED_META_FILE_NAME), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(resampled_dir_path):
+        shutil.rmtree(resampled_dir_path)
+
+    os.makedirs(os.path.dirname(resampled_dir_path), exist_ok=True)
+    os.replace(temp_dir_path, resampled_dir_path)
+    shutil.rmtree(os.path.dirname(temp_dir_path), ignore_errors=True)
+
+    print('\nResampled {} pairs from {} into {} candlesticks in directory: {}'.
+          format(len(catalog), base_interval, interval, resampled_dir_path))
+
+    return resampled_dir_path
+
+
+def load_price_panel(cex, interval):
+    """
+    Open the price panel of the published data of a CEX and interval, or
+    None if it is missing or older than the saved pair files.
+    """
+
+    dir_path = get_snapshot_dir_path('./saved_data/{}/{}'.format(
+        cex, interval))
+
+    if not os.path.exists(dir_path):
+        return None
+
+    return open_price_panel(dir_path, sync_catalog(dir_path).values())
+
+
+def get_data_quality(cex, interval):
+    """
+    Get the quality records of the published pair files of a CEX and
+    interval as a dataframe with a row per pair, or None if there are none.
+    """
+
+    with SavedDataSnapshot('./saved_data/{}/{}'.format(
+            str(cex).lower(), str(interval))) as dir_path:
+        if not os.path.exists(dir_path):
+            return None
+
+        catalog = sync_catalog(dir_path)
+
+    if not catalog:
+        return None
+
+    rows = []
+
+    for entry in catalog.values():
+        quality = entry['quality']
+        rows.append({
+            'Pair':
+            entry['pair'],
+            'Missing Bars':
+            quality['missing_bars'],
+            'Missing Ranges':
+            len(quality['missing_ranges']),
+            'Duplicate Times':
+            len(quality['duplicate_times']),
+            'Zero Volume Bars':
+            count_run_bars(quality['zero_volume_runs'], entry['interval_ms']),
+            'NaN Close Bars':
+            count_run_bars(quality['nan_runs'].get('Close', []),
+                           entry['interval_ms']),
+            'Unconfirmed Last':
+            quality['unconfirmed_last'],
+        })
+
+    return pd.DataFrame(rows).sort_values(by='Pair').reset_index(drop=True)
+
+
+def get_saved_pair_files(dir_path):
+    """
+    Get the saved time series file path and metadata of every pair.
+    """
+
+    saved_pair_files = {}
+
+    if os.path.exists(dir_path):
+        for file in os.listdir(dir_path):
+            if file.startswith('.'):
+                continue
+
+            file_path = dir_path + '/' + file
+            try:
+                metadata = load_ts_metadata(file_path)
+            except:
+                print('\nUnable to load the file at {}. Skipping...'.format(
+                    file_path))
+                continue
+
+            saved_pair_files[metadata['pair']] = (file_path, metadata)
+
+    return saved_pair_files
 
 
 def save_df(dataframe, dir_path, start_datetime, end_datetime):
@@ -54,59 +555,151 @@ def save_df(dataframe, dir_path, start_datetime, end_datetime):
                                              end_datetime)
 
     os.makedirs(dir_path, exist_ok=True)
-    with open(cached_file_path, 'wb') as file:
-        pickle.dump(dataframe, file)
+    write_file_atomically(cached_file_path,
+                          lambda file: pickle.dump(dataframe, file))
 
 
 def save_sentiment_score_df(sentiment_score_df, dir_path, start_date,
                             end_date):
     """
-    Save sentiment score data.
+    Save sentiment score data. Only the scores of new bins are written, as a
+    new segment of the sentiment score store in dir_path; scores saved
+    earlier are kept. Returns the saved scores between the start and end
+    date.
     """
 
-    merged_df = pd.DataFrame(columns=['Open Time', 'Sentiment Score'])
     date_format = '%Y-%m-%d'
     parsed_input_start_datetime = datetime.strptime(start_date, date_format)
     parsed_input_end_datetime = datetime.strptime(
         end_date, date_format).replace(hour=23, minute=59, second=59)
 
-    merged_df, files_to_delete = load_presaved_df(merged_df, dir_path)
-
-    merged_df = pd.concat([merged_df, sentiment_score_df],
-                          axis=0,
-                          ignore_index=True)
-    merged_df = merged_df.drop_duplicates(
-        subset='Open Time')  # Drop rows with duplicated 'Date Time'
-    merged_df = merged_df.sort_values(by='Open Time', ascending=True)
-    start_datetime = merged_df.iloc[0]['Open Time']
-    end_datetime = merged_df.iloc[-1]['Open Time']
-
-    delete_files(files_to_delete)
-    save_df(merged_df, dir_path, start_datetime, end_datetime)
+    store = SegmentStore(dir_path)
+    saved_row_count = store.append(sentiment_score_df)
+    print("Saved {} new sentiment score bins in directory: {}".format(
+        saved_row_count, dir_path))
     print("\n")
 
-    merged_df = merged_df[
-        (merged_df['Open Time'] >= parsed_input_start_datetime)
-        & (merged_df['Open Time'] <= parsed_input_end_datetime)]
-    merged_df = merged_df.reset_index(drop=True)
+    merged_df = store.read(parsed_input_start_datetime,
+                           parsed_input_end_datetime)
+
+    if merged_df is None:
+        merged_df = pd.DataFrame(columns=['Open Time', 'Sentiment Score'])
 
     return merged_df
 
 
-def load_ts_df(file_path):
+def load_ts_df(file_path, columns=None, start_time=None, end_time=None):
     """
-    Load time series financial data and associated metadata.
+    Load time series financial data and associated metadata. Set columns to
+    load only these columns besides the open time, and start_time and
+    end_time to load the candlesticks between them only, both included. From
+    .cols files the other columns and the partitions outside the time range
+    are not read at all.
     """
 
+    start_ms = None if start_time is None else pd.Timestamp(
+        start_time).value // 10**6
+    end_ms = None if end_time is None else pd.Timestamp(
+        end_time).value // 10**6
+
+    if file_path.endswith('.cols'):
+        with open(file_path, 'rb') as file:
+            header, data_start = read_ts_columns_header(file)
+            partitions = get_ts_partitions(header, start_ms, end_ms)
+
+            if columns is None:
+                columns = [
+                    column_header['name'] for column_header in
+                    get_ts_partitions(header)[0]['columns']
+                ]
+
+            columns = ['Open Time'] + [
+                column for column in columns if column != 'Open Time'
+            ]
+            partition_data = []
+
+            for partition in partitions:
+                column_headers = {
+                    column_header['name']: column_header
+                    for column_header in partition['columns']
+                }
+                partition_data.append([
+                    read_ts_column(file, data_start, column_headers[column])
+                    for column in columns
+                ])
+
+        if partition_data:
+            data = {
+                column:
+                np.concatenate(
+                    [values[column_index] for values in partition_data])
+                for column_index, column in enumerate(columns)
+            }
+        else:
+            data = {
+                column:
+                np.empty(
+                    0, dtype=np.int64 if column == 'Open Time' else np.float64)
+                for column in columns
+            }
+
+        # The first and last partitions can extend beyond the time range
+        if start_ms is not None or end_ms is not None:
+            in_range = np.ones(len(data['Open Time']), dtype=bool)
+
+            if start_ms is not None:
+                in_range &= data['Open Time'] >= start_ms
+            if end_ms is not None:
+                in_range &= data['Open Time'] <= end_ms
+
+            if not in_range.all():
+                data = {
+                    column: values[in_range]
+                    for column, values in data.items()
+                }
+
+        data['Open Time'] = pd.to_datetime(data['Open Time'], unit='ms')
+        df = pd.DataFrame(data)
+
+        return df, header['metadata']
+
     with open(file_path, 'rb') as file:
         data = pickle.load(file)
 
     df = data['dataframe']
     metadata = data['metadata']
 
+    if 'volume_mean' not in metadata:
+        metadata['volume_mean'] = df['Volume in USDT'].mean()
+
+    if columns is not None:
+        df = df[['Open Time'] +
+                [column for column in columns if column != 'Open Time']]
+
+    if start_time is not None:
+        df = df[df['Open Time'] >= pd.Timestamp(start_time)]
+    if end_time is not None:
+        df = df[df['Open Time'] <= pd.Timestamp(end_time)]
+
+    if start_time is not None or end_time is not None:
+        df = df.reset_index(drop=True)
+
     return df, metadata
 
 
+def load_ts_metadata(file_path):
+    """
+    Load the metadata of a time series file, without its columns if it is a
+    .cols file.
+    """
+
+    if file_path.endswith('.cols'):
+        with open(file_path, 'rb') as file:
+            return read_ts_columns_header(file)[0]['metadata']
+
+    return load_ts_df(file_path)[1]
+
+
 def load_df(file_path):
     """
     Load dataframe.
@@ -118,36 +711,223 @@ def load_df(file_path):
     return dataframe
 
 
-def load_presaved_df(merged_df, dir_path):
+def load_presaved_df(merged_df, dir_path, start_time=None, end_time=None):
+    """
+    Append the rows of the segment store in dir_path, between start_time and
+    end_time if given, to a dataframe with the same columns. Returns the
+    dataframe and the files to delete, which is always empty as segments are
+    only removed by compaction.
+    """
 
     files_to_delete = []
 
     if os.path.exists(dir_path):
-        files = os.listdir(dir_path)
-        if files:
-            expected_columns = set(merged_df.columns)
+        try:
+            df = SegmentStore(dir_path).read(start_time, end_time)
+        except:
+            df = None
 
-            for file in files:
-                if not file.endswith('.pkl'):
-                    continue
+        if df is not None and set(df.columns) == set(merged_df.columns):
+            merged_df = pd.concat([merged_df, df], axis=0, ignore_index=True)
 
-                file_path = dir_path + '/' + file
-                try:
-                    df = load_df(file_path)
-                except:
-                    continue
+    return merged_df, files_to_delete
 
-                if df is None:
-                    continue
 
-                if set(df.columns) == expected_columns:
-                    merged_df = pd.concat([merged_df, df],
-                                          axis=0,
-                                          ignore_index=True)
+# Price columns each strategy needs from the saved time series
+STRATEGY_PRICE_COLUMNS = {
+    'beta_neutral': ['Open', 'Close'],
+    'volatility': ['Close', 'High', 'Low'],
+}
 
-                files_to_delete.append(file_path)
 
-    return merged_df, files_to_delete
+def get_strategy_columns(strategy, pair):
+    """
+    Get the columns of a pair in the processed dataframe of a strategy, as
+    (column, saved column) tuples. The saved column of beta_neutral is the
+    average of the open and close.
+    """
+
+    if strategy == 'beta_neutral':
+        return [(pair, 'OHLC Average')]
+
+    if strategy == 'volatility':
+        return [(pair + '_High', 'High'), (pair + '_Low', 'Low'),
+                (pair + '_Close', 'Close')]
+
+    return [(pair, 'Close')]
+
+
+def get_pair_strategy_df(df, strategy, pair):
+    """
+    Get the columns of a pair's saved dataframe that a strategy uses, indexed
+    by open time and named as in the processed dataframe.
+    """
+
+    if strategy == 'beta_neutral':
+        df = df.assign(**{'OHLC Average': (df['Open'] + df['Close']) / 2})
+
+    strategy_columns = get_strategy_columns(strategy, pair)
+    df = df.set_index('Open Time')[[
+        saved_column for _, saved_column in strategy_columns
+    ]]
+    df.columns = [column for column, _ in strategy_columns]
+
+    return df
+
+
+def load_pair_df(file_path, columns, start_time=None, end_time=None):
+    """
+    Load columns of a saved time series, as a worker of map_pair_files.
+    """
+
+    return load_ts_df(file_path, columns, start_time, end_time)[0]
+
+
+def load_pair_strategy_df(file_path, strategy, pair, columns):
+    """
+    Load the columns of a saved time series that a strategy uses, or None if
+    the file cannot be loaded.
+    """
+
+    try:
+        df = load_ts_df(file_path, columns)[0]
+    except:
+        return None
+
+    return get_pair_strategy_df(df, strategy, pair)
+
+
+# Worker pools process_data can load pair files with
+LOAD_POOLS = ['thread', 'process']
+
+
+def map_pair_files(function, args_list, workers=None, pool='thread'):
+    """
+    Call a function with each tuple of arguments in args_list, in a pool of
+    worker threads or processes if workers is above 1. Results are returned
+    in the order of args_list.
+    """
+
+    if workers is None or workers <= 1 or len(args_list) <= 1:
+        return [function(*args) for args in args_list]
+
+    workers = min(int(workers), len(args_list))
+
+    if pool == 'process':
+        # Files are handed out in chunks, so each process unpickles fewer
+        # calls
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(function,
+                             *zip(*args_list),
+                             chunksize=max(len(args_list) // (workers * 4),
+                                           1)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *zip(*args_list)))
+
+
+def get_panel_strategy_df(panel, strategy, pairs, open_times, time_index):
+    """
+    Get the columns of pairs for a strategy from the price panel, indexed by
+    open time. time_index holds the positions of the open times in the panel.
+    """
+
+    columns = {}
+
+    for pair in pairs:
+        symbol_index = panel.symbol_index[pair]
+
+        for column, saved_column in get_strategy_columns(strategy, pair):
+            if saved_column == 'OHLC Average':
+                columns[column] = (
+                    panel.get_array('Open')[symbol_index, time_index] +
+                    panel.get_array('Close')[symbol_index, time_index]) / 2
+            else:
+                columns[column] = panel.get_array(saved_column)[symbol_index,
+                                                                time_index]
+
+    return pd.DataFrame(columns, index=open_times)
+
+
+def align_pair_dfs(dfs, open_times, interval_ms):
+    """
+    Align the dataframes of several pairs indexed by open time on the sorted
+    union of their open times. Each row's position is computed from its
+    offset on the candlestick grid and its values are written into one
+    preallocated array, so nothing is joined or sorted. Returns None if the
+    open times are not on one grid of interval_ms, e.g. pairs with different
+    phases.
+    """
+
+    open_times_ms = open_times.to_numpy().astype('datetime64[ms]').astype(
+        np.int64)
+
+    if interval_ms <= 0 or len(open_times_ms) == 0:
+        return None
+
+    start_ms = open_times_ms[0]
+    grid_offsets = open_times_ms - start_ms
+
+    if np.any(grid_offsets % interval_ms):
+        return None
+
+    # Row of each candlestick of the grid in the aligned array, or -1 if no
+    # pair has it
+    grid_rows = np.full(grid_offsets[-1] // interval_ms + 1,
+                        -1,
+                        dtype=np.int64)
+    grid_rows[grid_offsets // interval_ms] = np.arange(len(open_times_ms))
+
+    pair_rows = []
+
+    for df in dfs:
+        offsets = df.index.to_numpy().astype('datetime64[ms]').astype(
+            np.int64) - start_ms
+        grid_index = offsets // interval_ms
+
+        # Saved open times are sorted, so each row is on its own candlestick
+        if np.any(offsets % interval_ms) or np.any(np.diff(offsets) <= 0):
+            return None
+        if len(offsets) > 0 and (grid_index[0] < 0
+                                 or grid_index[-1] >= len(grid_rows)):
+            return None
+
+        rows = grid_rows[grid_index]
+
+        if np.any(rows < 0):
+            return None
+
+        pair_rows.append(rows)
+
+    columns = [column for df in dfs for column in df.columns]
+    dtypes = set(dtype for df in dfs for dtype in df.dtypes)
+
+    if len(dtypes) > 1:
+        # Columns of different dtypes keep their own dtype, as in a join
+        aligned = {}
+
+        for df, rows in zip(dfs, pair_rows):
+            for column in df.columns:
+                values = np.full(len(open_times_ms),
+                                 np.nan,
+                                 dtype=df[column].dtype)
+                values[rows] = df[column].to_numpy()
+                aligned[column] = values
+
+        return pd.DataFrame(aligned, index=open_times)
+
+    values = np.full((len(open_times_ms), len(columns)),
+                     np.nan,
+                     dtype=dtypes.pop() if dtypes else np.float64)
+    column_index = 0
+
+    for df, rows in zip(dfs, pair_rows):
+        values[rows,
+               column_index:column_index + len(df.columns)] = df.to_numpy()
+        column_index += len(df.columns)
+
+    return pd.DataFrame(values, index=open_times, columns=columns, copy=False)
 
 
 def process_data(strategy,
@@ -157,9 +937,73 @@ def process_data(strategy,
                  selected_pairs,
                  top_n_volume_pairs,
                  volume_filter_mode='rolling',
-                 day_limit=7):
+                 day_limit=7,
+                 start_date=None,
+                 end_date=None,
+                 load_workers=None,
+                 load_pool='thread',
+                 base_interval=None):
+    """
+    Process and data. If start_date or end_date is given, only the
+    candlesticks between them are read and the pairs are filtered and ranked
+    by their NaN values and volume in that range. The data is read from the
+    published generation of the saved data, which stays in place while a
+    download into the same directory is running. Results are cached until
+    the saved files change. If load_workers is above 1, the pair files are
+    read by that many workers of a load_pool of 'thread' or 'process'. If
+    base_interval is given, the saved candlesticks of that shorter interval
+    are resampled into the interval, and the resampled data is saved for
+    later calls.
+    """
+
+    is_resampled = base_interval is not None and str(base_interval) != str(
+        interval)
+    base_dir_path = './saved_data/{}/{}'.format(
+        str(cex).lower(),
+        str(base_interval) if is_resampled else str(interval))
+
+    with SavedDataSnapshot(base_dir_path) as dir_path:
+        if is_resampled:
+            if not os.path.exists(dir_path):
+                print(
+                    "\nNo files found in the selected directory {}. Please run 'data_manager.py' to generate the data."
+                    .format(dir_path))
+                return None
+
+            dir_path = update_resampled_dir(dir_path,
+                                            str(cex).lower(),
+                                            str(base_interval), str(interval))
+
+            if dir_path is None:
+                return None
+
+        cache_key = get_cache_key('process_data', [
+            strategy, cex, interval, nan_remove_threshold, selected_pairs,
+            top_n_volume_pairs, volume_filter_mode, day_limit, start_date,
+            end_date, base_interval if is_resampled else None
+        ], get_dir_fingerprint(dir_path))
+
+        return run_cached(cache_key, process_saved_data, dir_path, strategy,
+                          cex, interval, nan_remove_threshold, selected_pairs,
+                          top_n_volume_pairs, volume_filter_mode, day_limit,
+                          start_date, end_date, load_workers, load_pool)
+
+
+def process_saved_data(dir_path,
+                       strategy,
+                       cex,
+                       interval,
+                       nan_remove_threshold,
+                       selected_pairs,
+                       top_n_volume_pairs,
+                       volume_filter_mode='rolling',
+                       day_limit=7,
+                       start_date=None,
+                       end_date=None,
+                       load_workers=None,
+                       load_pool='thread'):
     """
-    Process and data.
+    Process the data of a saved data directory. See process_data.
     """
 
     strategy = str(strategy).lower()
@@ -178,13 +1022,33 @@ def process_data(strategy,
     if volume_filter_mode not in ['rolling', 'mean']:
         print("\nInvalid volume filter mode. Using 'rolling' mode instead.")
         volume_filter_mode = 'rolling'
+    if load_pool not in LOAD_POOLS:
+        print("\nInvalid load pool. Using 'thread' pool instead.")
+        load_pool = 'thread'
+
+    try:
+        start_date = None if start_date is None else pd.to_datetime(start_date)
+    except:
+        print(
+            "Invalid start date entered. Please enter the start date in YYYY-MM-DD format."
+        )
+        return None
+
+    try:
+        end_date = None if end_date is None else pd.to_datetime(end_date)
+    except:
+        print(
+            "Invalid end date entered. Please enter the end date in YYYY-MM-DD format."
+        )
+        return None
+
+    is_date_range = start_date is not None or end_date is not None
+    start_ms = None if start_date is None else start_date.value // 10**6
+    end_ms = None if end_date is None else end_date.value // 10**6
 
-    dir_path = './saved_data/{}/{}'.format(cex, interval)
     volume_dict = {}
-    df_concat_list = []
+    nan_counts = {}
     column_to_drop_list = []
-    earliest_date_obj = datetime.max.date()
-    latest_date_obj = datetime.min.date()
 
     if volume_filter_mode != 'mean':
         interval_seconds = get_interval_seconds(cex, interval)
@@ -194,157 +1058,277 @@ def process_data(strategy,
 
         rolling_window_value = int(day_limit * 86400 / interval_seconds)
 
-    if os.path.exists(dir_path):
-        files = os.listdir(dir_path)
-        if files:
-            for file in files:
-                file_path = dir_path + '/' + file
-                try:
-                    df, metadata = load_ts_df(file_path)
-                except:
-                    print(
-                        '\nUnable to load the file at {}. Skipping...'.format(
-                            file_path))
-                    continue
-
-                if df is None:
-                    print("\nNo data found for pair {}. Skipping...".format(
-                        pair))
-                    continue
-
-                pair = metadata['pair']
-
-                if (not selected_pairs and strategy
-                        != 'beta_neutral') or pair in selected_pairs:
-                    if volume_filter_mode == 'mean':
-                        volume_dict[pair] = df["Volume in USDT"].mean()
-                    else:
-                        volume_dict[pair] = df['Volume in USDT'].rolling(
-                            window=rolling_window_value).mean().iloc[-1]
-
-                    if strategy == 'beta_neutral':
-                        df['OHLC Average'] = (df['Open'] + df['Close']) / 2
-                        df = df.rename(columns={"OHLC Average": pair})
-                        df = df.drop(columns=[
-                            "Open", "High", "Low", "Close", "Volume in USDT"
-                        ])
-                    elif strategy == 'volatility':
-                        df = df.rename(columns={"Close": pair + '_Close'})
-                        df = df.rename(columns={"High": pair + '_High'})
-                        df = df.rename(columns={"Low": pair + '_Low'})
-                        df = df.drop(columns=["Open", "Volume in USDT"])
-                    else:
-                        df = df.rename(columns={"Close": pair})
-                        df = df.drop(
-                            columns=["Open", "High", "Low", "Volume in USDT"])
-
-                    df.set_index("Open Time", inplace=True)
-                    df_concat_list.append(df)
-
-                    start_date = metadata['start_datetime']
-                    end_date = metadata['end_datetime']
-
-                    start_date_obj = start_date.to_pydatetime().date()
-                    end_date_obj = end_date.to_pydatetime().date()
-
-                    if start_date_obj < earliest_date_obj:
-                        earliest_date_obj = start_date_obj
-                    if end_date_obj > latest_date_obj:
-                        latest_date_obj = end_date_obj
-
-            if df_concat_list:
-                merged_df = pd.concat(df_concat_list, axis=1,
-                                      join="outer").reset_index()
-                merged_df = merged_df.sort_values("Open Time")
-
-                nan_columns = merged_df.columns[
-                    merged_df.isna().any()].tolist()
-                nan_counts = merged_df[nan_columns].isna().sum()
-                threshold = nan_remove_threshold * len(merged_df)
-
-                nan_columns_df = pd.DataFrame({
-                    'Pair':
-                    nan_counts.index,
-                    'NaN Count':
-                    nan_counts.values,
-                    'Remark':
-                    np.where(nan_counts > threshold, 'To Remove',
-                             'To Interpolate')
-                })
-
-                if not nan_columns_df.empty:
-                    nan_columns_df_sorted = nan_columns_df.sort_values(
-                        by='NaN Count', ascending=False)
-                    print("\nColumns that contains NaN values:")
-                    print(nan_columns_df_sorted)
-
-                    prev_df_column_len = merged_df.shape[1]
-
-                    column_to_drop_list = merged_df.columns[
-                        merged_df.isna().sum() > threshold]
-                    merged_df = merged_df.drop(columns=column_to_drop_list)
-
-                    curr_df_column_len = merged_df.shape[1]
-
-                    print(
-                        "\nRemoved {} pairs as they contain too many NaN values."
-                        .format(prev_df_column_len - curr_df_column_len))
-
-                filtered_volume_dict = {
-                    k: v
-                    for k, v in volume_dict.items()
-                    if k not in column_to_drop_list
-                }
-                sorted_pairs = sorted(filtered_volume_dict.keys(),
-                                      key=lambda x: filtered_volume_dict[x],
-                                      reverse=True)
-                filtered_sorted_pairs = sorted_pairs[:top_n_volume_pairs]
+    # The mean volume is saved in the metadata, so the volume column is only
+    # loaded for the rolling volume filter
+    columns = STRATEGY_PRICE_COLUMNS.get(strategy, ['Close'])
 
-                if strategy == 'volatility':
-                    filtered_sorted_pairs = [
-                        f"{pair}_{suffix}" for pair in filtered_sorted_pairs
-                        for suffix in ["Close", "High", "Low"]
-                    ]
+    if not os.path.exists(dir_path) or all(
+            file.startswith('.') for file in os.listdir(dir_path)):
+        print(
+            "\nNo files found in the selected directory {}. Please run 'data_manager.py' to generate the data."
+            .format(dir_path))
 
-                merged_df = merged_df[['Open Time'] + filtered_sorted_pairs]
+        return None
 
-                print(
-                    "Successfully loaded candlestick dataframe for all available pairs."
-                )
+    # Pairs are ranked and filtered using the catalog, so only the price
+    # data of the selected pairs is read
+    catalog = sync_catalog(dir_path)
+    entries = []
 
-                print("\nEarliest time series start date: {}".format(
-                    earliest_date_obj))
-                print(
-                    "Latest time series end date: {}".format(latest_date_obj))
+    for file in os.listdir(dir_path):
+        entry = catalog.get(file)
 
-                return merged_df
+        if entry is None:
+            continue
 
-            else:
-                print(
-                    "\nNo pair data found. Please check if the selected pairs are keyed in correctly."
-                )
+        pair = entry['pair']
 
-                return None
+        if (start_ms is not None and entry['end_ms'] < start_ms) or (
+                end_ms is not None and entry['start_ms'] > end_ms):
+            continue
+
+        if (not selected_pairs
+                and strategy != 'beta_neutral') or pair in selected_pairs:
+            entries.append(entry)
+
+    if not entries:
+        print(
+            "\nNo pair data found. Please check if the selected pairs are keyed in correctly."
+        )
+
+        return None
+
+    open_times = get_union_open_times(entries, start_ms, end_ms)
+
+    if len(open_times) == 0:
+        print("\nNo candlesticks found between the start and end date.")
+
+        return None
 
+    # NaN counts come from the catalog, in a date range from the runs of
+    # open times and NaN values of the quality records, so pairs with too
+    # many NaN values are removed before any file is read
+    for entry in entries:
+        pair = entry['pair']
+        saved_rows = entry['rows']
+        saved_nan_counts = entry['nan_counts']
+
+        if is_date_range:
+            saved_rows = count_run_bars(entry['time_runs'],
+                                        entry['interval_ms'], start_ms, end_ms)
+            saved_nan_counts = {
+                column:
+                count_run_bars(runs, entry['interval_ms'], start_ms, end_ms)
+                for column, runs in entry['quality']['nan_runs'].items()
+            }
+
+        # Each pair is NaN where it has no candlestick and where its saved
+        # column is NaN
+        for column, saved_column in get_strategy_columns(strategy, pair):
+            nan_count = len(open_times) - saved_rows + saved_nan_counts.get(
+                saved_column, 0)
+
+            if nan_count > 0:
+                nan_counts[column] = nan_count
+
+    nan_counts = pd.Series(nan_counts, dtype=np.int64)
+    threshold = nan_remove_threshold * len(open_times)
+
+    nan_columns_df = pd.DataFrame({
+        'Pair':
+        nan_counts.index,
+        'NaN Count':
+        nan_counts.values,
+        'Remark':
+        np.where(nan_counts > threshold, 'To Remove', 'To Interpolate')
+    })
+
+    if not nan_columns_df.empty:
+        nan_columns_df_sorted = nan_columns_df.sort_values(by='NaN Count',
+                                                           ascending=False)
+        print("\nColumns that contains NaN values:")
+        print(nan_columns_df_sorted)
+
+        column_to_drop_list = nan_counts.index[nan_counts > threshold].tolist()
+
+        print("\nRemoved {} pairs as they contain too many NaN values.".format(
+            len(column_to_drop_list)))
+
+    duplicate_pairs = [
+        entry['pair'] for entry in entries
+        if entry['quality']['duplicate_times']
+    ]
+
+    if duplicate_pairs:
+        print("\nPairs with duplicate open times: {}".format(', '.join(
+            sorted(duplicate_pairs))))
+
+    # The volume is only needed for the pairs that are kept
+    volume_entries = [
+        entry for entry in entries if entry['pair'] not in column_to_drop_list
+    ]
+
+    # The candlesticks in a date range are read from the partitions that
+    # overlap it and kept for the selected pairs
+    range_dfs = {}
+    volume_dfs = {}
+
+    if is_date_range:
+        range_dfs = dict(
+            zip([entry['pair'] for entry in volume_entries],
+                map_pair_files(load_pair_df,
+                               [(dir_path + '/' + entry['file_name'], columns +
+                                 ['Volume in USDT'], start_date, end_date)
+                                for entry in volume_entries], load_workers,
+                               load_pool)))
+
+    elif volume_filter_mode != 'mean':
+        rolling_entries = [
+            entry for entry in volume_entries
+            if str(rolling_window_value) not in entry['volume_rolling']
+        ]
+        volume_dfs = dict(
+            zip([entry['pair'] for entry in rolling_entries],
+                map_pair_files(
+                    load_pair_df,
+                    [(dir_path + '/' + entry['file_name'], ['Volume in USDT'])
+                     for entry in rolling_entries], load_workers, load_pool)))
+
+    for entry in volume_entries:
+        pair = entry['pair']
+
+        if is_date_range:
+            df = range_dfs[pair]
+
+            if volume_filter_mode == 'mean':
+                volume_dict[pair] = df['Volume in USDT'].mean()
+            else:
+                volume_dict[pair] = df['Volume in USDT'].rolling(
+                    window=rolling_window_value).mean().iloc[-1]
+
+        elif volume_filter_mode == 'mean':
+            volume_dict[pair] = entry['volume_mean']
+        elif str(rolling_window_value) in entry['volume_rolling']:
+            volume_dict[pair] = entry['volume_rolling'][str(
+                rolling_window_value)]
         else:
-            print(
-                "\nNo files found in the selected directory {}. Please run 'data_manager.py' to generate the data."
-                .format(dir_path))
+            df = volume_dfs[pair]
+            volume_dict[pair] = df['Volume in USDT'].rolling(
+                window=rolling_window_value).mean().iloc[-1]
 
-            return None
+    filtered_volume_dict = {
+        k: v
+        for k, v in volume_dict.items() if k not in column_to_drop_list
+    }
+    sorted_pairs = sorted(filtered_volume_dict.keys(),
+                          key=lambda x: filtered_volume_dict[x],
+                          reverse=True)
+    filtered_sorted_pairs = sorted_pairs[:top_n_volume_pairs]
+
+    # The price panel is read instead of the pair files if it is up to date
+    panel = None if is_date_range else open_price_panel(
+        dir_path, catalog.values())
+    time_index = None if panel is None else panel.get_time_index(open_times)
+
+    if time_index is not None:
+        merged_df = get_panel_strategy_df(panel, strategy, [
+            entry['pair']
+            for entry in entries if entry['pair'] in filtered_sorted_pairs
+        ], open_times, time_index)
 
     else:
-        print(
-            "\nNo files found in the selected directory {}. Please run 'data_manager.py' to generate the data."
-            .format(dir_path))
+        df_concat_list = []
+        selected_entries = [
+            entry for entry in entries
+            if entry['pair'] in filtered_sorted_pairs
+        ]
+
+        if is_date_range:
+            dfs = [
+                get_pair_strategy_df(range_dfs[entry['pair']], strategy,
+                                     entry['pair'])
+                for entry in selected_entries
+            ]
+        else:
+            dfs = map_pair_files(load_pair_strategy_df,
+                                 [(dir_path + '/' + entry['file_name'],
+                                   strategy, entry['pair'], columns)
+                                  for entry in selected_entries], load_workers,
+                                 load_pool)
+
+        for entry, df in zip(selected_entries, dfs):
+            if df is None:
+                print('\nUnable to load the file at {}. Skipping...'.format(
+                    dir_path + '/' + entry['file_name']))
+                continue
 
-        return None
+            df_concat_list.append(df)
+
+        merged_df = pd.DataFrame(index=open_times)
+
+        if df_concat_list:
+            # Pairs are aligned by their offsets on the candlestick grid,
+            # with a join for open times that are not on one grid
+            merged_df = align_pair_dfs(df_concat_list, open_times,
+                                       entries[0]['interval_ms'])
+
+            if merged_df is None:
+                merged_df = pd.concat(df_concat_list, axis=1,
+                                      join="outer").reindex(open_times)
+
+    if strategy == 'volatility':
+        filtered_sorted_pairs = [
+            f"{pair}_{suffix}" for pair in filtered_sorted_pairs
+            for suffix in ["Close", "High", "Low"]
+        ]
+
+    merged_df = merged_df.reset_index()
+    merged_df = merged_df[['Open Time'] + [
+        column
+        for column in filtered_sorted_pairs if column in merged_df.columns
+    ]]
+
+    print("Successfully loaded candlestick dataframe for all available pairs.")
+
+    earliest_date_obj = open_times[0].date()
+    latest_date_obj = open_times[-1].date()
+
+    print("\nEarliest time series start date: {}".format(earliest_date_obj))
+    print("Latest time series end date: {}".format(latest_date_obj))
+
+    return merged_df
+
+
+# Price fields of each pair in the volatility strategy
+VOLATILITY_FIELDS = ["Close", "High", "Low"]
 
 
 def sanitize_data(merged_df,
                   start_date,
                   end_date,
                   is_volatility_strategy=False):
+    """
+    Sanitize the price data between the start and end date. Returns a
+    SanitizedPanel, which maps each pair to a dataframe of its prices, and
+    the sorted pairs. Results are cached by the content of merged_df.
+    """
+
+    cache_key = get_cache_key('sanitize_data',
+                              [start_date, end_date, is_volatility_strategy],
+                              get_df_fingerprint(merged_df))
+
+    return run_cached(cache_key, sanitize_merged_df, merged_df, start_date,
+                      end_date, is_volatility_strategy)
+
+
+def sanitize_merged_df(merged_df,
+                       start_date,
+                       end_date,
+                       is_volatility_strategy=False):
+    """
+    Sanitize the price data between the start and end date. See
+    sanitize_data.
+    """
 
     try:
         start_date = pd.to_datetime(start_date)
@@ -362,62 +1346,44 @@ def sanitize_data(merged_df,
         )
         return {}, []
 
-    data_sanitized = {}
-
     filtered_df = merged_df[(merged_df["Open Time"] >= start_date)
                             & (merged_df["Open Time"] <= end_date)]
-    filtered_df.set_index("Open Time", inplace=True)
-    filtered_df = filtered_df.copy()
+    filtered_df = filtered_df.set_index("Open Time")
 
+    # All pairs are sanitized at once as one 2D array
     if is_volatility_strategy:
         sorted_available_pairs = sorted(
             set(col.split("_")[0] for col in filtered_df.columns))
+        pairs = []
 
         for pair in sorted_available_pairs:
-            close_col = f"{pair}_Close"
-            high_col = f"{pair}_High"
-            low_col = f"{pair}_Low"
-
-            if not all(col in filtered_df.columns
-                       for col in [close_col, high_col, low_col]):
+            if not all(f"{pair}_{field}" in filtered_df.columns
+                       for field in VOLATILITY_FIELDS):
                 print(f"Skipping {pair} due to missing HLC columns.")
                 continue
 
-            for col in [close_col, high_col, low_col]:
-                filtered_df[col] = filtered_df[col].replace([np.inf, -np.inf],
-                                                            np.nan)
-                filtered_df[col] = filtered_df[col].interpolate(
-                    method='linear')
-                filtered_df[col] = filtered_df[col].ffill().bfill()
+            pairs.append(pair)
 
-                assert not np.any(np.isnan(filtered_df[col])) and not np.any(
-                    np.isinf(filtered_df[col]))
-
-            data_sanitized[pair] = filtered_df[[close_col, high_col,
-                                                low_col]].rename(columns={
-                                                    close_col: "Close",
-                                                    high_col: "High",
-                                                    low_col: "Low"
-                                                })
+        columns = [
+            f"{pair}_{field}" for field in VOLATILITY_FIELDS for pair in pairs
+        ]
+        fields = VOLATILITY_FIELDS
 
     else:
-        pairs = [col for col in filtered_df.columns]
+        pairs = list(filtered_df.columns)
+        sorted_available_pairs = sorted(pairs)
+        columns = pairs
+        fields = ['Close']
 
-        for pair in pairs:
-            filtered_df.loc[:, pair] = filtered_df[pair].replace(
-                [np.inf, -np.inf], np.nan)
-            filtered_df.loc[:, pair] = filtered_df[pair].interpolate(
-                method='linear')
-            filtered_df.loc[:, pair] = filtered_df[pair].ffill()
-            filtered_df.loc[:, pair] = filtered_df[pair].bfill()
+    values = fill_missing_values(filtered_df[columns].to_numpy())
 
-            assert not np.any(np.isnan(filtered_df[pair])) and not np.any(
-                np.isinf(filtered_df[pair]))
+    assert not np.any(np.isnan(values)) and not np.any(np.isinf(values))
 
-            data_sanitized[pair] = pd.DataFrame({"Close": filtered_df[pair]},
-                                                index=filtered_df.index)
-
-        sorted_available_pairs = sorted(pairs)
+    data_sanitized = SanitizedPanel(
+        filtered_df.index, pairs, {
+            field: values[:, i * len(pairs):(i + 1) * len(pairs)]
+            for i, field in enumerate(fields)
+        })
 
     return data_sanitized, sorted_available_pairs
 
@@ -439,18 +1405,21 @@ if __name__ == "__main__":
     # Get arguments from terminal
     parser = argparse.ArgumentParser(
         description="Get parameters for the script.")
-    parser.add_argument('-c',
-                        '--cex',
-                        type=str,
-                        default='binance',
-                        help="CEX. Available values: binance, okx, bybit.")
+    parser.add_argument(
+        '-c',
+        '--cex',
+        type=str,
+        default='binance',
+        help=
+        "CEX. Available values: binance, okx, bybit. Separate several CEXes with commas to download from them at the same time."
+    )
     parser.add_argument(
         '-i',
         '--interval',
         type=str,
         default='',
         help=
-        "Interval. Refer to the relevant query script for the available intervals."
+        "Interval. Refer to the relevant query script for the available intervals. Binance's interval names (e.g. 1h, 1d) are accepted for every CEX."
     )
     parser.add_argument(
         '-e',
@@ -460,113 +1429,282 @@ if __name__ == "__main__":
         help=
         "End Time. Start time will be interval x limit before end time. Timestamp in ms."
     )
+    parser.add_argument(
+        '-s',
+        '--start',
+        type=str,
+        default='',
+        help=
+        "Start Time. Overrides the limit and downloads the whole range between start and end time in pages. Timestamp in ms."
+    )
     parser.add_argument('-l',
                         '--limit',
                         type=int,
                         default=365,
                         help="No. of candlesticks to return.")
+    parser.add_argument(
+        '-u',
+        '--update',
+        action='store_true',
+        help=
+        "Update the saved data with the candlesticks after each pair's last saved candlestick instead of downloading everything again."
+    )
+    parser.add_argument(
+        '-r',
+        '--resume',
+        action='store_true',
+        help=
+        "Resume the last download run of the same arguments. Completed pairs are skipped and partly downloaded pairs continue from their last checkpointed page."
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=
+        "Max. no. of concurrent requests. Requests are also kept within the CEX rate limit."
+    )
+    parser.add_argument('-t',
+                        '--timeout',
+                        type=float,
+                        default=DEFAULT_TIMEOUT[1],
+                        help="Request read timeout in seconds.")
+    parser.add_argument(
+        '-f',
+        '--format',
+        type=str,
+        default=ts_file_config['file_format'],
+        choices=TS_FILE_FORMATS,
+        help=
+        "File format of the saved data. cols saves one array per column, so strategies load only the columns they use."
+    )
+    parser.add_argument('--float32',
+                        action='store_true',
+                        help="Save prices and volumes in single precision.")
+    parser.add_argument('--compress',
+                        action='store_true',
+                        help="Compress the columns of cols files.")
+    parser.add_argument(
+        '--base-url',
+        type=str,
+        default='',
+        help=
+        "Send all requests to this server instead of the CEXes, e.g. the offline replay server (python -m cex_api.replay_server)."
+    )
     args = parser.parse_args()
 
-    cex = args.cex.lower()
+    cexes = [cex.strip().lower() for cex in args.cex.split(',') if cex.strip()]
     interval = args.interval
     end_timestamp = args.end
+    start_timestamp = args.start
     limit = args.limit
+    max_workers = args.workers
+    update = args.update
+    resume = args.resume
+    timeout = (DEFAULT_TIMEOUT[0], args.timeout)
 
-    interval_seconds = get_interval_seconds(cex, interval)
+    cex_intervals = {}
 
-    if interval_seconds == 0:
-        sys.exit(1)
+    for cex in cexes:
+        adapter = get_adapter(cex)
 
-    if cex == 'binance':
-        print("\nCEX: {}".format(cex.capitalize()))
-        print("Interval: {}".format(interval))
-        print("No. of candlesticks to save: {}".format(limit))
-
-        perpetual_futures_pairs = get_binance_perpetual_futures_pairs()
-
-        dir_path = './saved_data/{}/{}'.format(cex, interval)
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-            print('\nDeleted existing directory: {}'.format(dir_path))
+        if adapter is None:
+            print('\nInvalid CEX: {}. Available values: {}.\n'.format(
+                cex, ', '.join(get_available_cexes())))
+            sys.exit(1)
 
-        for pair in perpetual_futures_pairs:
-            print(
-                '\nRetrieving candlestick data for pair {} from {}...'.format(
-                    pair, cex.capitalize()))
+        cex_interval = adapter.resolve_interval(interval)
 
-            candlestick_data = get_binance_perpetual_futures_candlestick_data(
-                pair, interval, end_timestamp, limit)
+        if cex_interval is None:
+            print('\nThe interval is invalid for {}. Available options: {}.\n'.
+                  format(cex.capitalize(), ', '.join(adapter.intervals)))
+            sys.exit(1)
 
-            if candlestick_data:
-                print('Saving pair {} candlestick data...'.format(pair))
-
-                save_ts_df(candlestick_data, dir_path, pair)
+        cex_intervals[cex] = cex_interval
 
-            else:
-                print('No candlestick data found for pair {}. Skipping...'.
-                      format(pair))
+        if args.base_url:
+            adapter.set_base_url(args.base_url)
 
-    elif cex == 'okx':
-        print("\nCEX: {}".format(cex.capitalize()))
-        print("Interval: {}".format(interval))
+    print("\nCEX: {}".format(', '.join(cex.capitalize() for cex in cexes)))
+    print("Interval: {}".format(', '.join(cex_intervals.values())))
+    if start_timestamp:
+        print("Start time: {}".format(start_timestamp))
+    else:
         print("No. of candlesticks to save: {}".format(limit))
+    print("Max concurrent requests per CEX: {}".format(max_workers))
+    if args.base_url:
+        print("Base URL: {}".format(args.base_url))
+
+    configure_ts_files(file_format=args.format,
+                       float32=args.float32,
+                       compress=args.compress)
+
+    configure_http_client(timeout=timeout,
+                          pool_maxsize=max(max_workers * len(cexes),
+                                           DEFAULT_POOL_MAXSIZE))
+
+    download_jobs = []
+    dir_paths = {}
+    saved_pair_files = {}
+    manifests = {}
+    writers = {}
+    failed_cexes = []
+
+    for cex in cexes:
+        try:
+            perpetual_futures_pairs = get_adapter(cex).get_pairs()
+        except CexApiError as e:
+            print('\n{}\nSkipping {}...'.format(e, cex.capitalize()))
+            failed_cexes.append(cex.capitalize())
+            continue
+
+        # Each run writes a new generation of the directory, which readers
+        # see only once it is published at the end of the run
+        base_dir_path = './saved_data/{}/{}'.format(cex, cex_intervals[cex])
+        writer = GenerationWriter(base_dir_path)
+        writers[cex] = writer
+        saved_pair_files[cex] = {}
+
+        run_args = {
+            'cex': cex,
+            'interval': cex_intervals[cex],
+            'start_timestamp': start_timestamp,
+            'limit': limit,
+            'update': update,
+        }
+
+        # An interrupted run is resumed in its unpublished generation, a
+        # finished one in a copy of the published generation
+        resume_dir_path = writer.get_unpublished_dir_path(
+        ) or get_snapshot_dir_path(base_dir_path)
+        manifest = DownloadManifest.load(resume_dir_path) if resume else None
+
+        if manifest is not None and {
+                arg: manifest.run_args.get(arg)
+                for arg in run_args
+        } != run_args:
+            print('\nThe last download run in directory {} used other '
+                  'arguments. Starting a new run...'.format(base_dir_path))
+            manifest = None
+
+        if manifest is not None:
+            dir_path = writer.begin(resume_dir_path)
+            manifest = DownloadManifest.load(dir_path)
+        elif update:
+            dir_path = writer.begin(get_snapshot_dir_path(base_dir_path))
+        else:
+            dir_path = writer.begin()
+
+        dir_paths[cex] = dir_path
+
+        if update:
+            saved_pair_files[cex] = get_saved_pair_files(dir_path)
+            print('\nUpdating {} saved pairs in directory: {}'.format(
+                len(saved_pair_files[cex]), base_dir_path))
+
+        if manifest is None:
+            # The end time is fixed for the whole run, so a resumed run
+            # requests the same pages
+            manifest = DownloadManifest.create(
+                dir_path,
+                dict(run_args,
+                     end_timestamp=int(end_timestamp)
+                     if end_timestamp else get_current_timestamp_ms()))
+        else:
+            print('\nResuming the download run started at {} in directory: {}'.
+                  format(manifest.manifest['created'], dir_path))
+
+        manifests[cex] = manifest
+        pending_pairs = manifest.get_pending_pairs(perpetual_futures_pairs)
+
+        if len(pending_pairs) < len(perpetual_futures_pairs):
+            print('\nSkipping {} pairs completed by the last run.'.format(
+                len(perpetual_futures_pairs) - len(pending_pairs)))
+
+        pair_start_timestamps = {
+            pair: metadata['end_datetime'].value // 10**6
+            for pair, (_, metadata) in saved_pair_files[cex].items()
+        }
+
+        download_jobs.append({
+            'cex':
+            cex,
+            'pairs':
+            pending_pairs,
+            'interval':
+            cex_intervals[cex],
+            'end_timestamp':
+            manifest.run_args['end_timestamp'],
+            'limit':
+            limit,
+            'max_workers':
+            max_workers,
+            'start_timestamp':
+            start_timestamp,
+            'pair_start_timestamps':
+            pair_start_timestamps,
+            'columnar':
+            True,
+            'checkpoint':
+            manifest,
+        })
+
+    for cex, pair, candlestick_data in download_candlestick_data_from_cexes(
+            download_jobs):
+        dir_path = dir_paths[cex]
+
+        if candlestick_data is None:
+            print('Failed to download pair {} candlestick data from {}. '
+                  'Skipping...'.format(pair, cex.capitalize()))
+
+            manifests[cex].mark_failed(pair)
+
+        elif get_candlestick_row_count(candlestick_data) > 0:
+            if pair in saved_pair_files[cex]:
+                print('Updating pair {} candlestick data...'.format(pair))
+
+                update_ts_df(candlestick_data, saved_pair_files[cex][pair][0],
+                             dir_path, pair)
 
-        perpetual_futures_pairs = get_okx_perpetual_futures_pairs()
-
-        dir_path = './saved_data/{}/{}'.format(cex, interval)
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-            print('\nDeleted existing directory: {}'.format(dir_path))
-
-        for pair in perpetual_futures_pairs:
-            print(
-                '\nRetrieving candlestick data for pair {} from {}...'.format(
-                    pair, cex.capitalize()))
-
-            candlestick_data = get_okx_perpetual_futures_candlestick_data(
-                pair, interval, end_timestamp, limit)
-
-            if candlestick_data:
+            else:
                 print('Saving pair {} candlestick data...'.format(pair))
 
                 save_ts_df(candlestick_data, dir_path, pair)
 
-            else:
-                print('No candlestick data found for pair {}. Skipping...'.
-                      format(pair))
+            manifests[cex].mark_complete(
+                pair, int(candlestick_data['Open Time'][-1]))
 
-    elif cex == 'bybit':
-        print("\nCEX: {}".format(cex.capitalize()))
-        print("Interval: {}".format(interval))
-        print("No. of candlesticks to save: {}".format(limit))
+        else:
+            print('No candlestick data found for pair {}. Skipping...'.format(
+                pair))
 
-        perpetual_futures_pairs = get_bybit_perpetual_futures_pairs()
+            manifests[cex].mark_complete(pair)
 
-        dir_path = './saved_data/{}/{}'.format(cex, interval)
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-            print('\nDeleted existing directory: {}'.format(dir_path))
+    for cex, dir_path in dir_paths.items():
+        update_price_panel(dir_path)
+        writers[cex].publish()
+        print('\nPublished {}'.format(dir_path))
 
-        for pair in perpetual_futures_pairs:
-            print(
-                '\nRetrieving candlestick data for pair {} from {}...'.format(
-                    pair, cex.capitalize()))
+    for writer in writers.values():
+        writer.close()
 
-            candlestick_data = get_bybit_perpetual_futures_candlestick_data(
-                pair, interval, end_timestamp, limit)
+    failed_pairs = []
 
-            if candlestick_data:
-                print('Saving pair {} candlestick data...'.format(pair))
+    for cex, manifest in manifests.items():
+        manifest.remove_checkpoints()
 
-                save_ts_df(candlestick_data, dir_path, pair)
+        for pair, error in manifest.get_failed_pairs().items():
+            failed_pairs.append('{} ({}): {}'.format(pair, cex.capitalize(),
+                                                     error))
 
-            else:
-                print('No candlestick data found for pair {}. Skipping...'.
-                      format(pair))
+    if failed_cexes:
+        print("\nFailed to query the pairs of: {}".format(
+            ', '.join(failed_cexes)))
 
-    else:
-        print('\nInvalid CEX.\n')
-        sys.exit(1)
+    if failed_pairs:
+        print("\nFailed to download {} pairs:\n{}".format(
+            len(failed_pairs), '\n'.join(sorted(failed_pairs))))
+        print("\nRun the same command with -r to resume them.")
 
     print(
         "\nData downloaded successfully. Please use any of the Jupyter Notebook next.\n"
@@ -0,0 +1,245 @@
+import os
+import json
+import shutil
+import pickle
+import threading
+from datetime import datetime
+
+MANIFEST_FILE_NAME = '.manifest.json'
+CHECKPOINT_DIR_NAME = '.checkpoints'
+
+PAIR_PENDING = 'pending'
+PAIR_PARTIAL = 'partial'
+PAIR_COMPLETE = 'complete'
+PAIR_FAILED = 'failed'
+
+
+def write_file_atomically(file_path, write, mode='wb'):
+    """
+    Write a file through a temporary file in the same directory, so that it
+    is either fully written or not there at all.
+    """
+
+    dir_path, file_name = os.path.split(file_path)
+    temp_file_path = os.path.join(dir_path, '.{}.tmp'.format(file_name))
+
+    with open(temp_file_path, mode) as f:
+        write(f)
+
+    os.replace(temp_file_path, file_path)
+
+
+class DownloadManifest:
+    """
+    Progress of a download run into one saved data directory.
+
+    The manifest records the arguments of the run, the end time resolved when
+    the run started and the status of every pair. Each downloaded page is
+    checkpointed to disk as soon as it arrives, so a restarted run downloads
+    the missing pages of a pair only and loses at most the pages that were in
+    flight.
+    """
+
+    def __init__(self, dir_path, manifest):
+        self.dir_path = dir_path
+        self.manifest = manifest
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, dir_path, run_args):
+        """
+        Start the manifest of a new run. run_args must include the resolved
+        end_timestamp so that a resumed run requests the same pages.
+        """
+
+        manifest = {
+            'run_args': run_args,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'pairs': {},
+        }
+
+        checkpoint_dir_path = os.path.join(dir_path, CHECKPOINT_DIR_NAME)
+
+        if os.path.exists(checkpoint_dir_path):
+            shutil.rmtree(checkpoint_dir_path)
+
+        download_manifest = cls(dir_path, manifest)
+        download_manifest.save()
+
+        return download_manifest
+
+    @classmethod
+    def load(cls, dir_path):
+        """
+        Load the manifest of an earlier run, or None if there is none.
+        """
+
+        file_path = os.path.join(dir_path, MANIFEST_FILE_NAME)
+
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print('\nUnable to read download manifest {}: {}'.format(
+                file_path, e))
+            return None
+
+        # Pages fetched are counted again from the checkpoints as they load
+        for pair_entry in manifest['pairs'].values():
+            if pair_entry['status'] != PAIR_COMPLETE:
+                pair_entry['pages_fetched'] = 0
+
+        return cls(dir_path, manifest)
+
+    @property
+    def run_args(self):
+        return self.manifest['run_args']
+
+    def save(self):
+        """
+        Write the manifest to the saved data directory.
+        """
+
+        os.makedirs(self.dir_path, exist_ok=True)
+
+        with self.lock:
+            content = json.dumps(self.manifest, indent=2, sort_keys=True)
+
+        write_file_atomically(os.path.join(self.dir_path, MANIFEST_FILE_NAME),
+                              lambda f: f.write(content),
+                              mode='w')
+
+    def get_pair_entry(self, pair):
+        return self.manifest['pairs'].setdefault(
+            pair, {
+                'status': PAIR_PENDING,
+                'pages_total': None,
+                'pages_fetched': 0,
+                'last_timestamp': None,
+                'error': None,
+            })
+
+    def get_pair_status(self, pair):
+        with self.lock:
+            return self.manifest['pairs'].get(pair,
+                                              {}).get('status', PAIR_PENDING)
+
+    def get_pending_pairs(self, pairs):
+        """
+        Get the pairs that are not completely downloaded yet, in order.
+        """
+
+        return [
+            pair for pair in pairs
+            if self.get_pair_status(pair) != PAIR_COMPLETE
+        ]
+
+    def get_checkpoint_dir_path(self, pair):
+        return os.path.join(self.dir_path, CHECKPOINT_DIR_NAME, pair)
+
+    def get_checkpoint_file_path(self, pair, page_index, page_count):
+        # The page count is part of the name, so checkpoints of a different
+        # page split are never mixed in
+        return os.path.join(self.get_checkpoint_dir_path(pair),
+                            '{}-{}.pkl'.format(page_index, page_count))
+
+    def load_page(self, pair, page_index, page_count):
+        """
+        Get a checkpointed page of a pair, or None if it has to be downloaded.
+        """
+
+        file_path = self.get_checkpoint_file_path(pair, page_index, page_count)
+
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, 'rb') as f:
+                page = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        with self.lock:
+            pair_entry = self.get_pair_entry(pair)
+            pair_entry['pages_total'] = page_count
+            pair_entry['pages_fetched'] += 1
+
+        return page
+
+    def save_page(self, pair, page_index, page_count, page):
+        """
+        Checkpoint a downloaded page of a pair.
+        """
+
+        checkpoint_dir_path = self.get_checkpoint_dir_path(pair)
+        os.makedirs(checkpoint_dir_path, exist_ok=True)
+
+        write_file_atomically(
+            self.get_checkpoint_file_path(pair, page_index, page_count),
+            lambda f: pickle.dump(page, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+        with self.lock:
+            pair_entry = self.get_pair_entry(pair)
+            pair_entry['pages_total'] = page_count
+            pair_entry['pages_fetched'] += 1
+            pair_entry['status'] = PAIR_PARTIAL
+
+    def record_error(self, pair, error):
+        """
+        Record why a page of a pair failed to download.
+        """
+
+        with self.lock:
+            self.get_pair_entry(pair)['error'] = str(error)
+
+    def mark_complete(self, pair, last_timestamp=None):
+        """
+        Mark a pair as saved and delete its checkpoints.
+        """
+
+        with self.lock:
+            pair_entry = self.get_pair_entry(pair)
+            pair_entry['status'] = PAIR_COMPLETE
+            pair_entry['last_timestamp'] = last_timestamp
+            pair_entry['error'] = None
+
+        self.save()
+
+        shutil.rmtree(self.get_checkpoint_dir_path(pair), ignore_errors=True)
+
+    def mark_failed(self, pair):
+        """
+        Mark a pair as failed. Its checkpointed pages are kept for the next
+        run.
+        """
+
+        with self.lock:
+            self.get_pair_entry(pair)['status'] = PAIR_FAILED
+
+        self.save()
+
+    def get_failed_pairs(self):
+        """
+        Get the failed pairs and their last error.
+        """
+
+        with self.lock:
+            return {
+                pair: pair_entry['error']
+                for pair, pair_entry in self.manifest['pairs'].items()
+                if pair_entry['status'] == PAIR_FAILED
+            }
+
+    def remove_checkpoints(self):
+        """
+        Delete the checkpoint directory if no checkpoints are left in it.
+        """
+
+        checkpoint_dir_path = os.path.join(self.dir_path, CHECKPOINT_DIR_NAME)
+
+        if os.path.isdir(checkpoint_dir_path) and not any(
+                os.listdir(checkpoint_dir_path)):
+            os.rmdir(checkpoint_dir_path)
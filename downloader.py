@@ -0,0 +1,317 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from cex_api.http_client import *
+from cex_api.columnar import *
+from cex_api.adapters import *
+from utils import *
+
+DEFAULT_MAX_WORKERS = 10
+
+# Fraction of each CEX's request budget used by the downloader, leaving room
+# for the pair list query and any other clients sharing the same IP.
+RATE_LIMIT_HEADROOM = 0.9
+
+
+class RateLimiter:
+    """
+    Sliding window request budget shared by all the worker threads of a CEX.
+    """
+
+    def __init__(self, max_weight, period_seconds):
+        self.max_weight = max_weight
+        self.period_seconds = period_seconds
+        self.used_weight = 0
+        self.history = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight=1):
+        """
+        Block until the request weight fits into the current window.
+        """
+
+        weight = min(weight, self.max_weight)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+
+                while self.history and self.history[0][
+                        0] <= now - self.period_seconds:
+                    _, expired_weight = self.history.popleft()
+                    self.used_weight -= expired_weight
+
+                if self.used_weight + weight <= self.max_weight:
+                    self.history.append((now, weight))
+                    self.used_weight += weight
+
+                    return
+
+                wait_seconds = self.history[0][0] + self.period_seconds - now
+
+            time.sleep(max(wait_seconds, 0.001))
+
+
+def get_rate_limiter(cex):
+    """
+    Create the rate limiter for the request budget of a CEX.
+    """
+
+    adapter = get_adapter(cex)
+
+    if adapter is None:
+        print('\nInvalid CEX.\n')
+        return None
+
+    max_weight, period_seconds = adapter.rate_limit
+
+    return RateLimiter(max(int(max_weight * RATE_LIMIT_HEADROOM), 1),
+                       period_seconds)
+
+
+def stitch_candlestick_pages(pages, start_timestamp=''):
+    """
+    Merge candlestick data pages (latest first) into one ascending series.
+    Candlesticks repeated across page boundaries are kept once, from the
+    latest page.
+    """
+
+    pages = [page for page in pages if page is not None]
+
+    if pages and isinstance(pages[0], dict):
+        return stitch_candlestick_column_pages(pages, start_timestamp)
+
+    candlesticks = {}
+
+    for page in reversed(pages):
+        for candlestick in page:
+            open_time = int(candlestick[0])
+
+            if open_time not in candlesticks:
+                candlesticks[open_time] = candlestick
+
+    open_times = sorted(candlesticks)
+
+    if start_timestamp not in ['', None]:
+        open_times = [
+            open_time for open_time in open_times
+            if open_time >= int(start_timestamp)
+        ]
+
+    return [candlesticks[open_time] for open_time in open_times]
+
+
+def stitch_candlestick_column_pages(pages, start_timestamp=''):
+    """
+    Merge columnar candlestick data pages (latest first) into one ascending
+    series, keeping the candlestick from the latest page for repeated open
+    times.
+    """
+
+    columns = {
+        column: np.concatenate([page[column] for page in pages])
+        for column in CANDLESTICK_COLUMNS
+    }
+
+    # np.unique keeps the first occurrence, which is from the latest page
+    _, keep_index = np.unique(columns['Open Time'], return_index=True)
+
+    if start_timestamp not in ['', None]:
+        keep_index = keep_index[columns['Open Time'][keep_index] >= int(
+            start_timestamp)]
+
+    return {column: values[keep_index] for column, values in columns.items()}
+
+
+def download_candlestick_data(cex,
+                              pairs,
+                              interval,
+                              end_timestamp,
+                              limit,
+                              max_workers=DEFAULT_MAX_WORKERS,
+                              start_timestamp='',
+                              pair_start_timestamps=None,
+                              columnar=False,
+                              rate_limiter=None,
+                              checkpoint=None):
+    """
+    Download candlestick data for many pairs of a CEX concurrently.
+
+    A bounded thread pool keeps up to max_workers requests in flight while a
+    shared rate limiter holds them within the request budget of the CEX.
+    When a start time is given or the limit is above what one request can
+    return, each pair's range is split into page windows which are fetched
+    concurrently and stitched back together. pair_start_timestamps maps
+    pairs to their own start time, e.g. the last saved candlestick when
+    updating saved data. A rate_limiter can be passed in to share the request
+    budget of the CEX across calls. Set columnar to True to download columnar candlestick
+    data. If a checkpoint (DownloadManifest) is given, pages checkpointed by
+    an earlier run are loaded instead of downloaded, every downloaded page is
+    checkpointed and download errors are recorded in it.
+    Yields (pair, candlestick_data) tuples in the order they complete, with
+    None as the candlestick data of pairs that failed to download.
+    """
+
+    adapter = get_adapter(cex)
+    interval_seconds = get_interval_seconds(cex, interval)
+
+    if adapter is None or interval_seconds == 0:
+        return
+
+    if rate_limiter is None:
+        rate_limiter = get_rate_limiter(cex)
+
+    if pair_start_timestamps is None:
+        pair_start_timestamps = {}
+
+    if end_timestamp in ['', None]:
+        paginated_end_timestamp = get_current_timestamp_ms()
+    else:
+        paginated_end_timestamp = int(end_timestamp)
+
+    def get_pair_page_windows(pair):
+        pair_start_timestamp = pair_start_timestamps.get(pair, start_timestamp)
+
+        if pair_start_timestamp in [
+                '', None
+        ] and int(limit) <= adapter.max_request_limit:
+            return [(end_timestamp, limit)], False
+
+        if pair_start_timestamp in ['', None]:
+            pair_limit = int(limit)
+        else:
+            pair_limit = get_candlestick_count(int(pair_start_timestamp),
+                                               paginated_end_timestamp,
+                                               interval_seconds)
+
+        return get_page_windows(paginated_end_timestamp, interval_seconds,
+                                pair_limit, adapter.page_limit), True
+
+    def fetch(pair, page_index):
+        page_windows, paginated = pair_page_windows[pair]
+        page_end_timestamp, page_limit = page_windows[page_index]
+
+        if checkpoint is not None:
+            page = checkpoint.load_page(pair, page_index, len(page_windows))
+
+            if page is not None:
+                return page
+
+        rate_limiter.acquire(adapter.get_request_weight(page_limit, paginated))
+
+        if paginated:
+            print(
+                '\nRetrieving candlestick data for pair {} from {} (page {}/{})...'
+                .format(pair, cex.capitalize(), page_index + 1,
+                        len(page_windows)))
+        else:
+            print(
+                '\nRetrieving candlestick data for pair {} from {}...'.format(
+                    pair, cex.capitalize()))
+
+        page = adapter.get_candlestick_page(pair, interval, page_end_timestamp,
+                                            page_limit, paginated, columnar)
+
+        if checkpoint is not None:
+            checkpoint.save_page(pair, page_index, len(page_windows), page)
+
+        return page
+
+    executor = ThreadPoolExecutor(max_workers=max(int(max_workers), 1))
+
+    try:
+        futures = {}
+        pair_pages = {}
+        pair_page_windows = {}
+
+        for pair in pairs:
+            pair_page_windows[pair] = get_pair_page_windows(pair)
+            page_count = len(pair_page_windows[pair][0])
+
+            if page_count == 0:
+                yield pair, []
+                continue
+
+            pair_pages[pair] = [None] * page_count
+
+            for page_index in range(page_count):
+                futures[executor.submit(fetch, pair,
+                                        page_index)] = (pair, page_index)
+
+        pending_page_counts = {
+            pair: len(pages)
+            for pair, pages in pair_pages.items()
+        }
+
+        failed_pairs = set()
+
+        for future in as_completed(futures):
+            pair, page_index = futures[future]
+            pending_page_counts[pair] -= 1
+
+            try:
+                pair_pages[pair][page_index] = future.result()
+            except (CexApiError, ValueError) as e:
+                print('\n{}'.format(e))
+                failed_pairs.add(pair)
+
+                if checkpoint is not None:
+                    checkpoint.record_error(pair, e)
+
+            if pending_page_counts[pair] == 0:
+                pages = pair_pages.pop(pair)
+
+                if pair in failed_pairs:
+                    yield pair, None
+                elif pair_page_windows[pair][1]:
+                    yield pair, stitch_candlestick_pages(
+                        pages,
+                        pair_start_timestamps.get(pair, start_timestamp))
+                else:
+                    yield pair, pages[0]
+
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def download_candlestick_data_from_cexes(download_jobs):
+    """
+    Download candlestick data from several CEXes at the same time.
+
+    Each job is a dict of download_candlestick_data arguments for one CEX.
+    Every CEX runs its own pipeline in a separate thread, with its own thread
+    pool and rate limiter, so their request budgets are applied separately.
+    Yields (cex, pair, candlestick_data) tuples in the order they complete.
+    """
+
+    results = queue.Queue()
+    job_done = object()
+
+    def run(download_job):
+        try:
+            for pair, candlestick_data in download_candlestick_data(
+                    **download_job):
+                results.put((download_job['cex'], pair, candlestick_data))
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(job_done)
+
+    for download_job in download_jobs:
+        threading.Thread(target=run, args=(download_job, ),
+                         daemon=True).start()
+
+    remaining_job_count = len(download_jobs)
+
+    while remaining_job_count > 0:
+        result = results.get()
+
+        if result is job_done:
+            remaining_job_count -= 1
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            yield result
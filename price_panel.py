@@ -0,0 +1,252 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+'''
+Consolidated price panel of a saved data directory.
+
+The panel holds one memory-mapped array per price field with a row per pair
+and a column per candlestick of a shared time axis, so a pair's series is
+contiguous on disk. It is rebuilt from the saved pair files whenever they
+are downloaded and records the files it was built from, so a panel that no
+longer matches the catalog is not used. Slices of pairs and date ranges are
+read from the arrays without loading the rest of the panel.
+'''
+
+PANEL_DIR_NAME = '.panel'
+PANEL_META_FILE_NAME = 'panel.json'
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume in USDT']
+
+
+def get_panel_field_file_name(field):
+    return '{}.npy'.format(field.replace(' ', '_'))
+
+
+def get_catalog_stamps(entries):
+    """
+    Get the size and modification time of the files of catalog entries, by
+    file name.
+    """
+
+    return {
+        entry['file_name']: [entry['file_size'], entry['file_mtime_ns']]
+        for entry in entries
+    }
+
+
+def write_price_panel(dir_path, entries, load_pair_df, dtype=np.float64):
+    """
+    Build the price panel of a saved data directory from the catalog entries
+    of its pair files. load_pair_df(entry) returns the saved dataframe of a
+    pair. Pairs are written into the memory-mapped arrays one at a time, so
+    only one pair is held in memory. Returns False if the pairs have no
+    common time axis, e.g. open times of different phases.
+    """
+
+    entries = sorted(entries, key=lambda entry: entry['pair'])
+
+    if not entries:
+        return False
+
+    interval_ms = entries[0]['interval_ms']
+
+    if interval_ms <= 0 or any(
+            entry['interval_ms'] != interval_ms or entry['start_ms'] %
+            interval_ms != entries[0]['start_ms'] % interval_ms
+            for entry in entries):
+        return False
+
+    start_ms = min(entry['start_ms'] for entry in entries)
+    end_ms = max(entry['end_ms'] for entry in entries)
+    rows = (end_ms - start_ms) // interval_ms + 1
+
+    panel_dir_path = os.path.join(dir_path, PANEL_DIR_NAME)
+    temp_dir_path = panel_dir_path + '.tmp'
+
+    if os.path.exists(temp_dir_path):
+        shutil.rmtree(temp_dir_path)
+
+    os.makedirs(temp_dir_path)
+
+    arrays = {
+        field:
+        np.lib.format.open_memmap(os.path.join(
+            temp_dir_path, get_panel_field_file_name(field)),
+                                  mode='w+',
+                                  dtype=dtype,
+                                  shape=(len(entries), rows))
+        for field in PANEL_FIELDS
+    }
+
+    for symbol_index, entry in enumerate(entries):
+        df = load_pair_df(entry)
+        time_index = (df['Open Time'].to_numpy().astype(
+            'datetime64[ms]').astype(np.int64) - start_ms) // interval_ms
+
+        for field, array in arrays.items():
+            array[symbol_index] = np.nan
+            array[symbol_index, time_index] = df[field].to_numpy()
+
+    for array in arrays.values():
+        array.flush()
+
+    del arrays
+
+    meta = {
+        'start_ms': start_ms,
+        'interval_ms': interval_ms,
+        'rows': rows,
+        'dtype': np.dtype(dtype).name,
+        'symbols': [entry['pair'] for entry in entries],
+        'files': get_catalog_stamps(entries),
+    }
+
+    with open(os.path.join(temp_dir_path, PANEL_META_FILE_NAME), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(panel_dir_path):
+        shutil.rmtree(panel_dir_path)
+
+    os.replace(temp_dir_path, panel_dir_path)
+
+    return True
+
+
+def open_price_panel(dir_path, entries=None):
+    """
+    Open the price panel of a saved data directory, or None if there is none.
+    If catalog entries are given, None is also returned when the panel was
+    built from other files than theirs.
+    """
+
+    panel_dir_path = os.path.join(dir_path, PANEL_DIR_NAME)
+
+    try:
+        with open(os.path.join(panel_dir_path, PANEL_META_FILE_NAME),
+                  'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if entries is not None and get_catalog_stamps(entries) != meta['files']:
+        return None
+
+    return PricePanel(panel_dir_path, meta)
+
+
+class PricePanel:
+    """
+    Memory-mapped price fields of all pairs of a saved data directory on a
+    shared time axis. Arrays are mapped when first used and indexed as
+    [pair, candlestick].
+    """
+
+    def __init__(self, panel_dir_path, meta):
+        self.panel_dir_path = panel_dir_path
+        self.start_ms = meta['start_ms']
+        self.interval_ms = meta['interval_ms']
+        self.rows = meta['rows']
+        self.symbols = meta['symbols']
+        self.symbol_index = {
+            symbol: index
+            for index, symbol in enumerate(self.symbols)
+        }
+        self.arrays = {}
+
+    def get_open_times(self, time_slice=slice(None)):
+        """
+        Get the open times of a slice of the time axis.
+        """
+
+        start_index, end_index, _ = time_slice.indices(self.rows)
+
+        return pd.Index(pd.to_datetime(
+            self.start_ms + np.arange(start_index, end_index, dtype=np.int64) *
+            self.interval_ms,
+            unit='ms'),
+                        name='Open Time')
+
+    def get_array(self, field):
+        """
+        Get the read-only memory-mapped array of a price field.
+        """
+
+        if field not in self.arrays:
+            self.arrays[field] = np.load(os.path.join(
+                self.panel_dir_path, get_panel_field_file_name(field)),
+                                         mmap_mode='r')
+
+        return self.arrays[field]
+
+    def get_time_slice(self, start_time=None, end_time=None):
+        """
+        Get the slice of the time axis between two times, both included.
+        """
+
+        start_index, end_index = 0, self.rows
+
+        if start_time is not None:
+            start_index = -(
+                -(pd.Timestamp(start_time).value // 10**6 - self.start_ms) //
+                self.interval_ms)
+
+        if end_time is not None:
+            end_index = (pd.Timestamp(end_time).value // 10**6 -
+                         self.start_ms) // self.interval_ms + 1
+
+        return slice(min(max(start_index, 0), self.rows),
+                     min(max(end_index, 0), self.rows))
+
+    def get_time_index(self, open_times):
+        """
+        Get the positions of sorted open times on the time axis, as a slice if
+        they are consecutive, or None if any of them is not on it.
+        """
+
+        open_times_ms = open_times.to_numpy().astype('datetime64[ms]').astype(
+            np.int64) - self.start_ms
+        time_index = open_times_ms // self.interval_ms
+
+        if np.any(open_times_ms % self.interval_ms) or np.any(
+                time_index < 0) or np.any(time_index >= self.rows):
+            return None
+
+        # Consecutive open times are sliced, so they are read without a copy
+        if len(time_index) > 0 and time_index[-1] - time_index[0] + 1 == len(
+                time_index):
+            return slice(int(time_index[0]), int(time_index[-1]) + 1)
+
+        return time_index
+
+    def get_values(self, field, pairs, start_time=None, end_time=None):
+        """
+        Get the values of a price field as a (candlestick, pair) array. A
+        single pair or a run of neighbouring pairs is a view of the mapped
+        array, other pair lists copy the selected pairs only.
+        """
+
+        symbol_index = [self.symbol_index[pair] for pair in pairs]
+        time_slice = self.get_time_slice(start_time, end_time)
+        array = self.get_array(field)
+
+        if symbol_index and symbol_index == list(
+                range(symbol_index[0], symbol_index[0] + len(symbol_index))):
+            return array[symbol_index[0]:symbol_index[0] + len(symbol_index),
+                         time_slice].T
+
+        return array[symbol_index, time_slice].T
+
+    def get_df(self, field, pairs, start_time=None, end_time=None):
+        """
+        Get the values of a price field as a dataframe indexed by open time
+        with a column per pair.
+        """
+
+        time_slice = self.get_time_slice(start_time, end_time)
+
+        return pd.DataFrame(self.get_values(field, pairs, start_time,
+                                            end_time),
+                            index=self.get_open_times(time_slice),
+                            columns=pairs,
+                            copy=False)
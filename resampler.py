@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+'''
+Resampling of saved candlesticks into longer intervals.
+
+Candlesticks of a base interval, e.g. 1m, are grouped into the buckets of a
+longer interval aligned as the CEX aligns its own candlesticks: intervals of
+up to a day and multiples of a day start at midnight of the CEX's time zone,
+weeks start on Monday and month intervals start on the first day of a
+calendar month (a calendar quarter for 3 months). Each bucket takes the first
+open, the highest high, the lowest low, the last close and the summed volume
+of its candlesticks, skipping NaN values. Buckets missing any candlestick of
+the base interval, e.g. the still open last bucket, are left out, so they
+show up as missing candlesticks in the quality record of the resampled
+pair.
+'''
+
+# Resampled intervals of a saved data directory are saved in
+# <directory>/.resampled/<interval>
+RESAMPLED_DIR_NAME = '.resampled'
+RESAMPLED_META_FILE_NAME = '.resampled.json'
+
+# Month intervals have a nominal length of 30 days in the interval tables
+MONTH_INTERVAL_SECONDS = 2592000
+WEEK_INTERVAL_SECONDS = 604800
+DAY_INTERVAL_SECONDS = 86400
+
+# 1970-01-01 was a Thursday, so weeks are counted from Monday 1970-01-05
+WEEK_ANCHOR_MS = 4 * DAY_INTERVAL_SECONDS * 1000
+
+
+def get_interval_months(interval_seconds):
+    """
+    Get the number of calendar months of an interval, or 0 if it is not a
+    month interval.
+    """
+
+    if interval_seconds >= MONTH_INTERVAL_SECONDS and interval_seconds % MONTH_INTERVAL_SECONDS == 0:
+        return interval_seconds // MONTH_INTERVAL_SECONDS
+
+    return 0
+
+
+def can_resample(base_interval_seconds, interval_seconds):
+    """
+    Check if candlesticks of the base interval fit exactly into the buckets
+    of the longer interval.
+    """
+
+    if base_interval_seconds <= 0 or interval_seconds <= base_interval_seconds:
+        return False
+
+    if get_interval_months(interval_seconds):
+        return DAY_INTERVAL_SECONDS % base_interval_seconds == 0
+
+    return interval_seconds % base_interval_seconds == 0
+
+
+def get_bucket_open_times_ms(open_times_ms, interval_seconds, utc_offset=0):
+    """
+    Get the open time of the bucket of each open time in ms, for buckets of
+    interval_seconds aligned to midnight at a UTC offset in seconds.
+    """
+
+    utc_offset_ms = utc_offset * 1000
+    local_times_ms = open_times_ms + utc_offset_ms
+    interval_months = get_interval_months(interval_seconds)
+
+    if interval_months:
+        months = local_times_ms.astype('datetime64[ms]').astype(
+            'datetime64[M]').astype(np.int64)
+        bucket_months = months - months % interval_months
+        bucket_times_ms = bucket_months.astype('datetime64[M]').astype(
+            'datetime64[ms]').astype(np.int64)
+
+    else:
+        interval_ms = interval_seconds * 1000
+        anchor_ms = WEEK_ANCHOR_MS if interval_seconds % WEEK_INTERVAL_SECONDS == 0 else 0
+        bucket_times_ms = (local_times_ms -
+                           anchor_ms) // interval_ms * interval_ms + anchor_ms
+
+    return bucket_times_ms - utc_offset_ms
+
+
+def get_next_bucket_open_times_ms(bucket_times_ms,
+                                  interval_seconds,
+                                  utc_offset=0):
+    """
+    Get the open time of the bucket after each bucket open time in ms.
+    """
+
+    interval_months = get_interval_months(interval_seconds)
+
+    if not interval_months:
+        return bucket_times_ms + interval_seconds * 1000
+
+    utc_offset_ms = utc_offset * 1000
+    months = (
+        bucket_times_ms +
+        utc_offset_ms).astype('datetime64[ms]').astype('datetime64[M]').astype(
+            np.int64)
+
+    return (months + interval_months).astype('datetime64[M]').astype(
+        'datetime64[ms]').astype(np.int64) - utc_offset_ms
+
+
+def resample_candlesticks(df,
+                          interval_seconds,
+                          base_interval_seconds,
+                          utc_offset=0):
+    """
+    Resample a saved candlestick dataframe of base_interval_seconds sorted by
+    open time into buckets of interval_seconds. Buckets missing any of their
+    base candlesticks are dropped, as their open, close and volume would be
+    incomplete. Open and close are the first and last values that are not
+    NaN, other NaN values are skipped and a value is NaN if all values of
+    its bucket are.
+    """
+
+    columns = ['Open Time', 'Open', 'High', 'Low', 'Close', 'Volume in USDT']
+
+    if df.empty:
+        return df[columns].copy()
+
+    open_times_ms = df['Open Time'].to_numpy().astype('datetime64[ms]').astype(
+        np.int64)
+    bucket_times_ms = get_bucket_open_times_ms(open_times_ms, interval_seconds,
+                                               utc_offset)
+
+    starts = np.flatnonzero(
+        np.concatenate(([True], bucket_times_ms[1:] != bucket_times_ms[:-1])))
+    ends = np.concatenate((starts[1:], [len(df)])) - 1
+    bucket_open_times_ms = bucket_times_ms[starts]
+
+    # A bucket is complete if it has a candlestick at every open time of the
+    # base interval, counting duplicate open times once
+    base_interval_ms = base_interval_seconds * 1000
+    on_grid = np.concatenate(([True], np.diff(open_times_ms) != 0)) & (
+        (open_times_ms - bucket_times_ms) % base_interval_ms == 0)
+    expected_counts = (get_next_bucket_open_times_ms(
+        bucket_open_times_ms, interval_seconds, utc_offset) -
+                       bucket_open_times_ms) // base_interval_ms
+    complete = np.add.reduceat(on_grid, starts) == expected_counts
+
+    rows = np.arange(len(df))
+    opens = df['Open'].to_numpy()
+    closes = df['Close'].to_numpy()
+    first_open_rows = np.minimum.reduceat(
+        np.where(np.isnan(opens), len(df), rows), starts)
+    last_close_rows = np.maximum.reduceat(np.where(np.isnan(closes), -1, rows),
+                                          starts)
+
+    volume = df['Volume in USDT'].to_numpy()
+    volume_counts = np.add.reduceat(~np.isnan(volume), starts)
+
+    resampled_df = pd.DataFrame({
+        'Open Time':
+        pd.to_datetime(bucket_open_times_ms, unit='ms'),
+        'Open':
+        np.where(first_open_rows <= ends,
+                 opens[np.minimum(first_open_rows,
+                                  len(df) - 1)], np.nan),
+        'High':
+        np.fmax.reduceat(df['High'].to_numpy(), starts),
+        'Low':
+        np.fmin.reduceat(df['Low'].to_numpy(), starts),
+        'Close':
+        np.where(last_close_rows >= starts,
+                 closes[np.maximum(last_close_rows, 0)], np.nan),
+        'Volume in USDT':
+        np.where(
+            volume_counts > 0,
+            np.add.reduceat(np.where(np.isnan(volume), 0, volume), starts),
+            np.nan),
+    })
+
+    return resampled_df[complete].reset_index(drop=True)
@@ -0,0 +1,238 @@
+import os
+import sys
+import pickle
+import hashlib
+import numpy as np
+from download_manifest import write_file_atomically
+'''
+Persistent cache of processed results, e.g. the dataframes of process_data
+and sanitize_data.
+
+Results are saved as pickles named after a hash of the function, its
+arguments and a fingerprint of its input data, so a changed input is never
+answered from the cache. The least recently used results are deleted once
+the cache directory grows beyond its size limit. The messages a function
+prints are cached with its result and printed again when it is loaded.
+'''
+
+# Bump to invalidate all cached results when the processing changes
+RESULT_CACHE_VERSION = 1
+
+# Files deleted by clear_result_cache
+CACHE_FILE_SUFFIXES = ('.pkl', '.sqlite')
+
+result_cache_config = {
+    'dir_path': './saved_data/.cache',
+    'max_bytes': 1024**3,
+    'enabled': True,
+}
+
+
+def configure_result_cache(dir_path=None, max_bytes=None, enabled=None):
+    """
+    Update the result cache settings. Set enabled to False to always compute
+    the results.
+    """
+
+    if dir_path is not None:
+        result_cache_config['dir_path'] = dir_path
+    if max_bytes is not None:
+        result_cache_config['max_bytes'] = max_bytes
+    if enabled is not None:
+        result_cache_config['enabled'] = enabled
+
+
+def get_dir_fingerprint(dir_path):
+    """
+    Get the name, size and modification time of every file in a directory,
+    as a fingerprint that changes whenever a file is saved or removed.
+    """
+
+    if not os.path.isdir(dir_path):
+        return None
+
+    return sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                  for entry in os.scandir(dir_path)
+                  if entry.is_file() and not entry.name.startswith('.'))
+
+
+def get_df_fingerprint(df):
+    """
+    Get a hash of the columns, index and values of a dataframe.
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(pickle.dumps([str(column) for column in df.columns]))
+    digest.update(pickle.dumps([str(dtype) for dtype in df.dtypes]))
+    digest.update(np.ascontiguousarray(df.index.to_numpy()).tobytes())
+
+    for column in df.columns:
+        values = df[column].to_numpy()
+
+        if values.dtype == object:
+            digest.update(pickle.dumps(values.tolist()))
+        else:
+            digest.update(np.ascontiguousarray(values).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_cache_key(name, args, fingerprint):
+    """
+    Get the cache key of a result of a function called with args on the
+    input data identified by fingerprint, or None if the arguments cannot be
+    pickled.
+    """
+
+    try:
+        content = pickle.dumps((RESULT_CACHE_VERSION, name, args, fingerprint),
+                               protocol=4)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_cache_file_path(key):
+    return os.path.join(result_cache_config['dir_path'], key + '.pkl')
+
+
+def load_cached_result(key):
+    """
+    Get a cached result, or None if it is not cached.
+    """
+
+    if not result_cache_config['enabled']:
+        return None
+
+    file_path = get_cache_file_path(key)
+
+    try:
+        with open(file_path, 'rb') as file:
+            result = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError):
+        return None
+
+    # The modification time records when the result was last used
+    try:
+        os.utime(file_path)
+    except OSError:
+        pass
+
+    return result
+
+
+def save_cached_result(key, result):
+    """
+    Cache a result, then delete the least recently used results beyond the
+    size limit of the cache.
+    """
+
+    if not result_cache_config['enabled']:
+        return
+
+    os.makedirs(result_cache_config['dir_path'], exist_ok=True)
+    write_file_atomically(
+        get_cache_file_path(key), lambda file: pickle.dump(
+            result, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+    evict_cached_results()
+
+
+def evict_cached_results():
+    """
+    Delete the least recently used results until the cache fits into its
+    size limit.
+    """
+
+    dir_path = result_cache_config['dir_path']
+    cached_files = []
+
+    for entry in os.scandir(dir_path):
+        if entry.is_file() and entry.name.endswith('.pkl'):
+            file_stat = entry.stat()
+            cached_files.append(
+                (file_stat.st_mtime_ns, file_stat.st_size, entry.path))
+
+    total_bytes = sum(file_size for _, file_size, _ in cached_files)
+
+    for _, file_size, file_path in sorted(cached_files):
+        if total_bytes <= result_cache_config['max_bytes']:
+            break
+
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+        total_bytes -= file_size
+
+
+def clear_result_cache():
+    """
+    Delete all cached results, including the databases of results cached
+    per item, e.g. the p-values of cointegration.py.
+    """
+
+    dir_path = result_cache_config['dir_path']
+
+    if not os.path.isdir(dir_path):
+        return
+
+    for entry in os.scandir(dir_path):
+        if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIXES):
+            os.remove(entry.path)
+
+
+class OutputRecorder:
+    """
+    Stream that writes to another stream and records what was written.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def get_output(self):
+        return ''.join(self.parts)
+
+
+def run_cached(key, function, *args, **kwargs):
+    """
+    Get the cached result of a cache key, printing the messages recorded with
+    it, or call the function and cache its result unless it is None.
+    """
+
+    if key is None or not result_cache_config['enabled']:
+        return function(*args, **kwargs)
+
+    cached = load_cached_result(key)
+
+    if cached is not None:
+        result, output = cached
+        sys.stdout.write(output)
+        return result
+
+    recorder = OutputRecorder(sys.stdout)
+    sys.stdout = recorder
+
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        sys.stdout = recorder.stream
+
+    if result is not None:
+        try:
+            save_cached_result(key, (result, recorder.get_output()))
+        except (OSError, pickle.PicklingError) as e:
+            print('\nUnable to cache the result: {}'.format(e))
+
+    return result
@@ -0,0 +1,109 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+'''
+Sanitized price panel returned by sanitize_data.
+
+All pairs are cleaned together as one 2D array: infinite values are treated
+as missing, gaps are linearly interpolated and the missing values before the
+first and after the last value of a pair are filled with that value. The
+panel keeps one array per price field with a column per pair on a shared
+index, and still behaves like the dict of per-pair dataframes sanitize_data
+used to return.
+'''
+
+
+def fill_missing_values(values):
+    """
+    Fill the missing and infinite values of each column of a 2D array, as
+    interpolate(method='linear') followed by ffill() and bfill() would.
+    Returns a new array of the same dtype.
+    """
+
+    values = np.asarray(values)
+    filled = values.astype(np.float64)
+    missing = ~np.isfinite(filled)
+
+    if not missing.any():
+        return filled.astype(values.dtype, copy=False)
+
+    row_count = filled.shape[0]
+    rows = np.arange(row_count)[:, None]
+    column_index = np.broadcast_to(np.arange(filled.shape[1]), filled.shape)
+
+    # Row of the last value at or before and the first value at or after
+    # each row, or -1 / row_count if there is none
+    previous_rows = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    next_rows = np.minimum.accumulate(np.where(missing, row_count, rows)[::-1],
+                                      axis=0)[::-1]
+
+    previous_values = filled[np.maximum(previous_rows, 0), column_index]
+    next_values = filled[np.minimum(next_rows, row_count - 1), column_index]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Same operation order as np.interp, which pandas interpolates with
+        slopes = (next_values - previous_values) / (next_rows - previous_rows)
+        interpolated = slopes * (rows - previous_rows) + previous_values
+
+    interpolated = np.where(previous_rows < 0, next_values, interpolated)
+    interpolated = np.where(next_rows >= row_count, previous_values,
+                            interpolated)
+
+    filled[missing] = interpolated[missing]
+
+    return filled.astype(values.dtype, copy=False)
+
+
+class SanitizedPanel(Mapping):
+    """
+    Sanitized prices of several pairs on a shared index.
+
+    values maps each price field (e.g. 'Close') to a 2D array with a row per
+    open time and a column per pair, in the order of pairs. Indexing the
+    panel by pair gives a dataframe of that pair's fields, as the dict
+    returned by sanitize_data did.
+    """
+
+    def __init__(self, index, pairs, values):
+        self.index = index
+        self.pairs = list(pairs)
+        self.values = values
+        self.fields = list(values)
+        self.pair_index = {pair: i for i, pair in enumerate(self.pairs)}
+        self.pair_dfs = {}
+
+    def __getitem__(self, pair):
+        if pair not in self.pair_dfs:
+            i = self.pair_index[pair]
+            self.pair_dfs[pair] = pd.DataFrame(
+                {field: self.values[field][:, i]
+                 for field in self.fields},
+                index=self.index)
+
+        return self.pair_dfs[pair]
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def get_values(self, field='Close', pairs=None):
+        """
+        Get a price field as a 2D array with a column per pair, for all pairs
+        or the given ones.
+        """
+
+        if pairs is None:
+            return self.values[field]
+
+        return self.values[field][:, [self.pair_index[pair] for pair in pairs]]
+
+    def to_frame(self, field='Close'):
+        """
+        Get a price field as a dataframe with a column per pair.
+        """
+
+        return pd.DataFrame(self.values[field],
+                            index=self.index,
+                            columns=self.pairs)
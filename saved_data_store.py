@@ -0,0 +1,352 @@
+import os
+import shutil
+from download_manifest import write_file_atomically
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+'''
+Generations of a saved data directory, e.g. ./saved_data/binance/1h.
+
+A download run writes into a new generation directory next to the current
+one and publishes it by replacing the CURRENT pointer file atomically once
+all its files are written. Readers resolve the pointer once and keep reading
+that generation, so a refresh never shows them half-written or missing
+files. Update and resume runs start from a copy of the current generation
+made of hard links, so unchanged files are not copied. Writers of the same
+directory are serialised with a lock file, and readers hold a shared lock on
+their generation so old generations are only deleted when nobody reads them.
+Locks need fcntl and are skipped where it is not available; the previous
+generation is then still kept for readers that resolved the pointer just
+before a refresh was published.
+'''
+
+GENERATION_POINTER_FILE_NAME = 'CURRENT'
+GENERATION_DIR_PREFIX = 'gen-'
+WRITER_LOCK_FILE_NAME = '.writer.lock'
+READER_LOCK_FILE_NAME = '.reader.lock'
+
+# Published generations kept besides the current one
+KEEP_OLD_GENERATIONS = 1
+
+# Files updated in place, which are copied instead of linked into a new
+# generation
+COPIED_FILE_NAMES = ['.catalog.sqlite', '.manifest.json']
+
+
+def lock_file(file_path, shared=False, blocking=True):
+    """
+    Open and lock a lock file. Returns the open file, which holds the lock
+    until it is closed, or None if blocking is False and the lock is held
+    elsewhere.
+    """
+
+    file = open(file_path, 'a')
+
+    if fcntl is None:
+        return file
+
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+
+    try:
+        fcntl.flock(file, flags)
+    except BlockingIOError:
+        file.close()
+        return None
+
+    return file
+
+
+def get_generation_dir_name(generation):
+    return '{}{:08d}'.format(GENERATION_DIR_PREFIX, generation)
+
+
+def get_generations(base_dir_path):
+    """
+    Get the numbers of all generation directories, in ascending order.
+    """
+
+    if not os.path.isdir(base_dir_path):
+        return []
+
+    generations = []
+
+    for file in os.listdir(base_dir_path):
+        if file.startswith(GENERATION_DIR_PREFIX
+                           ) and file[len(GENERATION_DIR_PREFIX):].isdigit():
+            generations.append(int(file[len(GENERATION_DIR_PREFIX):]))
+
+    return sorted(generations)
+
+
+def get_current_generation(base_dir_path):
+    """
+    Get the number of the published generation, or None if the directory
+    has none, e.g. because it was saved before generations were used.
+    """
+
+    try:
+        with open(os.path.join(base_dir_path, GENERATION_POINTER_FILE_NAME),
+                  'r') as f:
+            dir_name = f.read().strip()
+    except OSError:
+        return None
+
+    if not dir_name.startswith(GENERATION_DIR_PREFIX):
+        return None
+
+    return int(dir_name[len(GENERATION_DIR_PREFIX):])
+
+
+def get_snapshot_dir_path(base_dir_path):
+    """
+    Get the directory of the published generation, or the directory itself
+    if it has no generations.
+    """
+
+    generation = get_current_generation(base_dir_path)
+
+    if generation is None:
+        return base_dir_path
+
+    return os.path.join(base_dir_path, get_generation_dir_name(generation))
+
+
+class SavedDataSnapshot:
+    """
+    Context manager that resolves the published generation of a saved data
+    directory and holds a shared lock on it while it is read.
+    """
+
+    def __init__(self, base_dir_path):
+        self.base_dir_path = base_dir_path
+        self.lock = None
+
+    def __enter__(self):
+        while True:
+            generation = get_current_generation(self.base_dir_path)
+
+            if generation is None:
+                return self.base_dir_path
+
+            dir_path = os.path.join(self.base_dir_path,
+                                    get_generation_dir_name(generation))
+
+            try:
+                lock = lock_file(os.path.join(dir_path, READER_LOCK_FILE_NAME),
+                                 shared=True)
+            except OSError as e:
+                # The generation was deleted after the pointer was read, so
+                # the pointer has moved on to a newer one
+                if get_current_generation(self.base_dir_path) != generation:
+                    continue
+
+                if not os.path.isdir(dir_path):
+                    raise FileNotFoundError(
+                        'The published generation {} of {} does not exist.'.
+                        format(get_generation_dir_name(generation),
+                               self.base_dir_path)) from e
+
+                raise
+
+            # A generation that is still current is never deleted
+            if get_current_generation(self.base_dir_path) == generation:
+                self.lock = lock
+                return dir_path
+
+            lock.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+
+def clone_dir(source_dir_path, dir_path, skip=()):
+    """
+    Copy a directory tree with hard links, copying the files that are
+    updated in place. Falls back to copies where hard links are not
+    supported.
+    """
+
+    def link_or_copy(source_file_path, file_path):
+        if os.path.basename(source_file_path) in COPIED_FILE_NAMES:
+            return shutil.copy2(source_file_path, file_path)
+
+        try:
+            os.link(source_file_path, file_path)
+        except OSError:
+            shutil.copy2(source_file_path, file_path)
+
+        return file_path
+
+    os.makedirs(dir_path, exist_ok=True)
+
+    for file in os.listdir(source_dir_path):
+        if file in skip or file.endswith('.tmp'):
+            continue
+
+        source_file_path = os.path.join(source_dir_path, file)
+        file_path = os.path.join(dir_path, file)
+
+        if os.path.isdir(source_file_path):
+            shutil.copytree(source_file_path,
+                            file_path,
+                            copy_function=link_or_copy,
+                            ignore=shutil.ignore_patterns('*.tmp'))
+        else:
+            link_or_copy(source_file_path, file_path)
+
+
+class GenerationWriter:
+    """
+    Writer of a new generation of a saved data directory. Holds the writer
+    lock of the directory from creation until close.
+    """
+
+    def __init__(self, base_dir_path):
+        self.base_dir_path = base_dir_path
+        self.generation = None
+
+        os.makedirs(base_dir_path, exist_ok=True)
+
+        lock_file_path = os.path.join(base_dir_path, WRITER_LOCK_FILE_NAME)
+        self.lock = lock_file(lock_file_path, blocking=False)
+
+        if self.lock is None:
+            print('\nWaiting for another download into directory {}...'.format(
+                base_dir_path))
+            self.lock = lock_file(lock_file_path)
+
+    @property
+    def dir_path(self):
+        return os.path.join(self.base_dir_path,
+                            get_generation_dir_name(self.generation))
+
+    def get_unpublished_dir_path(self):
+        """
+        Get the newest generation written by an interrupted run, or None.
+        """
+
+        current_generation = get_current_generation(self.base_dir_path)
+        generations = [
+            generation for generation in get_generations(self.base_dir_path)
+            if current_generation is None or generation > current_generation
+        ]
+
+        if not generations:
+            return None
+
+        return os.path.join(self.base_dir_path,
+                            get_generation_dir_name(generations[-1]))
+
+    def begin(self, source_dir_path=None):
+        """
+        Start the new generation and get its directory. It starts empty, as
+        a copy of source_dir_path, or continues source_dir_path itself if
+        that is an unpublished generation. Other unpublished generations are
+        deleted.
+        """
+
+        unpublished_dir_path = self.get_unpublished_dir_path()
+        generations = get_generations(self.base_dir_path)
+
+        if source_dir_path is not None and unpublished_dir_path is not None and os.path.samefile(
+                source_dir_path, unpublished_dir_path):
+            self.generation = generations[-1]
+            return self.dir_path
+
+        current_generation = get_current_generation(self.base_dir_path)
+
+        for generation in generations:
+            if current_generation is None or generation > current_generation:
+                shutil.rmtree(os.path.join(
+                    self.base_dir_path, get_generation_dir_name(generation)),
+                              ignore_errors=True)
+
+        self.generation = max(generations + [0]) + 1
+
+        if source_dir_path is not None and os.path.isdir(source_dir_path):
+            clone_dir(source_dir_path,
+                      self.dir_path,
+                      skip=self.get_base_file_names() + [
+                          get_generation_dir_name(self.generation),
+                          READER_LOCK_FILE_NAME
+                      ])
+        else:
+            os.makedirs(self.dir_path)
+
+        return self.dir_path
+
+    def get_base_file_names(self):
+        return [GENERATION_POINTER_FILE_NAME, WRITER_LOCK_FILE_NAME] + [
+            get_generation_dir_name(generation)
+            for generation in get_generations(self.base_dir_path)
+        ]
+
+    def publish(self):
+        """
+        Make the new generation the one readers load, then delete the
+        generations that are no longer needed.
+        """
+
+        write_file_atomically(
+            os.path.join(self.base_dir_path, GENERATION_POINTER_FILE_NAME),
+            lambda f: f.write(get_generation_dir_name(self.generation)),
+            mode='w')
+
+        self.collect_garbage()
+
+    def collect_garbage(self):
+        """
+        Delete old generations that no reader holds, keeping the newest
+        KEEP_OLD_GENERATIONS of them, and the files saved in the directory
+        itself before generations were used.
+        """
+
+        current_generation = get_current_generation(self.base_dir_path)
+
+        if current_generation is None:
+            return
+
+        old_generations = [
+            generation for generation in get_generations(self.base_dir_path)
+            if generation < current_generation
+        ]
+
+        for generation in old_generations[:max(
+                len(old_generations) - KEEP_OLD_GENERATIONS, 0)]:
+            dir_path = os.path.join(self.base_dir_path,
+                                    get_generation_dir_name(generation))
+            lock = lock_file(os.path.join(dir_path, READER_LOCK_FILE_NAME),
+                             blocking=False)
+
+            if lock is None:
+                continue
+
+            try:
+                shutil.rmtree(dir_path, ignore_errors=True)
+            finally:
+                lock.close()
+
+        base_file_names = self.get_base_file_names()
+
+        for file in os.listdir(self.base_dir_path):
+            if file in base_file_names:
+                continue
+
+            file_path = os.path.join(self.base_dir_path, file)
+
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path, ignore_errors=True)
+            else:
+                os.remove(file_path)
+
+    def close(self):
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import pickle
+import threading
+import pandas as pd
+from download_manifest import write_file_atomically
+from saved_data_store import lock_file
+'''
+Append-only segment store of a time series, e.g. the sentiment scores of one
+source, tag and CEX interval.
+
+Each save writes the new rows only, as a segment file, and records its time
+range in an index. Reads use the index to open the segments that overlap the
+requested range. Segments are merged into one by compaction, on demand or by
+the save that makes them too many. The index is replaced atomically after
+the segment files it lists are in place, so an interrupted save or
+compaction never loses saved rows. Saves and compactions hold a lock file of
+the directory, so saves of several processes never write the same segment.
+'''
+
+SEGMENT_INDEX_FILE_NAME = '.segments.json'
+SEGMENT_LOCK_FILE_NAME = '.segments.lock'
+SEGMENT_FILE_PATTERN = re.compile(r'^segment-(\d+)\.pkl$')
+
+# Segments are compacted by the save that gives a store more of them
+SEGMENT_COMPACT_THRESHOLD = 16
+
+# Stores of the same directory in a process share a lock besides the lock
+# file, which is not available everywhere
+store_locks = {}
+store_locks_lock = threading.Lock()
+
+
+def get_store_lock(dir_path):
+    with store_locks_lock:
+        return store_locks.setdefault(os.path.abspath(dir_path),
+                                      threading.Lock())
+
+
+def get_segment_file_name(seq):
+    return 'segment-{:08d}.pkl'.format(seq)
+
+
+class SegmentStore:
+    """
+    Segment store of a time series in a directory. Rows are identified by
+    their time column; a row saved earlier is kept over a later one with the
+    same time.
+    """
+
+    def __init__(self, dir_path, time_column='Open Time'):
+        self.dir_path = dir_path
+        self.time_column = time_column
+        self.lock = get_store_lock(dir_path)
+
+    def lock_store(self):
+        """
+        Lock the store against saves and compactions of other processes,
+        while self.lock is held against other threads. Returns the open lock
+        file, which holds the lock until it is closed.
+        """
+
+        os.makedirs(self.dir_path, exist_ok=True)
+
+        return lock_file(os.path.join(self.dir_path, SEGMENT_LOCK_FILE_NAME))
+
+    def get_index_path(self):
+        return os.path.join(self.dir_path, SEGMENT_INDEX_FILE_NAME)
+
+    def read_segment(self, file_name):
+        with open(os.path.join(self.dir_path, file_name), 'rb') as file:
+            return pickle.load(file)
+
+    def get_segment_entry(self, file_name, df):
+        return {
+            'file_name': file_name,
+            'start': df[self.time_column].min().isoformat(),
+            'end': df[self.time_column].max().isoformat(),
+            'rows': len(df),
+        }
+
+    def load_index(self):
+        """
+        Get the index of the store, with the segments of interrupted saves
+        added. Files of a directory saved before the store existed, i.e.
+        one .pkl file per save, are taken over as segments the first time.
+        Returns the index and the leftover segment files of an interrupted
+        compaction.
+        """
+
+        index = {'next_seq': 0, 'segments': []}
+
+        try:
+            with open(self.get_index_path(), 'r') as f:
+                index = json.load(f)
+            has_index = True
+        except (OSError, ValueError):
+            has_index = False
+
+        if not os.path.exists(self.dir_path):
+            return index, []
+
+        indexed_file_names = set(segment['file_name']
+                                 for segment in index['segments'])
+        new_file_names = []
+        stale_file_names = []
+
+        for file in sorted(os.listdir(self.dir_path)):
+            if file in indexed_file_names or not file.endswith('.pkl'):
+                continue
+
+            match = SEGMENT_FILE_PATTERN.match(file)
+
+            if match is None:
+                if not has_index:
+                    new_file_names.append(file)
+            elif int(match.group(1)) >= index['next_seq']:
+                new_file_names.append(file)
+            else:
+                stale_file_names.append(file)
+
+        for file in new_file_names:
+            try:
+                df = self.read_segment(file)
+            except:
+                continue
+
+            if df is None or self.time_column not in getattr(
+                    df, 'columns', []) or df.empty:
+                continue
+
+            index['segments'].append(self.get_segment_entry(file, df))
+
+            match = SEGMENT_FILE_PATTERN.match(file)
+
+            if match is not None:
+                index['next_seq'] = max(index['next_seq'],
+                                        int(match.group(1)) + 1)
+
+        return index, stale_file_names
+
+    def save_index(self, index):
+        content = json.dumps(index, indent=2)
+
+        write_file_atomically(self.get_index_path(),
+                              lambda f: f.write(content),
+                              mode='w')
+
+    def read(self, start_time=None, end_time=None):
+        """
+        Get the rows between two times, both included, sorted by time. Only
+        the segments that overlap the range are read.
+        """
+
+        index, _ = self.load_index()
+        start_time = None if start_time is None else pd.Timestamp(start_time)
+        end_time = None if end_time is None else pd.Timestamp(end_time)
+
+        dfs = []
+
+        for segment in index['segments']:
+            if start_time is not None and pd.Timestamp(
+                    segment['end']) < start_time:
+                continue
+            if end_time is not None and pd.Timestamp(
+                    segment['start']) > end_time:
+                continue
+
+            dfs.append(self.read_segment(segment['file_name']))
+
+        if not dfs:
+            return None
+
+        df = pd.concat(dfs, axis=0, ignore_index=True)
+        df = df.drop_duplicates(subset=self.time_column)
+
+        if start_time is not None:
+            df = df[df[self.time_column] >= start_time]
+        if end_time is not None:
+            df = df[df[self.time_column] <= end_time]
+
+        return df.sort_values(by=self.time_column,
+                              ascending=True).reset_index(drop=True)
+
+    def append(self, df):
+        """
+        Save the rows of a dataframe that are not saved yet as a new segment.
+        Only the segments that overlap the new rows are read to find them.
+        Returns the number of rows saved.
+        """
+
+        df = df.drop_duplicates(subset=self.time_column)
+
+        with self.lock:
+            store_lock = self.lock_store()
+
+            try:
+                saved_row_count, segment_count = self.append_segment(df)
+            finally:
+                store_lock.close()
+
+        if segment_count > SEGMENT_COMPACT_THRESHOLD:
+            self.compact()
+
+        return saved_row_count
+
+    def append_segment(self, df):
+        """
+        Save the rows of a dataframe that are not saved yet as a new segment
+        while the store is locked. Returns the number of rows saved and the
+        number of segments.
+        """
+
+        index, _ = self.load_index()
+
+        if not df.empty:
+            start_time = df[self.time_column].min()
+            end_time = df[self.time_column].max()
+
+            for segment in index['segments']:
+                if pd.Timestamp(segment['end']) < start_time or pd.Timestamp(
+                        segment['start']) > end_time:
+                    continue
+
+                saved_times = self.read_segment(
+                    segment['file_name'])[self.time_column]
+                df = df[~df[self.time_column].isin(saved_times)]
+
+        if df.empty:
+            return 0, len(index['segments'])
+
+        df = df.sort_values(by=self.time_column,
+                            ascending=True).reset_index(drop=True)
+        file_name = get_segment_file_name(index['next_seq'])
+
+        write_file_atomically(os.path.join(self.dir_path, file_name),
+                              lambda f: pickle.dump(df, f))
+
+        index['segments'].append(self.get_segment_entry(file_name, df))
+        index['next_seq'] += 1
+        self.save_index(index)
+
+        return len(df), len(index['segments'])
+
+    def compact(self):
+        """
+        Merge all segments into one. The merged segment and the index listing
+        it are written before the old segments are deleted.
+        """
+
+        with self.lock:
+            store_lock = self.lock_store()
+
+            try:
+                self.compact_segments()
+            finally:
+                store_lock.close()
+
+    def compact_segments(self):
+        """
+        Merge all segments into one while the store is locked.
+        """
+
+        index, stale_file_names = self.load_index()
+
+        if len(index['segments']) > 1:
+            df = pd.concat([
+                self.read_segment(segment['file_name'])
+                for segment in index['segments']
+            ],
+                           axis=0,
+                           ignore_index=True)
+            df = df.drop_duplicates(subset=self.time_column).sort_values(
+                by=self.time_column, ascending=True).reset_index(drop=True)
+
+            file_name = get_segment_file_name(index['next_seq'])
+            write_file_atomically(os.path.join(self.dir_path, file_name),
+                                  lambda f: pickle.dump(df, f))
+
+            stale_file_names += [
+                segment['file_name'] for segment in index['segments']
+            ]
+            index = {
+                'next_seq': index['next_seq'] + 1,
+                'segments': [self.get_segment_entry(file_name, df)],
+            }
+            self.save_index(index)
+
+        elif stale_file_names:
+            self.save_index(index)
+
+        for file in stale_file_names:
+            try:
+                os.remove(os.path.join(self.dir_path, file))
+            except OSError:
+                pass
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from resampler import resample_candlesticks
+
+HOUR_SECONDS = 3600
+
+
+def get_hourly_df(start, rows, **columns):
+    """
+    Get an hourly candlestick dataframe with the given column values, and
+    default values for the other columns.
+    """
+
+    values = {
+        'Open': np.arange(rows, dtype=np.float64) + 1,
+        'High': np.arange(rows, dtype=np.float64) + 10,
+        'Low': np.arange(rows, dtype=np.float64),
+        'Close': np.arange(rows, dtype=np.float64) + 2,
+        'Volume in USDT': np.ones(rows),
+    }
+    values.update({
+        column: np.asarray(value, dtype=np.float64)
+        for column, value in columns.items()
+    })
+
+    return pd.DataFrame({
+        'Open Time':
+        pd.date_range(start, periods=rows, freq='h'),
+        **values
+    })
+
+
+def test_open_and_close_skip_nan_values():
+    df = get_hourly_df('2024-01-01',
+                       4,
+                       Open=[np.nan, 5, 6, 7],
+                       Close=[1, 2, 3, np.nan])
+
+    resampled_df = resample_candlesticks(df, 4 * HOUR_SECONDS, HOUR_SECONDS)
+
+    assert len(resampled_df) == 1
+    assert resampled_df['Open'][0] == 5
+    assert resampled_df['Close'][0] == 3
+
+
+def test_incomplete_last_bucket_is_dropped():
+    df = get_hourly_df('2024-01-01', 6)
+
+    resampled_df = resample_candlesticks(df, 4 * HOUR_SECONDS, HOUR_SECONDS)
+
+    assert list(resampled_df['Open Time']) == [pd.Timestamp('2024-01-01')]
+    assert resampled_df['Close'][0] == 5
+    assert resampled_df['Volume in USDT'][0] == 4
+
+
+def test_incomplete_first_bucket_is_dropped():
+    df = get_hourly_df('2024-01-01 02:00', 6)
+
+    resampled_df = resample_candlesticks(df, 4 * HOUR_SECONDS, HOUR_SECONDS)
+
+    assert list(
+        resampled_df['Open Time']) == [pd.Timestamp('2024-01-01 04:00')]
+    assert resampled_df['Open'][0] == 3
+
+
+def test_bucket_with_a_gap_is_dropped():
+    df = get_hourly_df('2024-01-01', 8).drop(index=4).reset_index(drop=True)
+
+    resampled_df = resample_candlesticks(df, 4 * HOUR_SECONDS, HOUR_SECONDS)
+
+    assert list(resampled_df['Open Time']) == [pd.Timestamp('2024-01-01')]
+
+
+def test_all_nan_bucket_gives_nan_values():
+    nan_values = [np.nan] * 4
+    df = get_hourly_df('2024-01-01',
+                       4,
+                       Open=nan_values,
+                       High=nan_values,
+                       Low=nan_values,
+                       Close=nan_values,
+                       **{'Volume in USDT': nan_values})
+
+    resampled_df = resample_candlesticks(df, 4 * HOUR_SECONDS, HOUR_SECONDS)
+
+    assert len(resampled_df) == 1
+    assert resampled_df.drop(columns='Open Time').isna().all(axis=None)
+
+
+def test_complete_buckets_match_pandas_resample():
+    df = get_hourly_df('2024-01-01', 24 * 7)
+
+    resampled_df = resample_candlesticks(df, 24 * HOUR_SECONDS, HOUR_SECONDS)
+    expected_df = df.resample('1D', on='Open Time').agg({
+        'Open':
+        'first',
+        'High':
+        'max',
+        'Low':
+        'min',
+        'Close':
+        'last',
+        'Volume in USDT':
+        'sum',
+    }).reset_index()
+
+    pd.testing.assert_frame_equal(resampled_df, expected_df, check_dtype=False)
+
+
+def test_month_buckets_need_every_base_candlestick():
+    df = get_hourly_df('2024-02-01', 24 * 29 + 24 * 31 - 1)
+
+    resampled_df = resample_candlesticks(df, 2592000, HOUR_SECONDS)
+
+    assert list(resampled_df['Open Time']) == [pd.Timestamp('2024-02-01')]
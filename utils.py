@@ -1,134 +1,26 @@
 import time
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from cex_api.adapters import get_adapter
 
 
 def get_interval_seconds(cex, interval):
 
-    if cex == 'binance':
-        if interval not in [
-                '1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h',
-                '12h', '1d', '3d', '1w', '1M'
-        ]:
-            print(
-                '\nThe interval is invalid. Available options: 1m, 3m, 5m, 15m, 30m, 1h, 2h, 4h, 6h, 8h, 12h, 1d, 3d, 1w, 1M.\n'
-            )
-            interval_seconds = 0
-        elif interval == '1m':
-            interval_seconds = 60
-        elif interval == '3m':
-            interval_seconds = 180
-        elif interval == '5m':
-            interval_seconds = 300
-        elif interval == '15m':
-            interval_seconds = 900
-        elif interval == '30m':
-            interval_seconds = 1800
-        elif interval == '1h':
-            interval_seconds = 3600
-        elif interval == '2h':
-            interval_seconds = 7200
-        elif interval == '4h':
-            interval_seconds = 14400
-        elif interval == '6h':
-            interval_seconds = 21600
-        elif interval == '8h':
-            interval_seconds = 28800
-        elif interval == '12h':
-            interval_seconds = 43200
-        elif interval == '1d':
-            interval_seconds = 86400
-        elif interval == '3d':
-            interval_seconds = 259200
-        elif interval == '1w':
-            interval_seconds = 604800
-        else:
-            interval_seconds = 2592000
-
-    elif cex == 'okx':
-        if interval not in [
-                '1s', '1m', '3m', '5m', '15m', '30m', '1H', '2H', '4H', '6H',
-                '12H', '1D', '2D', '3D', '1W', '1M', '3M'
-        ]:
-            print(
-                '\nThe interval is invalid. Availble options: 1s, 1m, 3m, 5m, 15m, 30m, 1H, 2H, 4H, 6H, 12H, 1D, 2D, 3D, 1W, 1M, 3M.\n'
-            )
-            interval_seconds = 0
-        elif interval == '1s':
-            interval_seconds = 1
-        elif interval == '1m':
-            interval_seconds = 60
-        elif interval == '3m':
-            interval_seconds = 180
-        elif interval == '5m':
-            interval_seconds = 300
-        elif interval == '15m':
-            interval_seconds = 900
-        elif interval == '30m':
-            interval_seconds = 1800
-        elif interval == '1H':
-            interval_seconds = 3600
-        elif interval == '2H':
-            interval_seconds = 7200
-        elif interval == '4H':
-            interval_seconds = 14400
-        elif interval == '6H':
-            interval_seconds = 21600
-        elif interval == '12H':
-            interval_seconds = 43200
-        elif interval == '1D':
-            interval_seconds = 86400
-        elif interval == '2D':
-            interval_seconds = 172800
-        elif interval == '3D':
-            interval_seconds = 259200
-        elif interval == '1W':
-            interval_seconds = 604800
-        elif interval == '1M':
-            interval_seconds = 2592000
-        else:
-            interval_seconds = 7776000
-
-    elif cex == 'bybit':
-        if interval not in [
-                '1', '3', '5', '15', '30', '60', '120', '240', '360', '720',
-                'D', 'M', 'W'
-        ]:
-            print(
-                '\nThe interval is invalid. Availble options: 1, 3, 5, 15, 30, 60, 120, 240, 360, 720, D, M, W.\n'
-            )
-            interval_seconds = 0
-        elif interval == '1':
-            interval_seconds = 60
-        elif interval == '3':
-            interval_seconds = 180
-        elif interval == '5':
-            interval_seconds = 300
-        elif interval == '15':
-            interval_seconds = 900
-        elif interval == '30':
-            interval_seconds = 1800
-        elif interval == '60':
-            interval_seconds = 3600
-        elif interval == '120':
-            interval_seconds = 7200
-        elif interval == '240':
-            interval_seconds = 14400
-        elif interval == '360':
-            interval_seconds = 21600
-        elif interval == '720':
-            interval_seconds = 43200
-        elif interval == 'D':
-            interval_seconds = 86400
-        elif interval == 'M':
-            interval_seconds = 2592000
-        else:
-            interval_seconds = 604800
+    adapter = get_adapter(cex)
 
-    else:
+    if adapter is None:
         print('\nInvalid CEX.\n')
         interval_seconds = 0
 
+    elif interval not in adapter.intervals:
+        print('\nThe interval is invalid. Available options: {}.\n'.format(
+            ', '.join(adapter.intervals)))
+        interval_seconds = 0
+
+    else:
+        interval_seconds = adapter.get_interval_seconds(interval)
+
     return interval_seconds
 
 
@@ -140,6 +32,34 @@ def calculate_start_ts(end_time_ms, interval_seconds, limit):
     return start_time_ms
 
 
+def get_candlestick_count(start_time_ms, end_time_ms, interval_seconds):
+    interval_ms = interval_seconds * 1000
+    candlestick_count = -(-(end_time_ms - start_time_ms) // interval_ms)
+
+    return max(int(candlestick_count), 0)
+
+
+def get_page_windows(end_time_ms, interval_seconds, limit, page_limit):
+    """
+    Split the [end - interval x limit, end] range into page requests.
+    Returns a list of (page end time in ms, page limit) tuples, latest first.
+    """
+
+    page_windows = []
+    page_end_time_ms = end_time_ms
+    remaining = limit
+
+    while remaining > 0:
+        current_page_limit = min(page_limit, remaining)
+        page_windows.append((page_end_time_ms, current_page_limit))
+        page_end_time_ms = calculate_start_ts(page_end_time_ms,
+                                              interval_seconds,
+                                              current_page_limit)
+        remaining -= current_page_limit
+
+    return page_windows
+
+
 def convert_timestamp_to_date(timestamp_ms):
     datetime_obj = pd.to_datetime(timestamp_ms, unit='ms')
     formatted_datetime = datetime_obj.strftime('%Y-%m-%d')
@@ -163,24 +83,64 @@ def calculate_profit(signals, prices):
     Returns:
     - cum_profit (pandas.Series): A Series containing cumulative profit over time.
     """
-    profit = pd.Series(index=prices.index)
-    profit.fillna(0, inplace=True)
-
-    buys = signals[signals['orders'] == 1].index
-    sells = signals[signals['orders'] == -1].index
-    skip = 0
-    for bi in buys:
-        if skip > 0:
-            skip -= 1
-            continue
-        sis = sells[sells > bi]
-        if len(sis) > 0:
-            si = sis[0]
-            profit[si] = prices[si] - prices[bi]
-            skip = len(buys[(buys > bi) & (buys < si)])
-        else:
-            profit[-1] = prices[-1] - prices[bi]
-    cum_profit = profit.cumsum()
+    orders = signals['orders'].reindex(prices.index)
+    cum_profit = calculate_profits(orders.to_frame(), prices.to_frame())
+
+    return cum_profit.iloc[:, 0].rename(None)
+
+
+def calculate_profits(orders, prices):
+    """
+    Calculate the cumulative profit of several series of trading signals at
+    once, e.g. one per pair. A trade is opened at a buy signal when no trade
+    is open and closed at the next sell signal, or at the last price if there
+    is none.
+    Parameters:
+    - orders (pandas.DataFrame): A DataFrame of trading signals (1 for buy, -1 for sell) with a column per series.
+    - prices (pandas.DataFrame): A DataFrame of prices with the same index and columns as orders.
+    Returns:
+    - cum_profit (pandas.DataFrame): A DataFrame containing the cumulative profit of each series over time.
+    """
+    order_values = np.asarray(orders, dtype=np.float64)
+    price_values = np.asarray(prices, dtype=np.float64)
+    rows = order_values.shape[0]
+
+    # Signals are numbered series by series, so the signals of a series are
+    # contiguous and sorted by time
+    buys = np.flatnonzero(order_values.T == 1)
+    sells = np.flatnonzero(order_values.T == -1)
+    flat_prices = price_values.T.ravel()
+    profit = np.zeros(order_values.size)
+
+    # A buy opens a trade if it is the first buy of its series or a sell lies
+    # between it and the previous buy
+    sells_before = np.searchsorted(sells, buys)
+    is_entry = np.ones(len(buys), dtype=bool)
+    is_entry[1:] = (buys[1:] // rows != buys[:-1] //
+                    rows) | (sells_before[1:] > sells_before[:-1])
+    entries = buys[is_entry]
+
+    # Each trade is closed at the first sell after it in the same series
+    exit_index = np.minimum(sells_before[is_entry], max(len(sells) - 1, 0))
+    has_exit = np.zeros(len(entries), dtype=bool)
+
+    if len(sells) > 0:
+        exits = sells[exit_index]
+        has_exit = (exits > entries) & (exits // rows == entries // rows)
+        profit[exits[has_exit]] = flat_prices[exits[has_exit]] - flat_prices[
+            entries[has_exit]]
+
+    # A trade still open at the end is valued at the last price, from the
+    # last buy of its series
+    open_series = entries[~has_exit] // rows
+    last_rows = (open_series + 1) * rows - 1
+    last_buys = buys[np.searchsorted(buys, last_rows, side='right') - 1]
+    profit[last_rows] = flat_prices[last_rows] - flat_prices[last_buys]
+
+    cum_profit = pd.DataFrame(profit.reshape(order_values.shape[1], rows).T,
+                              index=getattr(prices, 'index', None),
+                              columns=getattr(prices, 'columns',
+                                              None)).cumsum()
 
     return cum_profit
 